@@ -0,0 +1,98 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: bench_codec.py
+DESCRIPCIÓN: Micro-benchmark del transporte de bloques. Compara el formato
+             heredado (PNG + base64 + JSON) con el formato binario de
+             block_codec.py en cada códec disponible (incluida la elección
+             por bloque "auto", sin pérdida y con una política jpeg:85),
+             midiendo bytes en el cable y tiempos de codificación/
+             decodificación de un viaje completo: máster -> worker -> máster.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, opencv-python, lz4 (opcional), zstandard (opcional)
+CONTEXTO:
+    - Proyecto DisPix.
+    - Uso: python benchmarks/bench_codec.py --block-px 128 --reps 200
+------------------------------------------------------------------------------
+"""
+
+import sys
+import json
+import time
+import base64
+import argparse
+
+import cv2
+import numpy as np
+
+from comun import MASTER_DIR
+
+sys.path.insert(0, MASTER_DIR)
+from utils.block_codec import codificar_bloque, decodificar_bloque, codecs_disponibles  # noqa: E402
+
+META = {"task_id": "00000000-0000-0000-0000-000000000000", "block_id": "12_34", "filter": "sepia"}
+
+
+def codificar_legado(img):
+    _, buffer = cv2.imencode(".png", img)
+    return json.dumps({**META, "block_data": base64.b64encode(buffer).decode("utf-8")}).encode()
+
+
+def decodificar_legado(msg):
+    data = json.loads(msg)
+    img_bytes = base64.b64decode(data["block_data"])
+    return cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def generar_bloques(lado, n):
+    """Bloques de prueba: ruido, 'foto' suave (gradiente + ruido leve) y plano."""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:lado, 0:lado]
+    suave = np.stack([(xx * 255 // lado), (yy * 255 // lado), ((xx + yy) * 127 // lado)], axis=-1)
+    return {
+        "ruido": [rng.integers(0, 256, (lado, lado, 3), dtype=np.uint8) for _ in range(n)],
+        "foto": [np.clip(suave + rng.normal(0, 4, suave.shape), 0, 255).astype(np.uint8) for _ in range(n)],
+        "plano": [np.full((lado, lado, 3), 200, dtype=np.uint8) for _ in range(n)],
+    }
+
+
+def medir(bloques, codificar, decodificar):
+    """Devuelve (bytes promedio por mensaje, µs codificar, µs decodificar)."""
+    t0 = time.perf_counter()
+    mensajes = [codificar(b) for b in bloques]
+    t1 = time.perf_counter()
+    for m in mensajes:
+        decodificar(m)
+    t2 = time.perf_counter()
+    n = len(bloques)
+    return sum(len(m) for m in mensajes) / n, (t1 - t0) / n * 1e6, (t2 - t1) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark del formato de transporte de bloques")
+    parser.add_argument("--block-px", type=int, default=128)
+    parser.add_argument("--reps", type=int, default=200)
+    args = parser.parse_args()
+
+    formatos = {"json (heredado)": (codificar_legado, decodificar_legado)}
+    for codec in codecs_disponibles():
+        formatos[codec] = (lambda img, c=codec: codificar_bloque(img, META, c),
+                           lambda m: decodificar_bloque(m)[0])
+    formatos["auto jpeg:85"] = (lambda img: codificar_bloque(img, META, "auto", "jpeg:85"),
+                                lambda m: decodificar_bloque(m)[0])
+
+    crudo = args.block_px * args.block_px * 3
+    print(f"Bloque {args.block_px}x{args.block_px}x3 = {crudo} bytes de píxeles; "
+          "tiempos por mensaje, un tramo (x2 para ida y vuelta)\n")
+    print(f"{'contenido':<10}{'formato':<18}{'bytes':>10}{'x crudo':>9}{'cod. µs':>10}{'dec. µs':>10}")
+
+    for contenido, bloques in generar_bloques(args.block_px, args.reps).items():
+        for nombre, (cod, dec) in formatos.items():
+            tam, t_cod, t_dec = medir(bloques, cod, dec)
+            print(f"{contenido:<10}{nombre:<18}{tam:>10.0f}{tam / crudo:>9.2f}{t_cod:>10.1f}{t_dec:>10.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: bench_dispatch.py
+DESCRIPCIÓN: Benchmark de escalamiento del despacho de bloques. Publica un
+             lote de bloques y mide el tiempo que tardan 1..N procesos worker
+             locales en entregarlos todos a un receptor /result simulado.
+             Compara el modo "pubsub" (cada worker procesa todos los bloques)
+             con el modo "queue" (cada bloque lo procesa un solo worker) e
+             informa bloques/s, aceleración y resultados duplicados.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: redis, numpy, opencv-python, fakeredis (opcional)
+CONTEXTO:
+    - Proyecto DisPix.
+    - Uso: python benchmarks/bench_dispatch.py --blocks 400 --max-workers 8
+           (añadir --fake-redis si no hay un redis-server disponible)
+------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import redis
+
+from comun import (MASTER_DIR, iniciar_redis, ReceptorResultados,
+                   lanzar_workers, detener_procesos)
+
+
+def esperar_workers_listos(r, modo, n, rp, timeout=30):
+    """Espera a que los `n` workers estén suscritos / registrados en el grupo."""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        if modo == "pubsub":
+            listos = dict(r.pubsub_numsub(rp.CANAL_TAREAS)).get(rp.CANAL_TAREAS.encode(), 0)
+        else:
+            try:
+                listos = len(r.xinfo_consumers(rp.STREAM_TAREAS, rp.GRUPO_WORKERS))
+            except redis.exceptions.ResponseError:
+                listos = 0
+        if listos >= n:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def ejecutar(modo, n_workers, bloques, filtro, receptor, rp, log_dir, timeout):
+    r = rp.r
+    r.delete(rp.STREAM_TAREAS)
+    rp.asegurar_grupo()
+    receptor.reiniciar()
+
+    workers = lanzar_workers(n_workers, [
+        "--dispatch", modo,
+        "--redis-host", rp.REDIS_HOST, "--redis-port", str(rp.REDIS_PORT),
+        "--master-url", receptor.url,
+        # Un proceso de filtrado por worker: se mide el escalamiento en workers
+        "--concurrency", "1",
+    ], log_dir)
+
+    try:
+        if not esperar_workers_listos(r, modo, n_workers, rp):
+            raise RuntimeError("Los workers no se conectaron a tiempo")
+
+        inicio = time.perf_counter()
+        for idx, bloque in enumerate(bloques):
+            rp.publish_block("bench", f"{idx}_0", filtro, bloque, modo=modo)
+        completo = receptor.esperar_unicos(len(bloques), timeout)
+        duracion = time.perf_counter() - inicio
+
+        # En pub/sub los duplicados siguen llegando después del último único
+        if modo == "pubsub":
+            receptor.esperar_unicos(len(bloques), 0)
+            time.sleep(0.5)
+    finally:
+        detener_procesos(workers)
+
+    entregas = sum(receptor.conteo.values())
+    return {
+        "completo": completo,
+        "segundos": duracion,
+        "bloques_s": len(receptor.conteo) / duracion if duracion else 0.0,
+        "duplicados": entregas - len(receptor.conteo),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escalamiento del despacho DisPix")
+    parser.add_argument("--blocks", type=int, default=400, help="Bloques publicados por corrida")
+    parser.add_argument("--block-px", type=int, default=128, help="Lado de cada bloque en píxeles")
+    parser.add_argument("--filter", default="sepia")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--modes", default="pubsub,queue", help="Modos a comparar, separados por coma")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--fake-redis", action="store_true", help="Usar fakeredis en lugar de Redis real")
+    args = parser.parse_args()
+
+    host, port, detener_redis = iniciar_redis(args.redis_host, args.redis_port, args.fake_redis)
+    os.environ["DISPIX_REDIS_HOST"], os.environ["DISPIX_REDIS_PORT"] = host, str(port)
+    sys.path.insert(0, MASTER_DIR)
+    from utils import redis_publisher as rp
+
+    rng = np.random.default_rng(0)
+    bloques = [rng.integers(0, 256, (args.block_px, args.block_px, 3), dtype=np.uint8)
+               for _ in range(args.blocks)]
+
+    receptor = ReceptorResultados()
+    log_dir = tempfile.mkdtemp(prefix="dispix_bench_")
+
+    print(f"{'modo':<8}{'workers':>8}{'seg':>9}{'bloques/s':>12}{'acel.':>8}{'duplicados':>12}")
+    try:
+        for modo in args.modes.split(","):
+            base = None
+            n = 1
+            while n <= args.max_workers:
+                res = ejecutar(modo, n, bloques, args.filter, receptor, rp, log_dir, args.timeout)
+                base = base or res["bloques_s"]
+                aceleracion = res["bloques_s"] / base if base else 0.0
+                marca = "" if res["completo"] else "  (incompleto)"
+                print(f"{modo:<8}{n:>8}{res['segundos']:>9.2f}{res['bloques_s']:>12.1f}"
+                      f"{aceleracion:>8.2f}{res['duplicados']:>12}{marca}")
+                n *= 2
+    finally:
+        receptor.cerrar()
+        detener_redis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: bench_filters.py
+DESCRIPCIÓN: Micro-benchmark de los filtros del worker. Mide megapíxeles por
+             segundo de cada filtro del registro (workers/utils/image_filters.py)
+             y, cuando existe, de su implementación anterior (cadena if/elif
+             con aritmética en float64), junto con la diferencia máxima entre
+             ambas salidas.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, opencv-python
+CONTEXTO:
+    - Proyecto DisPix.
+    - Uso: python benchmarks/bench_filters.py --block-px 256 --reps 50
+------------------------------------------------------------------------------
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from comun import WORKERS_DIR
+
+sys.path.insert(0, WORKERS_DIR)
+from utils.image_filters import FILTROS  # noqa: E402
+
+PARAMS = {"pixelate": {"cell": 8}, "blur": {"radius": 2}}
+
+
+def sepia_anterior(img, params, origen):
+    """Sepia tal como se calculaba antes del registro (float64 + np.stack)."""
+    img_float = img.astype(np.float64)
+    B, G, R = img_float[:, :, 0], img_float[:, :, 1], img_float[:, :, 2]
+    tr = 0.393 * R + 0.769 * G + 0.189 * B
+    tg = 0.349 * R + 0.686 * G + 0.168 * B
+    tb = 0.272 * R + 0.534 * G + 0.131 * B
+    sepia = np.stack([np.clip(tb, 0, 255), np.clip(tg, 0, 255), np.clip(tr, 0, 255)], axis=-1)
+    return sepia.astype(np.uint8)
+
+
+# Implementaciones anteriores de los filtros que cambiaron; 'blur' no tiene
+# (antes devolvía el bloque sin modificar)
+ANTERIORES = {"sepia": sepia_anterior}
+NUEVOS = {"blur"}
+
+
+def medir(kernel, bloques, params):
+    """Devuelve megapíxeles por segundo del núcleo sobre los bloques."""
+    kernel(bloques[0], params, (0, 0))  # calentamiento
+    t0 = time.perf_counter()
+    for b in bloques:
+        kernel(b, params, (0, 0))
+    segundos = time.perf_counter() - t0
+    return sum(b.shape[0] * b.shape[1] for b in bloques) / 1e6 / segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de los filtros del worker")
+    parser.add_argument("--block-px", type=int, default=256)
+    parser.add_argument("--reps", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    bloques = [rng.integers(0, 256, (args.block_px, args.block_px, 3), dtype=np.uint8)
+               for _ in range(args.reps)]
+
+    print(f"Bloques de {args.block_px}x{args.block_px}x3, {args.reps} repeticiones\n")
+    print(f"{'filtro':<10}{'MP/s antes':>12}{'MP/s ahora':>12}{'aceleración':>13}{'dif. máx':>10}")
+
+    for nombre, spec in FILTROS.items():
+        params = PARAMS.get(nombre, {})
+        ahora = medir(spec["kernel"], bloques, params)
+        anterior = ANTERIORES.get(nombre)
+        if anterior is None:
+            etiqueta = "(nuevo)" if nombre in NUEVOS else "(igual)"
+            print(f"{nombre:<10}{etiqueta:>12}{ahora:>12.1f}{'-':>13}{'-':>10}")
+            continue
+        antes = medir(anterior, bloques, params)
+        dif = np.abs(spec["kernel"](bloques[0], params, (0, 0)).astype(np.int16)
+                     - anterior(bloques[0], params, (0, 0))).max()
+        print(f"{nombre:<10}{antes:>12.1f}{ahora:>12.1f}{ahora / antes:>12.1f}x{dif:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: bench_pipeline.py
+DESCRIPCIÓN: Benchmark de extremo a extremo del sistema DisPix. Levanta un
+             Redis (real o simulado), el máster real y N workers, y envía
+             tareas a /process con distintos tamaños de imagen, filtros,
+             grillas y niveles de concurrencia. Cada tarea se sigue por
+             /events hasta que su imagen está en disco.
+             Informa, por combinación: latencia de las tareas (p50/p95/p99),
+             bloques/s, tiempo por etapa (subida, preparación, procesamiento
+             de bloques, guardado) y, con --wire-bytes, los bytes que pasaron
+             por Redis y por HTTP. Los resultados se guardan en JSON y se
+             pueden comparar con una corrida anterior (--baseline) para
+             detectar regresiones.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, opencv-python, requests, redis, fakeredis (opcional),
+              gunicorn (opcional, --master-processes > 1)
+CONTEXTO:
+    - Proyecto DisPix.
+    - Uso: python benchmarks/bench_pipeline.py --fake-redis --sizes 512x512,1024x1024
+           --filters negative,blur --grids 4,auto --concurrency 1,4 --tasks 8
+------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import requests
+
+from comun import (RAIZ, iniciar_redis, lanzar_master, lanzar_workers, detener_procesos,
+                   RelevoContador)
+
+# Etapas medidas desde el cliente, en orden
+ETAPAS = ("upload", "prepare", "process", "save")
+
+
+def imagen_prueba(alto, ancho, semilla=0):
+    """Imagen PNG de prueba (degradado con ruido, comprime como una foto)."""
+    rng = np.random.default_rng(semilla)
+    yy, xx = np.mgrid[0:alto, 0:ancho]
+    base = np.stack([xx * 255 // max(ancho - 1, 1), yy * 255 // max(alto - 1, 1),
+                     (xx + yy) * 255 // max(alto + ancho - 2, 1)], axis=-1)
+    ruido = rng.integers(-12, 13, (alto, ancho, 3))
+    img = np.clip(base + ruido, 0, 255).astype(np.uint8)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def percentiles(valores):
+    """Resumen de una lista de duraciones (segundos)."""
+    if not valores:
+        return None
+    v = np.asarray(valores)
+    return {"p50": float(np.percentile(v, 50)), "p95": float(np.percentile(v, 95)),
+            "p99": float(np.percentile(v, 99)), "mean": float(v.mean()), "max": float(v.max())}
+
+
+def seguir_tarea(url, task_id, timeout):
+    """
+    Sigue una tarea por /events y devuelve el instante (time.perf_counter) de
+    cada hito: plan elegido, todos los bloques recibidos y fin; además del
+    estado final.
+    """
+    hitos = {}
+    final = None
+    with requests.get(f"{url}/events", params={"task_id": task_id},
+                      stream=True, timeout=timeout) as respuesta:
+        evento = None
+        for linea in respuesta.iter_lines(decode_unicode=True):
+            if linea.startswith("event:"):
+                evento = linea[6:].strip()
+            elif linea.startswith("data:"):
+                ahora = time.perf_counter()
+                datos = json.loads(linea[5:])
+                if datos.get("plan") and datos.get("state") != "queued":
+                    hitos.setdefault("plan", ahora)
+                if datos.get("total") and datos.get("received") == datos.get("total"):
+                    hitos.setdefault("received", ahora)
+                if evento in ("done", "error"):
+                    hitos["done"] = ahora
+                    final = datos
+                    break
+    return hitos, final
+
+
+def ejecutar_tarea(url, png, campos, timeout):
+    """Envía una tarea a /process (cuerpo crudo) y espera a que termine."""
+    inicio = time.perf_counter()
+    respuesta = requests.post(f"{url}/process", params=campos, data=png,
+                              headers={"Content-Type": "image/png"}, timeout=timeout)
+    subida = time.perf_counter()
+    if respuesta.status_code != 202:
+        return {"ok": False, "error": respuesta.text[:200]}
+    task_id = respuesta.json()["task_id"]
+
+    hitos, final = seguir_tarea(url, task_id, timeout)
+    if not final or final.get("error"):
+        return {"ok": False, "error": (final or {}).get("message") or "sin respuesta"}
+
+    # Los hitos tienen la resolución de los eventos de /events (~0.1 s): si
+    # alguno llegó agrupado con el siguiente, su etapa mide 0
+    plan = hitos.get("plan", subida)
+    recibido = hitos.get("received", hitos["done"])
+    return {
+        "ok": True,
+        "latency": hitos["done"] - inicio,
+        "blocks": final.get("total") or 0,
+        "cached": final.get("cached", False),
+        "stages": {"upload": subida - inicio, "prepare": plan - subida,
+                   "process": recibido - plan, "save": hitos["done"] - recibido},
+    }
+
+
+def medir(url, png, campos, tareas, concurrencia, timeout, relevos):
+    """Ejecuta `tareas` tareas con `concurrencia` clientes y resume la corrida."""
+    for relevo in relevos.values():
+        relevo.reiniciar()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concurrencia) as pool:
+        resultados = list(pool.map(lambda _: ejecutar_tarea(url, png, campos, timeout), range(tareas)))
+    duracion = time.perf_counter() - inicio
+
+    ok = [r for r in resultados if r["ok"]]
+    bloques = sum(r["blocks"] for r in ok)
+    resumen = {
+        "tasks": tareas,
+        "completed": len(ok),
+        "errors": [r["error"] for r in resultados if not r["ok"]],
+        "wall_s": duracion,
+        "tasks_per_s": len(ok) / duracion,
+        "blocks": bloques,
+        "blocks_per_s": bloques / duracion,
+        "latency_s": percentiles([r["latency"] for r in ok]),
+        "stages_s": {e: percentiles([r["stages"][e] for r in ok]) for e in ETAPAS},
+        "bytes": {"upload": len(png) * tareas},
+    }
+    if relevos:
+        resumen["bytes"].update({
+            "redis_sent": relevos["redis"].enviados, "redis_received": relevos["redis"].recibidos,
+            "http_results": relevos["http"].enviados,
+        })
+    return resumen
+
+
+def comparar(resultados, baseline, tolerancia):
+    """
+    Compara con una corrida anterior (misma combinación) e imprime las
+    variaciones. Devuelve las regresiones que superan la tolerancia.
+    """
+    anteriores = {json.dumps(r["config"], sort_keys=True): r for r in baseline["results"]}
+    regresiones = []
+    print(f"\nComparación con la corrida anterior (tolerancia {tolerancia:.0%}):")
+    for r in resultados:
+        previo = anteriores.get(json.dumps(r["config"], sort_keys=True))
+        if previo is None or not r["latency_s"] or not previo["latency_s"]:
+            continue
+        cambios = {
+            "p50": r["latency_s"]["p50"] / previo["latency_s"]["p50"] - 1,
+            "p95": r["latency_s"]["p95"] / previo["latency_s"]["p95"] - 1,
+            # Para el rendimiento, una caída es la regresión
+            "blocks/s": 1 - r["blocks_per_s"] / previo["blocks_per_s"] if previo["blocks_per_s"] else 0,
+        }
+        peores = {k: v for k, v in cambios.items() if v > tolerancia}
+        marca = "  ❌ REGRESIÓN" if peores else ""
+        print(f"  {etiqueta(r['config'])}: p50 {cambios['p50']:+.1%}, p95 {cambios['p95']:+.1%}, "
+              f"bloques/s {-cambios['blocks/s']:+.1%}{marca}")
+        if peores:
+            regresiones.append({"config": r["config"], "changes": peores})
+    return regresiones
+
+
+def etiqueta(config):
+    return (f"{config['size']} {config['filter']:<9} grilla {config['grid']:<5} "
+            f"c={config['concurrency']}")
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo (máster + workers)")
+    parser.add_argument("--sizes", default="512x512,1024x1024", help="Tamaños ALTOxANCHO, separados por coma")
+    parser.add_argument("--filters", default="negative,blur", help="Filtros, separados por coma")
+    parser.add_argument("--grids", default="4,auto", help="Grillas (N para NxN, o auto), separadas por coma")
+    parser.add_argument("--concurrency", default="1,4", help="Clientes simultáneos, separados por coma")
+    parser.add_argument("--tasks", type=int, default=8, help="Tareas por combinación")
+    parser.add_argument("--warmup", type=int, default=1, help="Tareas de calentamiento por combinación")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-concurrency", type=int, default=1, help="--concurrency de cada worker")
+    parser.add_argument("--master-processes", type=int, default=1, help="> 1 usa gunicorn")
+    parser.add_argument("--dispatch", default="queue", choices=("pubsub", "queue"))
+    parser.add_argument("--codec", default="", help="Códec de los bloques (vacío = el del máster)")
+    parser.add_argument("--transport", default="redis", choices=("redis", "shm"))
+    parser.add_argument("--cache", action="store_true",
+                        help="Dejar activa la caché de resultados (por defecto se desactiva: "
+                             "todas las tareas usan la misma imagen)")
+    parser.add_argument("--wire-bytes", action="store_true",
+                        help="Contar bytes de Redis y HTTP con un relevo TCP (añade latencia)")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--fake-redis", action="store_true", help="Usar fakeredis en lugar de Redis real")
+    parser.add_argument("--output", default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Variación relativa que se considera regresión (con --baseline)")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="dispix_bench_pipeline_")
+    redis_host, redis_port, detener_redis = iniciar_redis(args.redis_host, args.redis_port,
+                                                          fake=args.fake_redis)
+
+    # Con --wire-bytes, máster y workers hablan con Redis (y los workers con
+    # el máster) a través de relevos que cuentan los bytes
+    relevos = {}
+    if args.wire_bytes:
+        relevos["redis"] = RelevoContador(redis_host, redis_port)
+        redis_host, redis_port = "127.0.0.1", relevos["redis"].port
+
+    env_cache = {} if args.cache else {"DISPIX_CACHE_MB": "0"}
+    procesos = []
+    try:
+        master, url = lanzar_master(redis_host, redis_port, directorio, args.master_processes,
+                                    {"DISPIX_DISPATCH_MODE": args.dispatch, **env_cache})
+        procesos.append(master)
+        url_workers = url
+        if args.wire_bytes:
+            puerto_master = int(url.rsplit(":", 1)[1])
+            relevos["http"] = RelevoContador("127.0.0.1", puerto_master)
+            url_workers = f"http://127.0.0.1:{relevos['http'].port}"
+
+        procesos += lanzar_workers(args.workers, [
+            "--dispatch", args.dispatch,
+            "--redis-host", redis_host, "--redis-port", str(redis_port),
+            "--master-url", url_workers + "/result",
+            "--concurrency", str(args.worker_concurrency),
+            *([] if args.cache else ["--cache-mb", "0"]),
+        ], os.path.join(directorio, "workers"))
+        # Dar tiempo a que los workers se suscriban antes de la primera tarea
+        time.sleep(2)
+
+        print(f"Máster {url} ({args.master_processes} proceso(s)), {args.workers} workers, "
+              f"despacho {args.dispatch}, {os.cpu_count()} núcleos\n")
+        print(f"{'combinación':<42}{'p50':>8}{'p95':>8}{'p99':>8}{'bloques/s':>11}"
+              f"{'subida':>8}{'prep':>8}{'bloques':>9}{'guardar':>9}")
+
+        resultados = []
+        for tam in args.sizes.split(","):
+            alto, ancho = (int(x) for x in tam.lower().split("x"))
+            png = imagen_prueba(alto, ancho)
+            for filtro in args.filters.split(","):
+                for grilla in args.grids.split(","):
+                    campos = {"filter": filtro, "block_size": grilla, "transport": args.transport}
+                    if args.codec:
+                        campos["codec"] = args.codec
+                    for _ in range(args.warmup):
+                        ejecutar_tarea(url, png, campos, args.timeout)
+                    for c in (int(x) for x in args.concurrency.split(",")):
+                        config = {"size": tam, "filter": filtro, "grid": grilla, "concurrency": c,
+                                  "codec": args.codec or None, "transport": args.transport}
+                        r = {"config": config, **medir(url, png, campos, args.tasks, c,
+                                                       args.timeout, relevos)}
+                        resultados.append(r)
+
+                        lat, etapas = r["latency_s"], r["stages_s"]
+                        if lat is None:
+                            print(f"{etiqueta(config):<42}  sin tareas completas: {r['errors'][:1]}")
+                            continue
+                        print(f"{etiqueta(config):<42}{lat['p50']:>8.2f}{lat['p95']:>8.2f}"
+                              f"{lat['p99']:>8.2f}{r['blocks_per_s']:>11.1f}"
+                              + "".join(f"{etapas[e]['p50']:>{w}.2f}"
+                                        for e, w in zip(ETAPAS, (8, 8, 9, 9))))
+    finally:
+        detener_procesos(procesos)
+        for relevo in relevos.values():
+            relevo.cerrar()
+        detener_redis()
+
+    salida = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit_actual(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "results": resultados,
+    }
+    ruta = args.output or os.path.join(directorio, "bench_pipeline.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(salida, f, indent=2)
+    print(f"\nResultados guardados en {ruta}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerance)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: bench_worker_pool.py
+DESCRIPCIÓN: Benchmark de rendimiento de un worker en bloques/s. Compara el
+             bucle secuencial original (decodificar, filtrar, codificar y
+             un POST síncrono sin keep-alive por bloque) con el supervisor
+             de workers/utils/pipeline.py y la subida por lotes de
+             workers/utils/result_uploader.py para distintos valores de
+             --concurrency. También informa cuántos POST llegaron al máster. No necesita Redis: los mensajes se inyectan
+             directamente y los resultados se envían a un receptor /result
+             local.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, opencv-python, requests, redis
+CONTEXTO:
+    - Proyecto DisPix.
+    - Uso: python benchmarks/bench_worker_pool.py --blocks 500 --concurrency 1,2,4,8
+------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import requests
+
+from comun import WORKERS_DIR, ReceptorResultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pool de procesos del worker")
+    parser.add_argument("--blocks", type=int, default=500)
+    parser.add_argument("--block-px", type=int, default=128)
+    parser.add_argument("--filter", default="sepia")
+    parser.add_argument("--codec", default="raw")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="Niveles de concurrencia a medir, separados por coma")
+    parser.add_argument("--upload-threads", type=int, default=2)
+    parser.add_argument("--upload-batch", type=int, default=32)
+    args = parser.parse_args()
+
+    # El worker crea data/logs en el directorio actual: usar uno temporal
+    os.chdir(tempfile.mkdtemp(prefix="dispix_bench_"))
+    sys.path.insert(0, WORKERS_DIR)
+    import subscriber_redis as worker
+    from utils.block_codec import codificar_bloque
+    from utils.pipeline import Supervisor
+    from utils.result_uploader import ResultUploader
+
+    rng = np.random.default_rng(0)
+    mensajes = [
+        codificar_bloque(rng.integers(0, 256, (args.block_px, args.block_px, 3), dtype=np.uint8),
+                         {"task_id": "bench", "block_id": f"{i}_0", "filter": args.filter}, args.codec)
+        for i in range(args.blocks)
+    ]
+
+    receptor = ReceptorResultados()
+
+    # Silenciar los print del worker (los procesos hijos heredan sys.stdout)
+    salida = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    def informar(nombre, duracion):
+        ok = len(receptor.conteo) == args.blocks
+        salida.write(f"{nombre:<16}{duracion:>9.2f}{args.blocks / duracion:>12.1f}{receptor.peticiones:>8}"
+                     f"{'' if ok else '  (incompleto)'}\n")
+        salida.flush()
+
+    salida.write(f"{args.blocks} bloques {args.block_px}x{args.block_px}, filtro {args.filter}, "
+                 f"códec {args.codec}, {os.cpu_count()} núcleos\n\n")
+    salida.write(f"{'modo':<16}{'seg':>9}{'bloques/s':>12}{'POSTs':>8}\n")
+
+    try:
+        # Línea base: bucle secuencial de un solo hilo, un POST por bloque
+        receptor.reiniciar()
+        inicio = time.perf_counter()
+        for m in mensajes:
+            peticion = worker.procesar_bloque(m)
+            peticion.pop("tiempos", None)
+            requests.post(receptor.url, **peticion)
+        informar("secuencial", time.perf_counter() - inicio)
+
+        for n in (int(x) for x in args.concurrency.split(",")):
+            receptor.reiniciar()
+            subidor = ResultUploader(receptor.url, hilos=args.upload_threads,
+                                     max_bloques=args.upload_batch)
+            supervisor = Supervisor(worker.procesar_bloque, subidor, concurrencia=n)
+            # Calentar el pool para no medir el arranque de los procesos
+            supervisor.pool.submit(int).result()
+            inicio = time.perf_counter()
+            supervisor.enviar_lote((m, None) for m in mensajes)
+            supervisor.cerrar()
+            informar(f"pool x{n}", time.perf_counter() - inicio)
+    finally:
+        sys.stdout = salida
+        receptor.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: comun.py
+DESCRIPCIÓN: Utilidades compartidas por los benchmarks de DisPix: arranque de
+             un Redis local (real o simulado con fakeredis), un receptor HTTP
+             que imita el endpoint /result del máster, el lanzamiento de
+             procesos worker y del máster real, y un relevo TCP que cuenta
+             los bytes que pasan por el cable.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: redis, fakeredis (opcional), gunicorn (opcional), http.server, socket,
+              subprocess, threading, urllib
+CONTEXTO:
+    - Proyecto DisPix.
+    - Los scripts de benchmarks/ importan este módulo para no repetir la
+      infraestructura de prueba.
+------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MASTER_DIR = os.path.join(RAIZ, "master")
+WORKERS_DIR = os.path.join(RAIZ, "workers")
+
+
+def puerto_libre():
+    """Devuelve un puerto TCP libre en localhost."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_redis(host=None, port=None, fake=False):
+    """
+    Devuelve (host, port, detener) de un Redis utilizable por los procesos.
+
+    Si fake=True se levanta un servidor fakeredis TCP en un hilo (útil donde
+    no hay redis-server instalado). En otro caso se usa el Redis indicado.
+    """
+    if not fake:
+        return host or "localhost", port or 6379, lambda: None
+
+    from fakeredis import TcpFakeServer
+
+    port = puerto_libre()
+    servidor = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    # Como redis-server: sin Nagle, o cada pipeline espera el ACK retardado (~40 ms)
+    servidor.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    def detener():
+        servidor.shutdown()
+        servidor.server_close()
+
+    return "127.0.0.1", port, detener
+
+
+class ReceptorResultados:
+    """
+    Servidor HTTP mínimo que acepta POST en /result y /results/batch, como el
+    máster, y cuenta cuántas veces llega cada bloque (formato binario, lotes
+    binarios o JSON heredado) y cuántas peticiones HTTP se recibieron.
+    """
+
+    def __init__(self):
+        self.conteo = Counter()
+        self.bytes_recibidos = 0
+        self.peticiones = 0
+        self.cond = threading.Condition()
+        receptor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                receptor.registrar(self.path, self.headers.get("Content-Type", ""), cuerpo)
+                respuesta = b'{"status": "ok"}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(respuesta)))
+                self.end_headers()
+                self.wfile.write(respuesta)
+
+            def log_message(self, *args):
+                pass
+
+        class Servidor(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # Los workers detenidos cortan sus conexiones keep-alive
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        # HTTP/1.1 para admitir conexiones persistentes (keep-alive)
+        Handler.protocol_version = "HTTP/1.1"
+        self.servidor = Servidor(("127.0.0.1", puerto_libre()), Handler)
+        self.url = f"http://127.0.0.1:{self.servidor.server_port}/result"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def registrar(self, path, content_type, cuerpo):
+        if content_type == "application/octet-stream":
+            # block_codec existe idéntico en master/utils y workers/utils; se
+            # usa el que el benchmark haya puesto en sys.path
+            from utils.block_codec import decodificar_bloque, desempaquetar_lote
+            mensajes = desempaquetar_lote(cuerpo) if path.endswith("/batch") else [cuerpo]
+            bloques = [decodificar_bloque(m)[1] for m in mensajes]
+        else:
+            bloques = [json.loads(cuerpo)]
+        with self.cond:
+            for data in bloques:
+                self.conteo[(data["task_id"], data["block_id"])] += 1
+            self.bytes_recibidos += len(cuerpo)
+            self.peticiones += 1
+            self.cond.notify_all()
+
+    def reiniciar(self):
+        with self.cond:
+            self.conteo.clear()
+            self.bytes_recibidos = 0
+            self.peticiones = 0
+
+    def esperar_unicos(self, esperados, timeout):
+        """Espera hasta recibir `esperados` bloques distintos o agotar el tiempo."""
+        limite = time.time() + timeout
+        with self.cond:
+            while len(self.conteo) < esperados:
+                restante = limite - time.time()
+                if restante <= 0:
+                    return False
+                self.cond.wait(restante)
+        return True
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def lanzar_workers(n, args_extra, log_dir):
+    """Lanza `n` procesos worker (subscriber_redis.py) con los argumentos dados."""
+    os.makedirs(log_dir, exist_ok=True)
+    procesos = []
+    for _ in range(n):
+        procesos.append(subprocess.Popen(
+            [sys.executable, os.path.join(WORKERS_DIR, "subscriber_redis.py"), *args_extra],
+            cwd=log_dir,
+            env={**os.environ, "PYTHONPATH": WORKERS_DIR},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ))
+    return procesos
+
+
+def detener_procesos(procesos):
+    for p in procesos:
+        p.terminate()
+    for p in procesos:
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+def lanzar_master(redis_host, redis_port, directorio, procesos=1, env_extra=None):
+    """
+    Lanza el máster real en `directorio` (donde crea data/) y espera a que
+    responda. Con procesos > 1 se ejecuta bajo gunicorn (master/gunicorn.conf.py).
+
+    Returns:
+        (subprocess.Popen, str): Proceso y URL base del máster.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    puerto = puerto_libre()
+    env = {**os.environ, "DISPIX_REDIS_HOST": redis_host, "DISPIX_REDIS_PORT": str(redis_port),
+           "DISPIX_MASTER_PROCESSES": str(procesos), "DISPIX_BIND": f"127.0.0.1:{puerto}",
+           **(env_extra or {})}
+    if procesos > 1:
+        comando = [sys.executable, "-m", "gunicorn", "-c", os.path.join(MASTER_DIR, "gunicorn.conf.py"),
+                   "--pythonpath", MASTER_DIR, "--access-logfile", "/dev/null", "wsgi:app"]
+    else:
+        comando = [sys.executable, "-c",
+                   f"import sys; sys.path.insert(0, {MASTER_DIR!r}); import app; "
+                   f"app.app.run(host='127.0.0.1', port={puerto}, threaded=True)"]
+    proceso = subprocess.Popen(comando, cwd=directorio, env=env,
+                               stdout=open(os.path.join(directorio, "master.log"), "w"),
+                               stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{puerto}"
+    if not esperar_http(url + "/", timeout=30):
+        detener_procesos([proceso])
+        raise RuntimeError(f"El máster no respondió; ver {directorio}/master.log")
+    return proceso, url
+
+
+def esperar_http(url, timeout=30):
+    """Espera a que `url` responda a un GET (cualquier código HTTP)."""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(url, timeout=2).close()
+            return True
+        except urllib.error.HTTPError:
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class RelevoContador:
+    """
+    Relevo TCP local hacia (host, port) que cuenta los bytes en cada sentido.
+    Los procesos se conectan a self.port en lugar del destino real; sirve
+    para medir los bytes de Redis y de HTTP sin instrumentar el código.
+    """
+
+    def __init__(self, host, port):
+        self.destino = (host, port)
+        self.enviados = 0    # cliente -> destino
+        self.recibidos = 0   # destino -> cliente
+        self.lock = threading.Lock()
+        self.servidor = socket.socket()
+        self.servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.servidor.bind(("127.0.0.1", 0))
+        self.servidor.listen(128)
+        self.port = self.servidor.getsockname()[1]
+        threading.Thread(target=self._aceptar, daemon=True).start()
+
+    def _aceptar(self):
+        while True:
+            try:
+                cliente, _ = self.servidor.accept()
+            except OSError:
+                return
+            destino = socket.create_connection(self.destino)
+            for a, b, sentido in ((cliente, destino, "enviados"), (destino, cliente, "recibidos")):
+                threading.Thread(target=self._copiar, args=(a, b, sentido), daemon=True).start()
+
+    def _copiar(self, origen, destino, sentido):
+        try:
+            while True:
+                datos = origen.recv(65536)
+                if not datos:
+                    break
+                destino.sendall(datos)
+                with self.lock:
+                    setattr(self, sentido, getattr(self, sentido) + len(datos))
+        except OSError:
+            pass
+        finally:
+            for s in (origen, destino):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def reiniciar(self):
+        with self.lock:
+            self.enviados = self.recibidos = 0
+
+    def cerrar(self):
+        self.servidor.close()
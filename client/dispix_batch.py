@@ -0,0 +1,248 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: dispix_batch.py
+DESCRIPCIÓN: Cliente de línea de comandos para los trabajos por lotes de
+             DisPix. Toma un directorio (recursivo) o un manifiesto con una
+             ruta de imagen por línea, envía todas las imágenes al máster en
+             un solo trabajo (/jobs, en tandas de --chunk archivos), sigue su
+             progreso por Server-Sent Events y descarga cada resultado al
+             directorio de salida apenas termina, sin esperar al resto.
+             Informa periódicamente el progreso agregado (imágenes, bloques,
+             imágenes/s y megapíxeles/s) y al final guarda un resumen JSON.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: requests
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Uso: python client/dispix_batch.py fotos/ --out procesadas/ --filter sepia
+           python client/dispix_batch.py lista.txt --out procesadas/ \
+               --chain '[{"filter": "sepia"}, {"filter": "pixelate"}]'
+------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Extensiones que se toman al recorrer un directorio
+EXTENSIONES = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp", ".npy")
+
+
+def listar_imagenes(entrada):
+    """
+    Imágenes a procesar como pares (ruta, nombre). El nombre es la ruta
+    relativa al directorio (o al manifiesto) y se conserva en la salida.
+    """
+    if os.path.isdir(entrada):
+        imagenes = []
+        for raiz, carpetas, archivos in os.walk(entrada):
+            carpetas.sort()
+            for archivo in sorted(archivos):
+                if archivo.lower().endswith(EXTENSIONES):
+                    ruta = os.path.join(raiz, archivo)
+                    imagenes.append((ruta, os.path.relpath(ruta, entrada)))
+        return imagenes
+
+    # Manifiesto: una ruta por línea (relativa al manifiesto), '#' comenta
+    base = os.path.dirname(os.path.abspath(entrada))
+    imagenes = []
+    with open(entrada, encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            ruta = os.path.join(base, linea)
+            nombre = os.path.relpath(ruta, base)
+            if nombre.startswith(".."):
+                nombre = os.path.basename(ruta)
+            imagenes.append((ruta, nombre))
+    return imagenes
+
+
+def ruta_salida(salida, nombre, extension=".png"):
+    """
+    Ruta del resultado de una imagen: su nombre relativo, con la extensión
+    del resultado (.png, o .npy para las imágenes grandes).
+    """
+    relativa = os.path.normpath(os.path.splitext(nombre)[0] + extension)
+    if os.path.isabs(relativa) or relativa.startswith(".."):
+        relativa = os.path.basename(relativa)
+    return os.path.join(salida, relativa)
+
+
+def campos_trabajo(args):
+    """Opciones comunes de las tareas, con los mismos campos que /process."""
+    campos = {"filter": args.filter, "block_size": args.block_size, "priority": args.priority}
+    for campo in ("params", "chain", "codec", "quality", "transport", "client"):
+        if getattr(args, campo):
+            campos[campo] = getattr(args, campo)
+    return campos
+
+
+def enviar_tanda(sesion, url, tanda, campos=None):
+    """POST multipart de una tanda de imágenes (campo 'images', repetido)."""
+    abiertos = [open(ruta, "rb") for ruta, _ in tanda]
+    try:
+        archivos = [("images", (nombre.replace(os.sep, "/"), f,
+                                mimetypes.guess_type(nombre)[0] or "application/octet-stream"))
+                    for (_, nombre), f in zip(tanda, abiertos)]
+        respuesta = sesion.post(url, data=campos, files=archivos, timeout=300)
+    finally:
+        for f in abiertos:
+            f.close()
+    if respuesta.status_code != 202:
+        raise RuntimeError(f"{url}: {respuesta.status_code} {respuesta.text[:200]}")
+    return respuesta.json()
+
+
+class Seguimiento:
+    """
+    Sigue un trabajo por /jobs/<id>/events y descarga cada imagen terminada
+    en un pool de hilos. Se reconecta desde la última posición si la
+    conexión se corta.
+    """
+
+    def __init__(self, servidor, job_id, salida, descargas=4, intervalo=2.0):
+        # Sesión propia: la de la subida sigue en uso en el hilo principal
+        self.sesion = requests.Session()
+        self.servidor = servidor.rstrip("/")
+        self.job_id = job_id
+        self.salida = salida
+        self.intervalo = intervalo
+        self.pool = ThreadPoolExecutor(max_workers=descargas)
+        self.descargas = []
+        self.imagenes = []
+        self.resumen = None
+        self.siguiente = 0
+        self.ultimo_informe = 0.0
+        self.hilo = threading.Thread(target=self._seguir, daemon=True)
+
+    def iniciar(self):
+        self.hilo.start()
+
+    def esperar(self, timeout=None):
+        """Espera el fin del trabajo y de todas las descargas."""
+        self.hilo.join(timeout)
+        for descarga in self.descargas:
+            descarga.result()
+        self.pool.shutdown()
+        return self.resumen
+
+    def _seguir(self):
+        url = f"{self.servidor}/jobs/{self.job_id}/events"
+        while self.resumen is None or not self.resumen.get("complete"):
+            try:
+                with self.sesion.get(url, params={"from": self.siguiente}, stream=True, timeout=60) as r:
+                    r.raise_for_status()
+                    for linea in r.iter_lines(decode_unicode=True):
+                        if linea and linea.startswith("data:"):
+                            self._atender(json.loads(linea[len("data:"):]))
+            except (requests.RequestException, ValueError) as e:
+                print(f"⚠️ Conexión de progreso interrumpida ({e}); reintentando...")
+                time.sleep(1)
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                self.resumen = None
+                return
+
+    def _atender(self, evento):
+        if "finished" not in evento:
+            # Trabajo desconocido (p. ej. vencido en el servidor)
+            raise RuntimeError(evento.get("message", "Trabajo no encontrado"))
+        for imagen in evento["finished"]:
+            self.imagenes.append(imagen)
+            if imagen.get("url"):
+                self.descargas.append(self.pool.submit(self._descargar, imagen))
+            else:
+                print(f"❌ {imagen.get('name')}: {imagen.get('message') or imagen.get('state')}")
+        self.siguiente = evento["next"]
+        self.resumen = evento
+        if evento["complete"] or time.time() - self.ultimo_informe >= self.intervalo:
+            self.ultimo_informe = time.time()
+            informar(evento)
+
+    def _descargar(self, imagen):
+        destino = ruta_salida(self.salida, imagen["name"], os.path.splitext(imagen["processed_filename"])[1])
+        os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+        with self.sesion.get(self.servidor + imagen["url"], stream=True, timeout=120) as r:
+            r.raise_for_status()
+            with open(destino + ".tmp", "wb") as f:
+                for trozo in r.iter_content(1024 * 1024):
+                    f.write(trozo)
+        os.replace(destino + ".tmp", destino)
+        imagen["output"] = destino
+
+
+def informar(resumen):
+    """Línea de progreso agregado del trabajo."""
+    print(f"📊 {resumen['done'] + resumen['failed']}/{resumen['expected']} imágenes "
+          f"({resumen['failed']} con error) | bloques {resumen['blocks_received']}/{resumen['blocks_total']} | "
+          f"{resumen['images_per_sec']:.1f} img/s | {resumen['megapixels_per_sec']:.2f} MP/s | "
+          f"{resumen['elapsed']:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesa un directorio o manifiesto de imágenes con DisPix")
+    parser.add_argument("entrada", help="Directorio de imágenes o manifiesto (una ruta por línea)")
+    parser.add_argument("--out", required=True, help="Directorio de salida de las imágenes procesadas")
+    parser.add_argument("--server", default=os.environ.get("DISPIX_SERVER", "http://localhost:5000"))
+    parser.add_argument("--filter", default="negative", help="Filtro o cadena de filtros ('sepia+pixelate')")
+    parser.add_argument("--params", default=None, help="Parámetros del filtro en JSON (lista en una cadena)")
+    parser.add_argument("--chain", default=None, help='Cadena explícita en JSON: [{"filter": ..., "params": ...}]')
+    parser.add_argument("--block-size", default="auto", help="Bloques por lado, o auto")
+    parser.add_argument("--codec", default=None, help="Códec de los bloques (por defecto, el del máster)")
+    parser.add_argument("--quality", default=None,
+                        help="Política de calidad del códec auto: lossless, jpeg:<1-100> o webp:<1-100>")
+    parser.add_argument("--transport", default=None, choices=("redis", "shm"))
+    parser.add_argument("--priority", default="low", choices=("high", "normal", "low"),
+                        help="Prioridad frente a las demás tareas (por defecto, low)")
+    parser.add_argument("--client", default=None, help="Identificador del cliente (tope de bloques en vuelo)")
+    parser.add_argument("--chunk", type=int, default=64, help="Imágenes por petición de subida")
+    parser.add_argument("--downloads", type=int, default=4, help="Descargas simultáneas de resultados")
+    parser.add_argument("--progress-secs", type=float, default=2.0, help="Segundos entre líneas de progreso")
+    args = parser.parse_args()
+
+    imagenes = listar_imagenes(args.entrada)
+    if not imagenes:
+        print(f"❌ No se encontraron imágenes en {args.entrada}")
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    servidor = args.server.rstrip("/")
+    sesion = requests.Session()
+
+    # Primera tanda: crea el trabajo y anuncia el total de imágenes
+    tandas = [imagenes[i:i + args.chunk] for i in range(0, len(imagenes), args.chunk)]
+    inicio = time.time()
+    trabajo = enviar_tanda(sesion, f"{servidor}/jobs", tandas[0],
+                           {**campos_trabajo(args), "expected": len(imagenes)})
+    job_id = trabajo["job_id"]
+    print(f"📦 Trabajo {job_id}: {len(imagenes)} imágenes, filtro {args.chain or args.filter}")
+
+    # Los resultados se descargan mientras se suben las tandas restantes
+    seguimiento = Seguimiento(servidor, job_id, args.out, args.downloads, args.progress_secs)
+    seguimiento.iniciar()
+    for tanda in tandas[1:]:
+        enviar_tanda(sesion, f"{servidor}/jobs/{job_id}/images", tanda)
+    print(f"⬆️ Subida completa en {time.time() - inicio:.1f} s")
+
+    resumen = seguimiento.esperar()
+    if resumen is None:
+        return 1
+    resumen.update({"finished": seguimiento.imagenes, "wall_seconds": round(time.time() - inicio, 3)})
+    with open(os.path.join(args.out, f"dispix_job_{job_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(resumen, f, indent=2, ensure_ascii=False)
+    print(f"✅ {resumen['done']} imágenes procesadas, {resumen['failed']} con error, en "
+          f"{resumen['wall_seconds']:.1f} s ({len(imagenes) / resumen['wall_seconds']:.1f} img/s)")
+    return 1 if resumen["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,29 +6,52 @@
 #              la imagen al recibir los resultados.
 # AUTOR: Alejandro Castro Martínez
 # FECHA DE CREACIÓN: 2025-04-17
-# ÚLTIMA MODIFICACIÓN: 2025-04-17
+# ÚLTIMA MODIFICACIÓN: 2026-10-18
 # DEPENDENCIAS: flask, numpy, opencv-python, redis, base64, werkzeug, logging
 # CONTEXTO:
 #     - Proyecto DisPix: procesamiento distribuido de imágenes.
 #     - Este archivo constituye el "máster" del sistema.
 # ------------------------------------------------------------------------------
 
-from flask import Flask, render_template, request, jsonify, send_from_directory, url_for
+from flask.logging import default_handler
+from flask import (Flask, Response, render_template, request, jsonify, send_from_directory, url_for,
+                   has_request_context, stream_with_context)
+import atexit
 import os
 import time
 import cv2
 import numpy as np
 from werkzeug.utils import secure_filename
-from base64 import b64decode
 import logging
 from logging.handlers import TimedRotatingFileHandler
 from datetime import datetime
 import uuid
+import json
+import struct
+import threading
 
-from utils.redis_publisher import publish_block
-from utils.image_reconstructor import reconstruir_y_guardar_imagen
+from utils.redis_publisher import estado_cluster, r, EmpaquetadorBloques, DISPATCH_MODE
+from utils.block_codec import (decodificar_bloque, desempaquetar_lote, codec_por_defecto,
+                               codecs_disponibles, leer_calidad, CODEC_LEGADO, CODEC_ADAPTATIVO)
+from utils.image_reconstructor import (crear_lienzo, crear_lienzo_en_disco, colocar_bloque,
+                                       decodificar_bloque_legado, guardar_lienzo_async)
 from utils.logger import registrar_tiempo_procesamiento
-from utils.recovery import iniciar_verificacion_recuperacion
+from utils.recovery import PlanificadorReintentos
+from utils.filter_specs import (parametros_filtro, halo_filtro, es_cadena, nombre_cadena,
+                                filtros_desconocidos, validar_parametros)
+from utils.dispatcher import tiles_tarea, tile_tarea, indice_tarea, publicar_tile
+from utils.planner import planificar_grilla, validar_grilla
+from utils.task_store import TaskStore, CAMPOS_METADATOS
+from utils.shared_state import EstadoCompartido, bloque_en_mapa
+from utils.ingestion import EtapaSegundoPlano, guardar_flujo, guardar_data_url, trozos_archivo
+from utils.progress import AvisosProgreso
+from utils.shm_transport import SegmentosTarea, TRANSPORTES, TRANSPORTE_POR_DEFECTO
+from utils.result_cache import CacheResultados, clave_archivo, CACHE_MB, CACHE_REDIS, CACHE_TTL
+from utils.metrics import REGISTRO, TIPO_CONTENIDO, observar, medir, clase_bloque
+from utils.async_logging import configurar_logger, ResumenPeriodico
+from utils.scheduler import PlanificadorEnvios, capacidad_cluster, PESOS_PRIORIDAD, PRIORIDAD_POR_DEFECTO
+from utils.jobs import RegistroTrabajos
+from utils.large_image import abrir_por_regiones, es_grande
 
 # Configuración de Flask
 app = Flask(__name__)
@@ -37,6 +60,7 @@ app = Flask(__name__)
 UPLOAD_FOLDER = "data/uploaded_images"
 RECEIVED_DIR = "data/received_blocks"
 PROCESSED_IMAGES = "data/processed_images"
+CANVAS_DIR = "data/canvas"
 LOG_DIR = "data/logs"
 
 # Crear carpetas si no existen
@@ -44,9 +68,152 @@ os.makedirs(LOG_DIR, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RECEIVED_DIR, exist_ok=True)
 os.makedirs(PROCESSED_IMAGES, exist_ok=True)
+os.makedirs(CANVAS_DIR, exist_ok=True)
 
-# Diccionario para llevar el estado de todas las tareas activas (clave: task_id)
-task_store = {}
+# Procesos del máster que atienden peticiones (ver gunicorn.conf.py). Con más
+# de uno, el lienzo de cada tarea se crea en disco (data/canvas) para que
+# cualquiera de ellos pueda escribir los bloques que recibe
+PROCESOS_MAESTRO = int(os.environ.get("DISPIX_MASTER_PROCESSES", 1))
+
+# Estado de las tareas compartido entre procesos: metadatos, contadores y
+# bloques recibidos en Redis (ver utils/shared_state.py)
+compartido = EstadoCompartido(r)
+
+def campos_compartidos(task):
+    """Campos de una tarea local que se publican en el estado compartido."""
+    return {k: task[k] for k in CAMPOS_METADATOS if k in task}
+
+def sincronizar_terminada(task):
+    """
+    Se ejecuta en el proceso dueño al terminar una tarea: trae los contadores
+    y el resultado que escribieron otros procesos, publica el registro final
+    y avisa a todos los procesos.
+    """
+    task_id = task["task_id"]
+    registro = compartido.leer(task_id) or {}
+    for campo in ("blocks_received", "duplicates", "processed_filename", "original_filename"):
+        if campo in registro:
+            task[campo] = registro[campo]
+    if registro.get("error"):
+        task["error"] = True
+    if task.get("error"):
+        task["state"] = "error"
+    elif task.get("processed_filename"):
+        task["state"] = "done"
+
+    final = campos_compartidos(task)
+    final.pop("blocks_received", None)
+    final.pop("duplicates", None)
+    compartido.publicar(task_id, final)
+    compartido.avisar(task_id, fin=True)
+    if task.get("job_id"):
+        terminar_imagen_trabajo(task)
+
+# Trabajos por lotes: cada imagen es una tarea; el trabajo lleva la cuenta
+# en Redis (ver utils/jobs.py)
+trabajos = RegistroTrabajos(r)
+
+def terminar_imagen_trabajo(task):
+    """Registra en su trabajo una imagen que terminó y avisa a quienes lo siguen."""
+    trabajos.terminar_imagen(task["job_id"], {
+        "name": task.get("name"),
+        "task_id": task["task_id"],
+        "state": task.get("state"),
+        "processed_filename": task.get("processed_filename"),
+        "message": task.get("message"),
+        "width": task.get("width"),
+        "height": task.get("height"),
+        "seconds": round(task["end_time"] - task["start_time"], 3),
+    })
+    # Cada imagen terminada se avisa siempre (sin el límite de los avisos de progreso)
+    compartido.avisar(task["job_id"], fin=True)
+
+# Estado de las tareas (clave: task_id), acotado en memoria: las terminadas
+# se reducen a metadatos y se vuelcan a data/tasks (ver utils/task_store.py)
+task_store = TaskStore(al_completar=sincronizar_terminada)
+
+# Caché de contenido: resultados por bloque y nombre de la imagen procesada
+# por archivo subido (ver utils/result_cache.py)
+cache_bloques = CacheResultados(CACHE_MB * 1024 * 1024, r if CACHE_REDIS else None, CACHE_TTL)
+cache_imagenes = CacheResultados(1024 * 1024 if CACHE_MB else 0, r if CACHE_REDIS else None, CACHE_TTL,
+                                 serializar=str.encode, deserializar=bytes.decode)
+
+# Avisos de cambios de las tareas para las conexiones de /events
+progreso = AvisosProgreso()
+
+# Métricas por etapa (ver utils/metrics.py). Con varios procesos, cada uno
+# vuelca sus histogramas en Redis y /metrics expone la suma de todos
+CLAVE_METRICAS = "dispix-metrics:master"
+if PROCESOS_MAESTRO > 1:
+    REGISTRO.volcar_periodicamente(r, CLAVE_METRICAS)
+
+def registrar_tiempos(meta, decodificacion=None):
+    """
+    Registra las etapas de un resultado: las medidas por el worker (viajan
+    en meta['t']), la subida (desde que el worker entregó el bloque) y la
+    decodificación en el máster (en el formato heredado se decodifica al
+    reconstruir y queda dentro de esa etapa).
+    """
+    t = meta.get("t")
+    if not t:
+        return
+    filtro, clase = meta.get("filter", "N/A"), t.get("block", "0")
+    for etapa in ("queue", "decode", "filter"):
+        if t.get(etapa) is not None:
+            observar(etapa, t[etapa], filtro, clase)
+    if "ts" in t:
+        observar("upload", time.time() - t["ts"], filtro, clase)
+    if decodificacion is not None:
+        observar("master_decode", decodificacion, filtro, clase)
+
+def tarea_para_reintentos(task_id):
+    """
+    Tarea activa de este proceso con los avances de todos los procesos: los
+    bloques que llegaron a otro proceso cierran su plazo aquí.
+    """
+    task = task_store.activa(task_id)
+    if task is None:
+        return None
+    registro = compartido.leer(task_id) or {}
+    task["last_received"] = max(task.get("last_received", 0), registro.get("last_received", 0))
+    mapa = compartido.mapa_recibidos(task_id)
+    with task["lock"]:
+        for block_id in [b for b in task["leases"] if bloque_en_mapa(mapa, indice_tarea(task, b))]:
+            task["leases"].pop(block_id)
+    return task
+
+def cambio_reintentos(task_id):
+    """
+    Publica los reintentos decididos por el planificador. Si se agotaron,
+    la tarea termina ya con error (y con ella su imagen del trabajo).
+    """
+    task = task_store.activa(task_id)
+    if task is not None and task.get("error"):
+        task_store.completar(task_id)
+        return
+    if task is not None:
+        # Reenviar bloques también es actividad: la tarea no vence por TTL
+        task["last_activity"] = time.time()
+        compartido.publicar(task_id, {"retries": task.get("retries", 0), "error": False})
+    compartido.avisar(task_id)
+
+# Plazos por bloque y reenvío de los bloques vencidos (un solo hilo)
+# (sin workers vivos los plazos se renuevan: ver envios, más abajo)
+reintentos = PlanificadorReintentos(tarea_para_reintentos, al_cambiar=cambio_reintentos,
+                                    hay_workers=lambda: envios.hay_workers())
+
+def atender_aviso(task_id, fin):
+    """
+    Aviso de cambio desde cualquier proceso: despierta las conexiones de
+    /events y, si la tarea terminó en otro proceso, libera aquí sus recursos.
+    """
+    progreso.notificar(task_id)
+    if fin:
+        compartido.olvidar(task_id)
+        if task_store.activa(task_id) is not None:
+            task_store.completar(task_id)
+
+compartido.escuchar(atender_aviso)
 
 # Configuración de logs rotativos por día
 log_filename = os.path.join(LOG_DIR, "log_" + datetime.now().strftime("%Y-%m-%d") + ".log")
@@ -60,140 +227,716 @@ handler = TimedRotatingFileHandler(
     delay=False,
 )
 handler.suffix = "%Y-%m-%d"
-formatter = logging.Formatter('%(message)s')
+formatter = logging.Formatter('%(asctime)s - %(message)s')
 handler.setFormatter(formatter)
-app.logger.setLevel(logging.INFO)
-app.logger.addHandler(handler)
+
+# Los mensajes se encolan y un hilo los escribe en el archivo y la consola
+# (ver utils/async_logging.py); el nivel se elige con DISPIX_LOG_LEVEL
+app.logger.removeHandler(default_handler)
+configurar_logger(app.logger, [handler, default_handler])
+
+# Los eventos por bloque se resumen por tarea cada pocos segundos; el
+# detalle de cada bloque queda en nivel DEBUG
+bloques_publicados = ResumenPeriodico(app.logger, "🟢 Tarea {clave}: {n} bloques publicados")
+bloques_recibidos = ResumenPeriodico(app.logger, "📥 Tarea {clave}: {n} bloques recibidos")
 
 # Ruta principal: muestra el formulario de carga
 @app.route("/")
 def index():
     if request.method == "GET":
         ip = request.remote_addr
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        app.logger.info(f"{timestamp} - IP: {ip} - Acceso a /")
+        app.logger.info(f"IP: {ip} - Acceso a /")
     return render_template("index.html")
 
-# Procesamiento de la imagen: guarda, divide y publica
+def opciones_tarea(campos):
+    """
+    Lee y valida las opciones de una tarea (filtro, parámetros, grilla,
+    códec y calidad, transporte, prioridad y cliente) de los campos de
+    /process o de /jobs.
+
+    Returns:
+        tuple: (opciones, None) o (None, mensaje de error).
+    """
+    filtro = campos.get("filter", "")
+    block_size = campos.get("block_size", "auto")
+    if block_size != "auto" and not block_size.isdigit():
+        return None, f"block_size inválido: {block_size}"
+    try:
+        params_usuario = json.loads(campos.get("params") or "{}")
+        halo_usuario = int(campos.get("halo") or 0)
+        # Cadena de filtros explícita: [{"filter": ..., "params": {...}}, ...];
+        # equivale a filter="a+b" con params como lista (uno por paso)
+        if campos.get("chain"):
+            filtro, params_usuario = nombre_cadena(json.loads(campos["chain"]))
+    except (ValueError, TypeError, KeyError):
+        return None, "params, halo o chain inválidos"
+    if halo_usuario < 0:
+        return None, f"halo inválido: {halo_usuario}"
+    # Solo filtros conocidos: el nombre también etiqueta las métricas, así
+    # que uno arbitrario crearía una serie nueva por petición
+    desconocidos = filtros_desconocidos(filtro)
+    if desconocidos:
+        return None, f"Filtros desconocidos: {desconocidos}"
+    if es_cadena(filtro):
+        if params_usuario and not isinstance(params_usuario, list):
+            return None, "Los params de una cadena van en una lista, uno por paso"
+    # Valores fuera de rango harían fallar el bloque en cada worker que lo tome
+    error = validar_parametros(filtro, params_usuario)
+    if error:
+        return None, error
+
+    # Códec de transporte de los bloques, seleccionable por tarea
+    codec = campos.get("codec") or codec_por_defecto()
+    if codec != CODEC_LEGADO and codec not in codecs_disponibles():
+        return None, f"Códec no disponible: {codec}"
+
+    # Política de calidad del códec 'auto': sin pérdida (por defecto) o
+    # 'jpeg:<q>' / 'webp:<q>' para permitir pérdida en los bloques con ruido
+    try:
+        calidad = campos.get("quality") if leer_calidad(campos.get("quality")) else None
+    except ValueError as e:
+        return None, str(e)
+    if calidad and codec != CODEC_ADAPTATIVO:
+        return None, f"quality requiere el códec {CODEC_ADAPTATIVO}"
+
+    # Transporte de los píxeles: en los mensajes de Redis o, con workers en
+    # la misma máquina, en memoria compartida (ver utils/shm_transport.py)
+    transporte = campos.get("transport") or TRANSPORTE_POR_DEFECTO
+    if transporte not in TRANSPORTES:
+        return None, f"Transporte desconocido: {transporte}"
+
+    # Clase de prioridad y cliente (para el reparto entre tareas y el tope
+    # de bloques en vuelo por cliente, ver utils/scheduler.py)
+    prioridad = campos.get("priority") or PRIORIDAD_POR_DEFECTO
+    if prioridad not in PESOS_PRIORIDAD:
+        return None, f"Prioridad desconocida: {prioridad}"
+    cliente = campos.get("client") or request.headers.get("X-DisPix-Client") or request.remote_addr
+
+    return {"filter": filtro, "block_size": block_size, "params": params_usuario, "halo": halo_usuario,
+            "codec": codec, "quality": calidad, "transport": transporte, "priority": prioridad,
+            "client": cliente}, None
+
+def registrar_tarea(task_id, opciones, filepath, job_id=None, nombre=None):
+    """
+    Registra una tarea con su imagen ya en disco y la encola en la etapa de
+    preparación. Las tareas de un trabajo por lotes guardan su trabajo y el
+    nombre original de la imagen, y sus bloques pequeños se empaquetan.
+    """
+    # La tarea existe desde ya (en cola) para que /status pueda consultarla
+    task = {
+        "task_id": task_id,
+        "start_time": time.time(),
+        "state": "queued",
+        "filter": opciones["filter"],
+        "codec": opciones["codec"],
+        "quality": opciones.get("quality"),
+        "transport": opciones["transport"],
+        "priority": opciones["priority"],
+        "client": opciones["client"],
+        "upload_path": filepath,
+        "lock": threading.Lock(),
+    }
+    if job_id is not None:
+        task.update({"job_id": job_id, "name": nombre, "pack": True})
+    task_store[task_id] = task
+    compartido.publicar(task_id, campos_compartidos(task))
+    ingesta.encolar(task_id, opciones["block_size"], opciones["params"], opciones["halo"])
+
+# Recepción de la imagen: la vuelca a disco, registra la tarea y responde de
+# inmediato; la división y publicación ocurren en segundo plano (preparar_tarea)
 @app.route("/process", methods=["POST"])
 def process_image():
     task_id = str(uuid.uuid4())
-    image_data = request.form["image"]
-    filtro = request.form["filter"]
-    block_size = int(request.form["block_size"])
 
-    # Decodificar base64
-    header, encoded = image_data.split(",", 1)
-    img_bytes = b64decode(encoded)
+    # Campos de la tarea: en el formulario (multipart o data URL heredado) o,
+    # si el cuerpo es la imagen cruda, en la query string
+    es_formulario = request.mimetype in ("multipart/form-data", "application/x-www-form-urlencoded")
+    campos = request.values if es_formulario else request.args
+    opciones, error = opciones_tarea(campos)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
 
-    # Guardar la imagen original
+    # Guardar la imagen original directamente en disco: archivo multipart,
+    # cuerpo crudo (por trozos) o data URL en base64 (formato heredado)
     filename = secure_filename(f"uploaded_{task_id}.png")
     filepath = os.path.join(UPLOAD_FOLDER, filename)
-    with open(filepath, "wb") as f:
-        f.write(img_bytes)
+    if es_formulario and "image" in request.files:
+        request.files["image"].save(filepath)
+    elif es_formulario and "image" in request.form:
+        guardar_data_url(request.form["image"], filepath)
+    elif not es_formulario and request.content_length:
+        guardar_flujo(request.stream, filepath)
+    else:
+        return jsonify({"status": "error", "message": "No se recibió ninguna imagen"}), 400
+
+    registrar_tarea(task_id, opciones, filepath)
+    return jsonify({"status": "ok", "task_id": task_id, "state": "queued", "codec": opciones["codec"],
+                    "transport": opciones["transport"], "priority": opciones["priority"]}), 202
+
+def agregar_imagenes_trabajo(job_id, opciones, archivos):
+    """
+    Crea una tarea por cada archivo recibido para el trabajo (ya reservados
+    con trabajos.agregar_imagenes). Cada archivo se guarda tal cual (sin
+    base64) y las tareas comparten las opciones.
+
+    Returns:
+        list: {name, task_id} de cada imagen, en el orden recibido.
+    """
+    tareas = []
+    for archivo in archivos:
+        task_id = str(uuid.uuid4())
+        filepath = os.path.join(UPLOAD_FOLDER, f"uploaded_{task_id}.png")
+        archivo.save(filepath)
+        registrar_tarea(task_id, opciones, filepath, job_id=job_id, nombre=archivo.filename)
+        tareas.append({"name": archivo.filename, "task_id": task_id})
+    return tareas
+
+# Trabajo por lotes: muchas imágenes con las mismas opciones de /process en
+# una sola petición (campo de archivo 'images', repetido). Con 'expected' se
+# anuncian más imágenes, que llegan después por /jobs/<job_id>/images
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    opciones, error = opciones_tarea(request.form)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    archivos = request.files.getlist("images")
+    if not archivos:
+        return jsonify({"status": "error", "message": "No se recibió ninguna imagen"}), 400
+    esperadas = request.form.get("expected", len(archivos), type=int)
+    if esperadas < len(archivos):
+        return jsonify({"status": "error", "message": f"expected inválido: {esperadas}"}), 400
+
+    job_id = str(uuid.uuid4())
+    trabajos.crear(job_id, opciones, esperadas)
+    trabajos.agregar_imagenes(job_id, len(archivos))
+    tareas = agregar_imagenes_trabajo(job_id, opciones, archivos)
+    app.logger.info(f"📦 Trabajo {job_id}: {len(archivos)}/{esperadas} imágenes con filtro {opciones['filter']}")
+    return jsonify({"status": "ok", "job_id": job_id, "expected": esperadas, "tasks": tareas}), 202
+
+@app.route("/jobs/<job_id>/images", methods=["POST"])
+def add_job_images(job_id):
+    opciones = trabajos.opciones(job_id)
+    if opciones is None:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado"}), 404
+    archivos = request.files.getlist("images")
+    if not archivos:
+        return jsonify({"status": "error", "message": "No se recibió ninguna imagen"}), 400
+    # Sin pasar de las imágenes anunciadas: si no, el trabajo se daría por
+    # completo con tareas todavía en curso
+    if trabajos.agregar_imagenes(job_id, len(archivos)) is None:
+        return jsonify({"status": "error",
+                        "message": f"El trabajo no admite {len(archivos)} imágenes más (supera expected)"}), 400
+    tareas = agregar_imagenes_trabajo(job_id, opciones, archivos)
+    return jsonify({"status": "ok", "job_id": job_id, "tasks": tareas}), 202
+
+def con_urls(imagenes):
+    """Agrega a las imágenes terminadas la URL de descarga de su resultado."""
+    for imagen in imagenes:
+        if imagen.get("processed_filename"):
+            imagen["url"] = url_for("processed_images", filename=imagen["processed_filename"])
+    return imagenes
+
+# Progreso agregado de un trabajo; con ?from=N incluye las imágenes
+# terminadas a partir de la posición N
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    resumen = trabajos.resumen(job_id)
+    if resumen is None:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado"}), 404
+    desde = request.args.get("from", type=int)
+    if desde is not None:
+        resumen["finished"] = con_urls(trabajos.terminadas(job_id, desde))
+        resumen["next"] = desde + len(resumen["finished"])
+    return jsonify(resumen)
+
+# Progreso de un trabajo empujado por el servidor (Server-Sent Events): cada
+# evento trae el resumen agregado y las imágenes terminadas desde el
+# anterior; el último es 'done'. Con ?from=N se retoma tras una desconexión
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    if trabajos.resumen(job_id) is None:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado"}), 404
+    cursor = [request.args.get("from", 0, type=int)]
+
+    def leer_estado():
+        # El resumen se lee antes que la lista: si ya está completo, la
+        # lista tiene todas las imágenes
+        resumen = trabajos.resumen(job_id)
+        if resumen is None:
+            return "error", json.dumps({"complete": True, "message": "Trabajo no encontrado"}), True
+        nuevas = trabajos.terminadas(job_id, cursor[0])
+        cursor[0] += len(nuevas)
+        resumen.update({"finished": con_urls(nuevas), "next": cursor[0]})
+        return ("done" if resumen["complete"] else "progress"), json.dumps(resumen), resumen["complete"]
+
+    return Response(stream_with_context(progreso.eventos(job_id, leer_estado)),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    # Leer imagen con OpenCV
-    image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+def preparar_tarea(task_id, block_size, params_usuario, halo_usuario):
+    """
+    Etapa en segundo plano de /process: decodifica la imagen subida, elige
+    la grilla y publica los bloques (o sirve el resultado desde la caché).
+    """
+    task = task_store.activa(task_id)
+    if task is None:
+        return
+    filtro, transporte = task["filter"], task["transport"]
+    filepath = task["upload_path"]
+    filename = os.path.basename(filepath)
 
-    # Dividir en bloques 
+    # Imágenes .npy o TIFF: se abren para leerlas por regiones. Si son
+    # grandes (ver utils/large_image.py) quedan así y cada bloque lee solo
+    # sus píxeles; si no, se cargan enteras como las demás
+    por_regiones = abrir_por_regiones(filepath)
+    grande = por_regiones is not None and es_grande(por_regiones.shape)
+    if grande:
+        image, img_bytes = por_regiones, None
+    else:
+        # Leer imagen con OpenCV (los bytes del archivo sirven además de clave de caché)
+        with open(filepath, "rb") as f:
+            img_bytes = f.read()
+        if por_regiones is not None:
+            image = np.ascontiguousarray(por_regiones[:, :])
+        else:
+            image = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("El archivo subido no es una imagen válida")
+
+    # Elegir la grilla: automática (planificador) o indicada por el usuario,
+    # con los workers vivos y sus núcleos según el registro de latidos
     h, w, _ = image.shape
-    num_rows, num_cols = block_size, block_size
+    cluster = envios.estado_cluster()
+    if block_size == "auto":
+        def planificar(halo_plan):
+            return planificar_grilla(h, w, filtro, cluster["workers"], nucleos=cluster["cores"],
+                                     halo=halo_plan)
+
+        # Los parámetros por defecto (p. ej. la celda de pixelate) dependen del
+        # tamaño de bloque: se estiman con una grilla provisional y, si su halo
+        # es mayor, se vuelve a planificar con él
+        halo_plan = max(halo_filtro(filtro, params_usuario), halo_usuario)
+        plan = planificar(halo_plan)
+        halo_defecto = halo_filtro(filtro, parametros_filtro(filtro, h // plan["rows"], w // plan["cols"],
+                                                             params_usuario))
+        if halo_defecto > halo_plan:
+            plan = planificar(halo_defecto)
+    else:
+        plan = validar_grilla(int(block_size), int(block_size), h, w,
+                              workers_vivos=cluster["workers"])
+
+    # Grilla exacta: los bloques de borde absorben el resto de la división,
+    # así que el lienzo tiene el tamaño original (ver utils/tiling.py)
+    num_rows, num_cols = plan["rows"], plan["cols"]
     bh, bw = h // num_rows, w // num_cols
-    blocks = []
-
-    for i in range(num_rows):
-        for j in range(num_cols):
-            block = image[i*bh:(i+1)*bh, j*bw:(j+1)*bw]
-            block_id = f"{i}_{j}"
-            blocks.append({
-                "task_id": task_id,
-                "block_id": block_id,
-                "data": block,
-                "filter": filtro
-            })
-
-    # Guardar el estado de la tarea actual en el diccionario task_store
-    task_store[task_id] = {
-        "start_time": time.time(),
-        "blocks_sent": len(blocks),
-        "total_blocks": len(blocks),
+    total_blocks = num_rows * num_cols
+
+    # Parámetros del filtro y halo de vecindad que necesita (ver utils/tiling.py);
+    # el formulario puede pedir un halo mayor con el campo 'halo'
+    params = parametros_filtro(filtro, bh, bw, params_usuario)
+    halo = max(halo_filtro(filtro, params), halo_usuario)
+    if task.get("job_id"):
+        trabajos.sumar(task["job_id"], "blocks_total", total_blocks)
+
+    # La misma imagen con el mismo filtro ya se procesó: se sirve el
+    # resultado guardado en data/processed_images sin publicar nada (salvo
+    # si la tarea permite pérdida: su resultado no es el exacto)
+    if cache_imagenes.activa and not task.get("quality"):
+        clave_imagen = clave_archivo(img_bytes or trozos_archivo(filepath), filtro, params)
+    else:
+        clave_imagen = None
+    procesada = cache_imagenes.obtener(clave_imagen) if clave_imagen else None
+    if procesada and os.path.exists(os.path.join(PROCESSED_IMAGES, procesada)):
+        task.update({
+            "width": w, "height": h, "block_width": num_rows, "block_height": num_cols,
+            "params": params, "halo": halo, "plan": plan, "blocks_sent": 0, "total_blocks": 0,
+            "blocks_received": 0, "cached": True, "state": "done", "original_filename": filename,
+            "large": grande,
+            "processed_filename": procesada,
+        })
+        task_store.completar(task_id)
+        app.logger.info(f"♻️ Imagen ya procesada ({procesada}), tarea {task_id} servida desde la caché")
+        return
+
+    # La imagen y su lienzo de salida deben caber en el presupuesto de memoria
+    # (las imágenes grandes solo retienen en memoria los bloques en vuelo)
+    if not task_store.hay_espacio(0 if grande else 2 * image.nbytes):
+        raise MemoryError("Máster sin memoria disponible, reintente más tarde")
+
+    # Una imagen grande no se copia a memoria compartida: sus bloques viajan por Redis
+    if grande and transporte == "shm":
+        app.logger.info(f"🗺️ Tarea {task_id}: imagen grande, se usa el transporte redis en lugar de shm")
+        transporte = task["transport"] = "redis"
+
+    # Memoria compartida: la imagen y el lienzo viven en segmentos que los
+    # workers locales leen y escriben directamente
+    segmentos = SegmentosTarea(task_id, image) if transporte == "shm" else None
+    if segmentos is not None:
+        image = segmentos.entrada
+
+    # Lienzo de salida: en memoria compartida, en disco (varios procesos de
+    # máster o imagen grande) o en la memoria de este proceso. Los demás
+    # procesos lo abren a partir de canvas_ref
+    ruta_lienzo = None
+    if segmentos is not None:
+        lienzo, canvas_ref = segmentos.salida, {"shm": segmentos.descriptor()}
+    elif PROCESOS_MAESTRO > 1 or grande:
+        ruta_lienzo = os.path.join(CANVAS_DIR, f"{task_id}.npy")
+        lienzo, canvas_ref = crear_lienzo_en_disco(ruta_lienzo, h, w), {"path": ruta_lienzo}
+    else:
+        lienzo, canvas_ref = crear_lienzo(h, w), None
+
+    def liberar_recursos():
+        if segmentos is not None:
+            segmentos.liberar()
+        if ruta_lienzo is not None and os.path.exists(ruta_lienzo):
+            os.remove(ruta_lienzo)
+
+    # Completar el estado de la tarea en task_store
+    task.update({
+        "state": "dispatching",
+        "blocks_sent": total_blocks,
+        "total_blocks": total_blocks,
         "blocks_received": 0,
-        "received_data": {},
+        "duplicates": 0,
+        # Plazo de cada bloque pendiente: block_id -> (publicado, intentos)
+        "leases": {},
+        # Lienzo de salida: cada bloque se escribe aquí apenas llega
+        "canvas": lienzo,
         "width": w,
         "height": h,
         "block_width": num_rows,
         "block_height": num_cols,
         "filter": filtro,
-        "task_id": task_id,
-        "image_blocks": blocks,
+        "params": params,
+        "halo": halo,
+        "plan": plan,
+        "shm": segmentos,
+        "large": grande,
+        "liberar": liberar_recursos,
+        # Imagen original: los bloques se recortan de aquí al publicarse, sin
+        # guardar una lista de bloques; los reintentos la releen del disco
+        "image": image,
+        # Claves de caché de los bloques publicados (block_id -> clave) y de
+        # la imagen completa, para guardar los resultados al llegar
+        "cache_keys": {},
+        "image_key": clave_imagen,
+        "cached_blocks": 0,
         "retries": 0,
         "max_retries": 1
-    }
+    })
+    # Publicar el estado antes que los bloques: cualquier proceso puede
+    # recibir los resultados
+    compartido.publicar(task_id, {**campos_compartidos(task), "canvas_ref": canvas_ref,
+                                  "image_key": clave_imagen})
+    compartido.avisar(task_id)
 
-    # Publicar cada bloque como tarea en Redis
-    for block in blocks:
-        publish_block(block["task_id"], block["block_id"], block["filter"], block["data"])
-        app.logger.info(f"🟢 Publicando bloque {block['block_id']} con filtro {block['filter']}")
+    # Los bloques se generan a medida que el planificador de envíos le da
+    # turno a la tarea, intercalados con los de las demás tareas activas
+    envios.agregar(task, tiles_tarea(task), task["priority"], task["client"])
 
-    # Iniciar verificación de recuperación automática por reintento
-    iniciar_verificacion_recuperacion(task_store[task_id])
+# Bloques pequeños de los trabajos por lotes: varios por mensaje de Redis
+paquetes = EmpaquetadorBloques()
+# Al cerrar el máster se publica lo que quede esperando en el paquete
+atexit.register(paquetes.vaciar)
 
-    return jsonify({"status": "ok", "blocks": len(blocks), "task_id": task_id})
+def publicar_bloque(task, tile):
+    """Publica un bloque cuando el planificador de envíos le da turno."""
+    cacheado = publicar_tile(task, tile, cache=cache_bloques, paquete=paquetes)
+    if cacheado is not None:
+        # Bloque idéntico ya procesado: se ubica directamente en el lienzo
+        task["cached_blocks"] += 1
+        registrar_resultado(task["task_id"], tile.block_id, cacheado)
+        return
+    reintentos.registrar_envio(task, tile.block_id)
+    bloques_publicados.contar(task["task_id"], "🟢 Publicando bloque %s con filtro %s",
+                              tile.block_id, task["filter"])
 
-# Recepción de bloques procesados por parte de los workers
-@app.route("/result", methods=["POST"])
-def receive_result():
-    data = request.json
-    task_id = data["task_id"]
-    block_id = data["block_id"]
-    block_data = data["block_data"]
+def envio_completo(task):
+    """Todos los bloques de la tarea ya se publicaron: se libera la imagen."""
+    task_id = task["task_id"]
+    if task.get("shm") is None:
+        task["image"] = None
+    compartido.guardar_claves(task_id, dict(task["cache_keys"]))
+    if task.get("state") == "dispatching":
+        task["state"] = "processing"
+    # Sin pisar el estado final si otro proceso ya terminó la tarea
+    compartido.publicar_si(task_id, {"state": "processing", "cached_blocks": task["cached_blocks"]},
+                           "state", "dispatching")
+    compartido.avisar(task_id)
 
-    task = task_store.get(task_id)
-    if not task:
-        return jsonify({"status": "error", "message": "Tarea no encontrada"}), 404
+def fallar_tarea(task_id, error):
+    """La tarea termina con error (al prepararla o al publicar sus bloques)."""
+    task = task_store.activa(task_id)
+    if task is not None:
+        task["error"] = True
+        task["state"] = "error"
+        task["message"] = str(error)
+        task_store.completar(task_id)
+
+# Reparto de los envíos entre las tareas activas: round-robin ponderado por
+# prioridad, ventana según la capacidad de los workers vivos (sin workers, se
+# retienen) y tope por cliente
+envios = PlanificadorEnvios(task_store.activa, publicar_bloque, compartido.recibidos,
+                            al_agotar=envio_completo, al_fallar=fallar_tarea,
+                            consultar_cluster=estado_cluster,
+                            procesos=PROCESOS_MAESTRO)
+
+def fallo_preparacion(args, error):
+    """La preparación en segundo plano falló: la tarea termina con error."""
+    fallar_tarea(args[0], error)
+
+# Etapa en segundo plano que divide y publica las tareas recibidas
+ingesta = EtapaSegundoPlano(preparar_tarea, al_fallar=fallo_preparacion)
+
+def registrar_resultado(task_id, block_id, block_data):
+    """
+    Escribe un bloque procesado en el lienzo de su tarea y, si era el último,
+    encola el guardado de la imagen final en el escritor en segundo plano.
+    Funciona en cualquier proceso del máster: si la tarea se preparó en
+    otro, su lienzo se abre a partir del estado compartido.
+
+    Args:
+        block_data (np.ndarray | str | None): Bloque ya decodificado (formato
+                                       binario), PNG en base64 (heredado) o
+                                       None si el worker ya lo escribió en el
+                                       lienzo compartido (transporte shm).
+
+    Los resultados repetidos (reenvíos, o pub/sub con varios workers) se
+    descartan: cada bloque se cuenta una sola vez.
 
-    # Guardar bloque recibido
-    task["blocks_received"] += 1
-    task["received_data"][block_id] = block_data
+    Returns:
+        dict | None: Estado de la tarea tras registrar el bloque
+                     (received, total, done) o None si la tarea no existe.
+    """
+    task = task_store.activa(task_id)
+    vista = task if task is not None else compartido.vista(task_id)
+    lienzo = vista.get("canvas") if vista else None
+    if lienzo is None:
+        # Resultado tardío de una tarea ya terminada (solo quedan sus metadatos)
+        registro = buscar_tarea(task_id)
+        if not registro:
+            return None
+        return {"received": registro.get("blocks_received", 0),
+                "total": registro.get("total_blocks"), "done": False}
 
-    total = task["total_blocks"]
-    received = task["blocks_received"]
+    # Reservar el bloque en el mapa compartido: solo el primer resultado de
+    # cada bloque se ubica, llegue al proceso que llegue
+    indice = indice_tarea(vista, block_id)
+    if not compartido.reservar_bloque(task_id, indice):
+        registro = compartido.leer(task_id) or {}
+        return {"received": registro.get("blocks_received", 0),
+                "total": vista["total_blocks"], "done": False}
 
-    # Logging de recepción
-    ip = request.remote_addr
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    app.logger.info(f"{timestamp} - IP: {ip} - Acceso a /result - Bloque: {block_id} - Recibido: {received}/{total}")
+    # Decodificar y ubicar el bloque; la copia codificada se descarta aquí
+    try:
+        if block_data is not None:
+            tile = tile_tarea(vista, block_id)
+            with medir("reconstruct", vista["filter"], clase_bloque((tile.y1 - tile.y0, tile.x1 - tile.x0))):
+                if not isinstance(block_data, np.ndarray):
+                    block_data = decodificar_bloque_legado(block_data)
+                colocar_bloque(lienzo, tile, block_data)
+    except Exception:
+        compartido.soltar_bloque(task_id, indice)
+        raise
+    if task is not None:
+        reintentos.confirmar(task, block_id)
 
-    # Verificar si ya llegaron todos los bloques
-    if received == total:
-        total_time = time.time() - task["start_time"]
-        print(f"✅ Procesamiento completo en {total_time:.2f} segundos.")
+    # Guardar el resultado en la caché de contenido (copia del lienzo, para
+    # no retener el cuerpo de la petición)
+    if task is not None:
+        clave = task["cache_keys"].pop(block_id, None)
+    else:
+        clave = compartido.clave_cache(task_id, block_id) if cache_bloques.activa else None
+    if clave:
+        tile = tile_tarea(vista, block_id)
+        cache_bloques.guardar(clave, lienzo[tile.y0:tile.y1, tile.x0:tile.x1].copy())
 
-        filename = f"reconstructed_{task_id}.png"
+    # El contador (atómico en Redis) solo avanza con bloques ya ubicados
+    received = compartido.contar_bloque(task_id)
+    total = vista["total_blocks"]
+    # Un lugar libre en la ventana de envíos
+    envios.despertar()
+    if task is not None:
+        task["blocks_received"] = received
+        task["last_received"] = time.time()
+    if vista.get("job_id"):
+        trabajos.sumar(vista["job_id"], "blocks_received")
+        compartido.avisar(vista["job_id"])
+
+    # Logging de recepción, resumido por tarea (los aciertos de caché llegan
+    # desde la etapa de ingesta, fuera de una petición HTTP)
+    bloques_recibidos.contar(task_id, "%s - Bloque: %s - Recibido: %s/%s",
+                             request.remote_addr if has_request_context() else "Caché",
+                             block_id, received, total)
+    compartido.avisar(task_id)
+
+    # Verificar si ya llegaron todos los bloques; la reconstrucción la
+    # reclama un único proceso
+    if received == total and compartido.reclamar_reconstruccion(task_id):
+        total_time = time.time() - vista["start_time"]
+        app.logger.info(f"✅ Tarea {task_id}: procesamiento completo en {total_time:.2f} segundos")
+
+        # Imagen grande: el lienzo .npy en disco es el resultado (sin pasar por PNG)
+        filename = f"reconstructed_{task_id}.{'npy' if vista.get('large') else 'png'}"
         output_path = os.path.join(PROCESSED_IMAGES, filename)
-        reconstruir_y_guardar_imagen(task["received_data"], output_path,
-                                     num_rows=task["block_width"], num_cols=task["block_height"])
+        guardar_lienzo_async(lienzo, output_path,
+                             al_terminar=lambda ok: finalizar_tarea(task_id, vista, filename, ok))
+
+    return {"received": received, "total": total, "done": received == total}
 
-        task["original_filename"] = f"uploaded_{task_id}.png"
-        task["processed_filename"] = filename
+def finalizar_tarea(task_id, vista, filename, ok):
+    """
+    Se ejecuta en el hilo escritor cuando la imagen final quedó en disco:
+    publica el resultado en el estado compartido, libera la tarea (aquí si
+    este proceso es su dueño, si no avisando al dueño) y registra el tiempo.
+    """
+    if ok:
+        campos = {"state": "done", "original_filename": f"uploaded_{task_id}.png",
+                  "processed_filename": filename}
+    else:
+        campos = {"state": "error", "error": True}
+    campos["end_time"] = time.time()
+    compartido.publicar(task_id, campos)
 
-        registrar_tiempo_procesamiento(
-            task_id=task_id,
-            image_size=(task["width"], task["height"]),
-            block_size=(task["block_width"], task["block_height"]),
-            num_blocks=task["blocks_sent"],
-            filtro=task["filter"],
-            start_time=task["start_time"]
-        )
+    task = task_store.activa(task_id)
+    if task is not None:
+        task["canvas"] = None
+        task["image"] = None
+        task.update(campos)
+        task_store.completar(task_id)
+    else:
+        compartido.avisar(task_id, fin=True)
+    if not ok:
+        return
+
+    if vista.get("image_key"):
+        cache_imagenes.guardar(vista["image_key"], filename)
+
+    registrar_tiempo_procesamiento(
+        task_id=task_id,
+        image_size=(vista["width"], vista["height"]),
+        block_size=(vista["block_width"], vista["block_height"]),
+        num_blocks=vista["blocks_sent"],
+        filtro=vista["filter"],
+        start_time=vista["start_time"]
+    )
+
+# Recepción de bloques procesados por parte de los workers
+@app.route("/result", methods=["POST"])
+def receive_result():
+    if request.mimetype == "application/octet-stream":
+        # Formato binario: el bloque se decodifica directamente a un ndarray
+        inicio = time.perf_counter()
+        block_data, meta = decodificar_bloque(request.get_data())
+        registrar_tiempos(meta, time.perf_counter() - inicio)
+        task_id = meta["task_id"]
+        block_id = meta["block_id"]
+        if meta.get("shm"):
+            # Los píxeles ya están en el lienzo compartido
+            block_data = None
+    else:
+        # Formato heredado: JSON con el bloque PNG en base64
+        data = request.json
+        registrar_tiempos(data)
+        task_id = data["task_id"]
+        block_id = data["block_id"]
+        block_data = data["block_data"]
+
+    estado = registrar_resultado(task_id, block_id, block_data)
+    if estado is None:
+        return jsonify({"status": "error", "message": "Tarea no encontrada"}), 404
 
+    if estado["done"]:
         return jsonify({
             "status": "ok",
-            "blocks": received,
+            "blocks": estado["received"],
             "redirect": url_for("result_page", task_id=task_id)
         })
 
     return jsonify({"status": "ok"})
 
+# Recepción por lotes: varios bloques binarios en un solo POST (ver
+# empaquetar_lote en utils/block_codec.py). Cada bloque se atiende por
+# separado: uno dañado se cuenta como rechazado (su plazo en recovery.py lo
+# vuelve a pedir) sin arrastrar al resto del lote a los reintentos del worker
+@app.route("/results/batch", methods=["POST"])
+def receive_results_batch():
+    aceptados, desconocidos, rechazados, completados = 0, 0, 0, []
+    try:
+        mensajes = desempaquetar_lote(request.get_data())
+    except (ValueError, struct.error) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    for mensaje in mensajes:
+        try:
+            inicio = time.perf_counter()
+            block_data, meta = decodificar_bloque(mensaje)
+            registrar_tiempos(meta, time.perf_counter() - inicio)
+            if meta.get("shm"):
+                block_data = None
+            estado = registrar_resultado(meta["task_id"], meta["block_id"], block_data)
+        except Exception as e:
+            app.logger.error(f"❌ Bloque rechazado en /results/batch: {e}")
+            rechazados += 1
+            continue
+        if estado is None:
+            # Tarea inexistente: se informa pero no se reintenta (como el 404 de /result)
+            desconocidos += 1
+            continue
+        aceptados += 1
+        if estado["done"]:
+            completados.append(meta["task_id"])
+
+    return jsonify({"status": "ok", "accepted": aceptados, "unknown": desconocidos,
+                    "rejected": rechazados, "completed": completados})
+
+# Histogramas por etapa en formato de texto de Prometheus
+@app.route("/metrics")
+def metrics():
+    if PROCESOS_MAESTRO > 1:
+        REGISTRO.volcar_redis(r, CLAVE_METRICAS)
+        texto = REGISTRO.exponer(REGISTRO.leer_redis(r, CLAVE_METRICAS))
+    else:
+        texto = REGISTRO.exponer()
+    return Response(texto, content_type=TIPO_CONTENIDO)
+
+def sumar_filtros(workers):
+    """
+    Bloques y ritmo por filtro sumando los workers, con el tiempo medio de
+    filtrado ponderado por los bloques de cada uno.
+    """
+    filtros, medidos = {}, {}
+    for worker in workers:
+        for filtro, datos in worker.get("filters", {}).items():
+            total = filtros.setdefault(filtro, {"blocks": 0, "per_sec": 0.0, "filter_ms": None})
+            total["blocks"] += datos["blocks"]
+            total["per_sec"] = round(total["per_sec"] + datos["per_sec"], 2)
+            if datos.get("filter_ms") is not None:
+                suma, bloques = medidos.get(filtro, (0.0, 0))
+                medidos[filtro] = (suma + datos["filter_ms"] * datos["blocks"], bloques + datos["blocks"])
+    for filtro, (suma, bloques) in medidos.items():
+        filtros[filtro]["filter_ms"] = round(suma / bloques, 3) if bloques else None
+    return filtros
+
+# Estado del clúster: workers vivos (registro de latidos), capacidad y envíos
+@app.route("/cluster")
+def cluster_status():
+    estado = estado_cluster()
+    registrados = estado["registered"]
+    return jsonify({
+        "status": "ok",
+        "dispatch": DISPATCH_MODE,
+        "workers": estado["workers"],
+        "unregistered": estado["unregistered"],
+        "cores": estado["cores"],
+        "capacity": capacidad_cluster(estado),
+        "queue": sum(w.get("queue", 0) for w in registrados),
+        "filters": sumar_filtros(registrados),
+        "scheduler": envios.resumen(),
+        "registered": registrados,
+    })
+
 # Ruta para servir imágenes originales
 @app.route("/uploaded_images/<filename>")
 def uploaded_images(filename):
@@ -208,32 +951,78 @@ def processed_images(filename):
 @app.route("/result/<task_id>")
 def result_page(task_id):
     print(f"Accediendo a la página de resultados para la tarea {task_id}")
-    task = task_store.get(task_id)
+    task = buscar_tarea(task_id)
     if not task:
         return "Tarea no encontrada", 404
 
     original = task.get("original_filename")
     processed = task.get("processed_filename")
-    return render_template("results.html", task_id=task_id, original_filename=original, processed_filename=processed)
+    return render_template("results.html", task_id=task_id, original_filename=original, processed_filename=processed,
+                           large=task.get("large", False))
+
+def buscar_tarea(task_id):
+    """
+    Estado de una tarea desde cualquier proceso: el registro compartido en
+    Redis o, si ya venció, los metadatos guardados en data/tasks.
+    """
+    return compartido.leer(task_id) or task_store.get(task_id)
 
 # Endpoint para hacer polling y verificar si la tarea ya terminó
+def estado_tarea(task_id, task):
+    """Resumen del estado de una tarea, común a /status y a /events."""
+    # La tarea termina cuando la imagen final ya está guardada en disco
+    is_done = task.get("processed_filename") is not None
+    has_error = task.get("error", False)
+    has_retry = task.get("retries", 0) > 0
+
+    return {
+        "done": is_done or has_error,
+        "redirect": url_for("result_page", task_id=task_id) if is_done and not has_error else None,
+        "retry": has_retry,
+        "error": has_error,
+        # Progreso de la etapa en segundo plano y grilla elegida (si ya existe)
+        "state": task.get("state"),
+        "message": task.get("message"),
+        "plan": task.get("plan"),
+        "received": task.get("blocks_received", 0),
+        "total": task.get("total_blocks"),
+        "cached": task.get("cached", False),
+        "cached_blocks": task.get("cached_blocks", 0)
+    }
+
 @app.route("/status")
 def check_status():
     task_id = request.args.get("task_id")
-    task = task_store.get(task_id)
+    task = buscar_tarea(task_id)
     if not task:
         return jsonify({"done": False, "error": True, "message": "Tarea no encontrada"}), 404
+    return jsonify(estado_tarea(task_id, task))
 
-    is_done = task["blocks_received"] == task["total_blocks"]
-    has_error = task.get("error", False)
-    has_retry = task.get("retries", 0) > 0
+# Progreso de una tarea empujado por el servidor (Server-Sent Events): un
+# evento 'progress' por cambio y un evento final 'done' o 'error'
+@app.route("/events")
+def task_events():
+    task_id = request.args.get("task_id")
+    if not buscar_tarea(task_id):
+        return jsonify({"done": False, "error": True, "message": "Tarea no encontrada"}), 404
 
-    return jsonify({
-        "done": is_done or has_error,
-        "redirect": url_for("result_page", task_id=task_id) if is_done and not has_error else None,
-        "retry": has_retry,
-        "error": has_error
-    })
+    def leer_estado():
+        task = buscar_tarea(task_id)
+        if not task:
+            return "error", json.dumps({"done": True, "error": True,
+                                        "message": "Tarea no encontrada"}), True
+        estado = estado_tarea(task_id, task)
+        if estado["error"]:
+            evento = "error"
+        elif estado["done"]:
+            evento = "done"
+        else:
+            evento = "progress"
+        return evento, json.dumps(estado), estado["done"]
+
+    return Response(stream_with_context(progreso.eventos(task_id, leer_estado)),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route('/download/<filename>')
 def download_image(filename):
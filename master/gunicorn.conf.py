@@ -0,0 +1,35 @@
+# ------------------------------------------------------------------------------
+# ARCHIVO: gunicorn.conf.py
+# DESCRIPCIÓN: Configuración de gunicorn para el máster DisPix. El número de
+#              procesos se toma de DISPIX_MASTER_PROCESSES, la misma variable
+#              con la que app.py decide crear los lienzos en disco para que
+#              todos los procesos puedan escribir en ellos.
+# AUTOR: Alejandro Castro Martínez
+# FECHA DE CREACIÓN: 2026-10-18
+# ÚLTIMA MODIFICACIÓN: 2026-10-18
+# DEPENDENCIAS: gunicorn, os
+# CONTEXTO:
+#     - Proyecto DisPix.
+#     - Uso: gunicorn -c gunicorn.conf.py wsgi:app (desde master/).
+# ------------------------------------------------------------------------------
+
+import os
+
+bind = os.environ.get("DISPIX_BIND", "0.0.0.0:5000")
+
+# Procesos del máster (cada uno con su etapa de ingesta y su planificador de
+# reintentos para las tareas que recibió)
+workers = int(os.environ.get("DISPIX_MASTER_PROCESSES", 1))
+
+# Hilos por proceso: cada conexión abierta de /events ocupa uno
+worker_class = "gthread"
+threads = int(os.environ.get("DISPIX_MASTER_THREADS", 16))
+
+# Subidas grandes y guardado de imágenes pueden tardar
+timeout = 120
+
+# Cada proceso importa la aplicación por su cuenta: los hilos de fondo
+# (escucha de avisos, reintentos, ingesta) se crean después del fork
+preload_app = False
+
+accesslog = "-"
@@ -4,11 +4,13 @@ ARCHIVO: script.js
 DESCRIPCIÓN: Controla la lógica del frontend para la carga de imágenes,
              selección de filtros y visualización de pantallas en la interfaz
              web del sistema DisPix. También gestiona la espera del resultado
-             procesado mediante polling al backend.
+             procesado: el servidor empuja el progreso por Server-Sent
+             Events (/events) y, si el navegador no los soporta o la
+             conexión falla, se consulta /status periódicamente.
 AUTOR: Alejandro Castro Martínez
 FECHA DE CREACIÓN: 2025-04-17
-ÚLTIMA MODIFICACIÓN: 2025-04-17
-DEPENDENCIAS: HTML DOM, fetch API
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: HTML DOM, fetch API, EventSource
 CONTEXTO:
     - Proyecto DisPix.
     - Este script es cargado en la plantilla index.html para habilitar
@@ -28,10 +30,41 @@ function showScreen(screenId) {
 	document.getElementById("screen-" + screenId).classList.add("active");
 }
 
+/**
+ * Actualiza la pantalla de progreso con el estado de una tarea (el mismo
+ * formato en /status y en los eventos de /events). Devuelve true si la tarea
+ * terminó.
+ *
+ * @param {Object} data - Estado de la tarea enviado por el servidor.
+ * @returns {boolean}
+ */
+function showTaskState(data) {
+	// Mostrar la grilla elegida, su motivo y los bloques recibidos
+	if (data.plan) {
+		const planInfo = document.getElementById("plan-info");
+		const avance = data.total ? ` (${data.received}/${data.total} bloques)` : "";
+		planInfo.textContent = `Grilla ${data.plan.rows}x${data.plan.cols}: ${data.plan.reason}${avance}`;
+		planInfo.style.display = "block";
+	}
+
+	if (data.retry) {
+		const retryMsg = document.getElementById("retry-message");
+		if (retryMsg) retryMsg.style.display = "block";
+	}
+
+	if (!data.done) return false;
+	if (data.error) {
+		showScreen("error");
+	} else if (data.redirect) {
+		window.location.href = data.redirect;
+	}
+	return true;
+}
+
 /**
  * Función de polling que consulta al servidor cada 2 segundos
  * para verificar si el resultado ya está disponible.
- * Si lo está, redirige automáticamente a la página de resultados.
+ * Se usa solo como respaldo cuando no hay Server-Sent Events.
  * 
  * @param {string} taskId - Identificador único de la tarea que se está procesando.
  */
@@ -39,81 +72,111 @@ function pollForResult(taskId) {
 	fetch("/status?task_id=" + taskId)
 		.then(response => response.json())
 		.then(data => {
-			if (data.retry) {
-				const retryMsg = document.getElementById("retry-message");
-				if (retryMsg) retryMsg.style.display = "block";
-			}
-
-			if (data.done) {
-				if (data.error) {
-					showScreen("error");
-				} else if (data.redirect) {
-					window.location.href = data.redirect;
-				}
-			} else {
+			if (!showTaskState(data)) {
 				setTimeout(() => pollForResult(taskId), 2000);
 			}
 		});
 }
 
+/**
+ * Sigue una tarea con Server-Sent Events: el servidor envía un evento por
+ * cada avance y uno final ('done' o 'error'), así que la redirección ocurre
+ * apenas la imagen está lista. Si la conexión falla antes del final, se
+ * cierra y se continúa con polling.
+ *
+ * @param {string} taskId - Identificador único de la tarea que se está procesando.
+ */
+function followTask(taskId) {
+	if (!window.EventSource) {
+		pollForResult(taskId);
+		return;
+	}
+
+	const source = new EventSource("/events?task_id=" + encodeURIComponent(taskId));
+	const onEvent = (event) => {
+		if (showTaskState(JSON.parse(event.data))) source.close();
+	};
+	source.addEventListener("progress", onEvent);
+	source.addEventListener("done", onEvent);
+	source.addEventListener("error", (event) => {
+		// Evento 'error' del servidor (trae datos) o fallo de la conexión
+		if (event.data) {
+			onEvent(event);
+			return;
+		}
+		source.close();
+		pollForResult(taskId);
+	});
+}
+
 /**
  * Manejador del evento de envío del formulario de carga.
- * Lee la imagen seleccionada, la codifica en base64 y la envía
- * junto con el filtro seleccionado al backend usando fetch.
+ * Envía el archivo seleccionado sin codificar (cuerpo binario) junto con
+ * el filtro y el tamaño de bloque (en la query string) usando fetch.
  */
 document.getElementById("upload-form").addEventListener("submit", async function (e) {
 	e.preventDefault();
 
 	const imageInput = document.getElementById("image-input");
 	const filterSelect = document.getElementById("filter-select");
+	const chainSelect = document.getElementById("chain-select");
 	const blockSizeInput = document.getElementById("block-size-input");
+	const codecSelect = document.getElementById("codec-select");
+	const prioritySelect = document.getElementById("priority-select");
+	const qualitySelect = document.getElementById("quality-select");
+	const blockSizeAuto = document.getElementById("block-size-auto");
 
 	// Validación del archivo
 	if (imageInput.files.length === 0) return;
 
-	// Validación del tamaño del bloque
-	const blockSize = parseInt(blockSizeInput.value);
-	if (isNaN(blockSize) || blockSize < 1 || blockSize > 1024) {
+	// Validación del tamaño del bloque ("auto" deja la grilla al planificador del servidor)
+	const blockSize = blockSizeAuto.checked ? "auto" : parseInt(blockSizeInput.value);
+	if (blockSize !== "auto" && (isNaN(blockSize) || blockSize < 1 || blockSize > 1024)) {
 		alert("⚠️ El tamaño del bloque debe estar entre 1 y 1024 píxeles.");
 		return;
 	}
 
 	const file = imageInput.files[0];
-	const reader = new FileReader();
-
-	// Callback cuando se ha leído completamente el archivo como base64
-	reader.onload = async function () {
-		const imageBase64 = reader.result;
-
-		const formData = new FormData();
-		formData.append("image", imageBase64);
-		formData.append("filter", filterSelect.value);
-		formData.append("block_size", blockSize);  // 🧩 nuevo dato enviado
-
-		// Cambia la pantalla a modo progreso
-		showScreen("progress");
-
-		try {
-			// Envia imagen, filtro y tamaño de bloque al backend
-			const response = await fetch("/process", {
-				method: "POST",
-				body: formData,
-			});
-
-			const data = await response.json();
-			if (data.status === "ok") {
-				// 🆕 Extraer taskId del backend para hacer seguimiento independiente
-				const taskId = data.task_id;
-
-				// Si todo va bien, comienza a hacer polling para ver si ya terminó
-				pollForResult(taskId);
-			}
-		} catch (error) {
-			console.error("Error al enviar imagen:", error);
-			alert("Hubo un error al procesar la imagen.");
-		}
-	};
 
-	// Inicia la lectura del archivo como base64
-	reader.readAsDataURL(file);
+	// Los campos van en la query string y el archivo, tal cual, en el cuerpo:
+	// el servidor lo vuelca a disco sin base64 y responde de inmediato
+	const query = new URLSearchParams({
+		// Con un segundo filtro la tarea es una cadena ("sepia+pixelate")
+		filter: chainSelect.value ? filterSelect.value + "+" + chainSelect.value : filterSelect.value,
+		block_size: blockSize,
+		codec: codecSelect.value,  // vacío = códec por defecto del servidor
+		priority: prioritySelect.value,
+	});
+	// Con pérdida permitida, el códec es siempre el automático por bloque
+	if (qualitySelect.value) {
+		query.set("quality", qualitySelect.value);
+		query.set("codec", "auto");
+	}
+
+	// Cambia la pantalla a modo progreso
+	showScreen("progress");
+
+	try {
+		// Envía la imagen cruda al backend
+		const response = await fetch("/process?" + query.toString(), {
+			method: "POST",
+			headers: { "Content-Type": file.type || "application/octet-stream" },
+			body: file,
+		});
+
+		const data = await response.json();
+		if (data.status === "ok") {
+			// 🆕 Extraer taskId del backend para hacer seguimiento independiente
+			const taskId = data.task_id;
+
+			// Recibe el avance empujado por el servidor hasta que termine
+			followTask(taskId);
+		} else {
+			alert(data.message || "Hubo un error al procesar la imagen.");
+			showScreen("upload");
+		}
+	} catch (error) {
+		console.error("Error al enviar imagen:", error);
+		alert("Hubo un error al procesar la imagen.");
+	}
 });
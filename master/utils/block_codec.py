@@ -0,0 +1,311 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: block_codec.py
+DESCRIPCIÓN: Formato binario de transporte de bloques del sistema DisPix.
+             Reemplaza el esquema PNG + base64 + JSON por un mensaje compacto:
+
+               cabecera fija (24 bytes, little-endian)
+                   magia     4s   b"DPX1"
+                   versión   B
+                   códec     B    id del códec del payload
+                   dtype     B    id del tipo de dato de los píxeles
+                   ndim      B    2 (gris) o 3 (color)
+                   alto      I
+                   ancho     I
+                   canales   I
+                   len_meta  I
+               meta     JSON UTF-8 (task_id, block_id, filter, codec, ...)
+               payload  píxeles crudos o comprimidos con el códec indicado
+
+             Códecs: "raw" (sin compresión), "lz4" y "zstd" (opcionales,
+             si están instalados) y "png" (compatibilidad, sin base64).
+             Con "auto" la codificación se elige por bloque a partir de
+             estadísticas baratas de sus píxeles (ver elegir_codec):
+             "const" (bloque de un solo color: se envía un píxel), "lz4"
+             (muchas repeticiones), "png" (degradados suaves; el nivel por
+             defecto de OpenCV ya es el rápido), "raw" (ruido: comprimir no ahorra bytes) o, si la
+             política de calidad de la tarea lo permite, "jpeg" o "webp"
+             con pérdida. El mensaje conserva "auto" y la política en sus
+             metadatos, así el worker elige también por bloque al responder.
+
+             Varios mensajes pueden agruparse en un lote:
+               magia b"DPXB" + cantidad (I) + [longitud (I) + mensaje] * n
+             El lote se usa para subir resultados (/results/batch) y para
+             publicar juntos los bloques pequeños (un solo mensaje de Redis).
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, opencv-python (cv2), struct, json, lz4 (opcional),
+              zstandard (opcional)
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Existe una copia idéntica en workers/utils/block_codec.py; ambas deben
+      mantenerse sincronizadas porque máster y workers se despliegan por
+      separado.
+------------------------------------------------------------------------------
+"""
+
+import json
+import os
+import struct
+
+import cv2
+import numpy as np
+
+try:
+    import lz4.frame as _lz4
+except ImportError:  # lz4 es opcional
+    _lz4 = None
+
+try:
+    import zstandard as _zstd
+except ImportError:  # zstandard es opcional
+    _zstd = None
+
+MAGIA = b"DPX1"
+VERSION = 1
+CABECERA = struct.Struct("<4sBBBBIIII")
+
+MAGIA_LOTE = b"DPXB"
+_ENTERO = struct.Struct("<I")
+
+# Identificadores de códec y de tipo de dato en la cabecera
+CODECS = {"raw": 0, "lz4": 1, "zstd": 2, "png": 3, "const": 4, "jpeg": 5, "webp": 6}
+DTYPES = {0: np.uint8, 1: np.uint16, 2: np.float32}
+_CODEC_POR_ID = {v: k for k, v in CODECS.items()}
+_ID_POR_DTYPE = {np.dtype(v): k for k, v in DTYPES.items()}
+
+# Formato heredado (PNG + base64 dentro de JSON), aceptado todavía por el
+# máster y los workers para no romper despliegues mixtos
+CODEC_LEGADO = "json"
+
+# Selección por bloque (codec "auto")
+CODEC_ADAPTATIVO = "auto"
+# Calidad: "lossless" (por defecto) o "<jpeg|webp>:<1-100>" para permitir pérdida
+SIN_PERDIDA = "lossless"
+FORMATOS_CON_PERDIDA = {"jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY), "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY)}
+# Filas muestreadas por elegir_codec (una de cada PASO_MUESTRA)
+PASO_MUESTRA = 8
+# Fracción de vecinos horizontales iguales a partir de la cual conviene lz4
+UMBRAL_REPETICIONES = 0.5
+# Diferencia media entre vecinos (niveles) por debajo de la cual conviene PNG
+UMBRAL_SUAVE = 6.0
+
+
+def codecs_disponibles():
+    """Lista de códecs binarios utilizables en esta instalación."""
+    disponibles = ["raw", "png"]
+    if _lz4 is not None:
+        disponibles.append("lz4")
+    if _zstd is not None:
+        disponibles.append("zstd")
+    disponibles.append(CODEC_ADAPTATIVO)
+    return disponibles
+
+
+def codec_por_defecto():
+    """Códec usado cuando la tarea no indica uno (DISPIX_CODEC o auto)."""
+    return os.environ.get("DISPIX_CODEC") or CODEC_ADAPTATIVO
+
+
+def leer_calidad(calidad):
+    """
+    Interpreta la política de calidad de una tarea.
+
+    Returns:
+        tuple | None: (formato, calidad 1-100) si se permite pérdida, o None
+        para "lossless" (o vacío).
+
+    Raises:
+        ValueError: Si la política no es válida.
+    """
+    if not calidad or calidad == SIN_PERDIDA:
+        return None
+    formato, _, valor = calidad.partition(":")
+    if formato not in FORMATOS_CON_PERDIDA or not valor.isdigit() or not 1 <= int(valor) <= 100:
+        raise ValueError(f"Calidad inválida: {calidad} (use lossless, jpeg:1-100 o webp:1-100)")
+    return formato, int(valor)
+
+
+def elegir_codec(img, calidad=None):
+    """
+    Elige la codificación de un bloque con estadísticas de una muestra de
+    filas, mucho más baratas que comprimir:
+      - un solo color -> "const";
+      - muchos vecinos iguales (fondos, gráficos) -> "lz4" (o "png" sin lz4);
+      - con pérdida permitida -> el formato de la política ("jpeg"/"webp");
+      - vecinos parecidos (degradados) -> "png", cuya predicción aprovecha
+        lo que lz4 no encuentra;
+      - el resto (ruido, fotos con grano) -> "raw": comprimir no ahorra bytes.
+
+    Args:
+        img (np.ndarray): Bloque contiguo.
+        calidad (tuple): Resultado de leer_calidad (None = sin pérdida).
+    """
+    if img.size == 0:
+        return "raw"
+    # Un solo color: cada valor es igual al del píxel anterior (primero en
+    # la muestra y, si lo parece, en todo el bloque)
+    canales = img.size // (img.shape[0] * img.shape[1])
+    muestra = np.ascontiguousarray(img[::PASO_MUESTRA])
+    plano, todo = muestra.reshape(-1), img.reshape(-1)
+    if np.array_equal(plano[canales:], plano[:-canales]) and np.array_equal(todo[canales:], todo[:-canales]):
+        return "const"
+    if img.dtype != np.uint8:
+        return "raw"
+
+    izquierda, derecha = muestra[:, :-1], muestra[:, 1:]
+    if np.count_nonzero(izquierda == derecha) >= UMBRAL_REPETICIONES * izquierda.size:
+        return "lz4" if _lz4 is not None else "png"
+    if calidad is not None and canales in (1, 3):
+        return calidad[0]
+    diferencia = np.mean(cv2.mean(cv2.absdiff(izquierda, derecha))[:canales])
+    return "png" if diferencia <= UMBRAL_SUAVE else "raw"
+
+
+def codec_mensaje(data):
+    """Códec real del payload de un mensaje binario (el elegido, si era "auto")."""
+    return _CODEC_POR_ID[CABECERA.unpack_from(data)[2]]
+
+
+def es_binario(data):
+    """Indica si un mensaje usa el formato binario (frente al JSON heredado)."""
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:4]) == MAGIA
+
+
+def es_lote(data):
+    """Indica si un mensaje agrupa varios mensajes (ver empaquetar_lote)."""
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:4]) == MAGIA_LOTE
+
+
+def codificar_bloque(img, meta, codec="raw", calidad=None):
+    """
+    Serializa un bloque de imagen en el formato binario de DisPix.
+
+    Args:
+        img (np.ndarray): Bloque en formato OpenCV (alto x ancho [x canales]).
+        meta (dict): Metadatos serializables a JSON (task_id, block_id, ...).
+        codec (str): 'raw', 'lz4', 'zstd', 'png' o 'auto' (elegido por bloque).
+        calidad (str): Política de calidad de la tarea para 'auto'
+                       ('lossless', 'jpeg:85', 'webp:80'); viaja en los
+                       metadatos como 'quality'.
+
+    Returns:
+        bytes: Mensaje listo para publicarse en Redis o enviarse por HTTP.
+    """
+    if codec != CODEC_ADAPTATIVO and codec not in CODECS:
+        raise ValueError(f"Códec desconocido: {codec}")
+
+    img = np.ascontiguousarray(img)
+    if img.dtype not in _ID_POR_DTYPE:
+        raise ValueError(f"Tipo de dato no soportado: {img.dtype}")
+
+    # Con "auto" los metadatos guardan la política y la cabecera el códec real
+    politica = {"codec": codec}
+    if codec == CODEC_ADAPTATIVO:
+        perdida = leer_calidad(calidad)
+        if perdida is not None:
+            politica["quality"] = calidad
+        codec = elegir_codec(img, perdida)
+
+    if codec == "raw":
+        payload = img.data
+    elif codec == "lz4":
+        if _lz4 is None:
+            raise ValueError("El códec 'lz4' requiere el paquete lz4")
+        payload = _lz4.compress(img.data, compression_level=0)
+    elif codec == "zstd":
+        if _zstd is None:
+            raise ValueError("El códec 'zstd' requiere el paquete zstandard")
+        payload = _zstd.ZstdCompressor(level=1).compress(img.data)
+    elif codec == "const":
+        # Bloque de un solo color: basta con su primer píxel
+        payload = img.reshape(img.shape[0] * img.shape[1], -1)[0].tobytes()
+    elif codec in FORMATOS_CON_PERDIDA:
+        extension, opcion = FORMATOS_CON_PERDIDA[codec]
+        _, buffer = cv2.imencode(extension, img, [opcion, leer_calidad(calidad)[1]])
+        payload = buffer.data
+    else:
+        _, buffer = cv2.imencode(".png", img)
+        payload = buffer.data
+
+    h, w = img.shape[:2]
+    c = img.shape[2] if img.ndim == 3 else 1
+    meta_bytes = json.dumps({**meta, **politica}, separators=(",", ":")).encode("utf-8")
+
+    cabecera = CABECERA.pack(MAGIA, VERSION, CODECS[codec], _ID_POR_DTYPE[img.dtype],
+                             img.ndim, h, w, c, len(meta_bytes))
+    return b"".join((cabecera, meta_bytes, payload))
+
+
+def decodificar_bloque(data):
+    """
+    Deserializa un mensaje binario de DisPix.
+
+    Para 'raw' el arreglo devuelto es una vista de solo lectura sobre `data`
+    (sin copias); los filtros de OpenCV lo aceptan como entrada.
+
+    Returns:
+        tuple: (img (np.ndarray), meta (dict))
+    """
+    data = memoryview(data)
+    magia, version, codec_id, dtype_id, ndim, h, w, c, len_meta = CABECERA.unpack_from(data)
+    if magia != MAGIA or version != VERSION:
+        raise ValueError("Mensaje binario DisPix inválido")
+
+    inicio = CABECERA.size
+    meta = json.loads(bytes(data[inicio:inicio + len_meta]))
+    payload = data[inicio + len_meta:]
+
+    codec = _CODEC_POR_ID[codec_id]
+    dtype = DTYPES[dtype_id]
+    forma = (h, w, c) if ndim == 3 else (h, w)
+
+    if codec == "raw":
+        img = np.frombuffer(payload, dtype=dtype).reshape(forma)
+    elif codec == "lz4":
+        img = np.frombuffer(_lz4.decompress(payload), dtype=dtype).reshape(forma)
+    elif codec == "zstd":
+        img = np.frombuffer(_zstd.ZstdDecompressor().decompress(payload), dtype=dtype).reshape(forma)
+    elif codec == "const":
+        # Se llena la primera fila y se copia a las demás (más rápido que
+        # difundir un solo píxel a todo el bloque)
+        img = np.empty(forma, dtype=dtype)
+        if h:
+            img[0] = np.frombuffer(payload, dtype=dtype)
+            img[1:] = img[0]
+    else:
+        img = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_UNCHANGED).reshape(forma)
+
+    return img, meta
+
+
+def empaquetar_lote(mensajes):
+    """
+    Agrupa varios mensajes binarios en un solo cuerpo (un POST o un mensaje
+    de Redis en lugar de uno por bloque).
+    """
+    partes = [MAGIA_LOTE, _ENTERO.pack(len(mensajes))]
+    for m in mensajes:
+        partes.append(_ENTERO.pack(len(m)))
+        partes.append(m)
+    return b"".join(partes)
+
+
+def desempaquetar_lote(data):
+    """
+    Separa un lote en sus mensajes. Devuelve vistas (memoryview) sobre `data`,
+    sin copiar los píxeles.
+    """
+    data = memoryview(data)
+    if bytes(data[:4]) != MAGIA_LOTE:
+        raise ValueError("Lote binario DisPix inválido")
+    (cantidad,) = _ENTERO.unpack_from(data, 4)
+    pos = 8
+    mensajes = []
+    for _ in range(cantidad):
+        (largo,) = _ENTERO.unpack_from(data, pos)
+        pos += _ENTERO.size
+        mensajes.append(data[pos:pos + largo])
+        pos += largo
+    return mensajes
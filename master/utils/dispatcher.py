@@ -0,0 +1,124 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: dispatcher.py
+DESCRIPCIÓN: Despacho de los bloques de una tarea DisPix: recorta cada bloque
+             (con su halo) de la imagen de la tarea y lo publica en Redis con
+             sus metadatos. Lo usan tanto /process como la recuperación de
+             bloques faltantes; la imagen solo se retiene en memoria mientras
+             /process publica, y los reintentos la releen del archivo subido.
+             Los bloques cuyo resultado ya está en la caché de contenido
+             (utils/result_cache.py) no se publican, y con transporte por
+             memoria compartida (utils/shm_transport.py) el mensaje no lleva
+             píxeles. Los bloques de las tareas marcadas con 'pack' (las de
+             los trabajos por lotes) se agrupan con otros bloques pequeños
+             en un solo mensaje (EmpaquetadorBloques). En las tareas de
+             imagen grande la imagen es un archivo leído por regiones
+             (utils/large_image.py): cada bloque lee solo sus píxeles.
+             Las tareas que permiten pérdida (política 'quality' del códec
+             "auto") no usan la caché: sus resultados no son los exactos.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: opencv-python (cv2), utils.tiling, utils.redis_publisher,
+              utils.filter_specs, utils.result_cache, utils.metrics,
+              utils.large_image
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+------------------------------------------------------------------------------
+"""
+
+import cv2
+
+from utils.redis_publisher import publish_block
+from utils.tiling import generar_tiles, tile_por_id, indice_bloque, recortar_con_halo
+from utils.filter_specs import es_posicional
+from utils.result_cache import clave_bloque
+from utils.metrics import medir, clase_bloque
+from utils.large_image import abrir_por_regiones, formato_archivo
+
+
+def tiles_tarea(task):
+    """Genera perezosamente los bloques (Tile) de la grilla de la tarea."""
+    return generar_tiles(task["height"], task["width"], task["block_width"], task["block_height"])
+
+
+def tile_tarea(task, block_id):
+    """Devuelve el Tile de un bloque de la tarea a partir de su block_id."""
+    return tile_por_id(block_id, task["height"], task["width"], task["block_width"], task["block_height"])
+
+
+def indice_tarea(task, block_id):
+    """Posición del bloque en la grilla de la tarea (p. ej. para mapas de bits)."""
+    return indice_bloque(block_id, task["block_height"])
+
+
+def imagen_tarea(task):
+    """
+    Imagen original de la tarea: la que sigue en memoria (o en el segmento
+    compartido) o, si ya se liberó, la leída de nuevo desde el archivo subido.
+    Los .npy y TIFF se abren por regiones, sean grandes o no: cv2.imread no
+    lee los .npy (igual que en preparar_tarea, un TIFF sin tifffile se lee
+    con OpenCV).
+    """
+    imagen = task.get("image")
+    if imagen is None and formato_archivo(task["upload_path"]) is not None:
+        imagen = abrir_por_regiones(task["upload_path"])
+    if imagen is None:
+        imagen = cv2.imread(task["upload_path"], cv2.IMREAD_COLOR)
+    if imagen is None:
+        raise FileNotFoundError(f"No se pudo leer la imagen de la tarea {task['task_id']}")
+    return imagen
+
+
+def publicar_tile(task, tile, imagen=None, cache=None, paquete=None):
+    """
+    Recorta el bloque con su halo de la imagen de la tarea y lo publica.
+
+    Con `cache`, antes de publicar se busca el resultado por contenido del
+    bloque; si está, no se publica nada y se devuelve. Si no, la clave queda
+    en task["cache_keys"] para guardar el resultado cuando llegue.
+
+    Args:
+        task (dict): Estado de la tarea (filtro, parámetros, códec).
+        tile (Tile): Bloque a publicar.
+        imagen (np.ndarray): Imagen de la tarea; si se omite se obtiene con
+                             imagen_tarea (conviene pasarla al publicar
+                             varios bloques para no releer el archivo).
+        cache (CacheResultados): Caché de bloques (opcional).
+        paquete (EmpaquetadorBloques): Empaquetador para los bloques de las
+                                       tareas con 'pack' (opcional).
+
+    Returns:
+        np.ndarray | None: Bloque ya procesado si hubo acierto en la caché.
+    """
+    if imagen is None:
+        imagen = imagen_tarea(task)
+    # Clase de tamaño del bloque (etiqueta de las métricas); viaja en el
+    # mensaje para que worker y máster etiqueten igual sus etapas
+    clase = clase_bloque((tile.y1 - tile.y0, tile.x1 - tile.x0))
+    with medir("split", task["filter"], clase):
+        bloque, extra = recortar_con_halo(imagen, tile.y0, tile.y1, tile.x0, tile.x1, task["halo"])
+        extra["params"] = task["params"]
+        extra["t"] = {"block": clase}
+        if task.get("quality"):
+            extra["quality"] = task["quality"]
+
+    if task.get("shm") is not None:
+        # Transporte local: el mensaje lleva solo los segmentos y las
+        # coordenadas; el worker lee y escribe los píxeles en memoria compartida
+        extra["shm"] = task["shm"].descriptor()
+        extra["rect"] = [tile.y0, tile.y1, tile.x0, tile.x1]
+
+    if cache is not None and cache.activa and not task.get("quality"):
+        origen = extra["origin"] if es_posicional(task["filter"]) else None
+        with medir("cache_lookup", task["filter"], clase):
+            clave = clave_bloque(bloque, task["filter"], task["params"], extra["halo"], origen)
+            cacheado = cache.obtener(clave)
+        if cacheado is not None:
+            return cacheado
+        task["cache_keys"][tile.block_id] = clave
+
+    publish_block(task["task_id"], tile.block_id, task["filter"],
+                  None if "shm" in extra else bloque, codec=task["codec"], extra=extra,
+                  paquete=paquete if task.get("pack") else None)
+    return None
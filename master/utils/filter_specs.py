@@ -0,0 +1,164 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: filter_specs.py
+DESCRIPCIÓN: Descripción, del lado del máster, de los filtros que aplican los
+             workers de DisPix: parámetros por defecto, halo (píxeles de
+             vecindad que el filtro necesita leer alrededor de cada bloque
+             para que el resultado no tenga costuras) y costo relativo de
+             CPU por píxel (1 = negativo), usado por el planificador, y si
+             su resultado depende de la posición del bloque.
+             Cada filtro declara también los límites de sus parámetros
+             (enteros en un rango); el máster rechaza las tareas con valores
+             fuera de ellos antes de publicar nada, para que ningún bloque
+             falle en los workers.
+             Una tarea puede pedir una cadena de filtros ("sepia+pixelate"):
+             el worker aplica todos los pasos sobre el bloque en una sola
+             pasada, así que la cadena se describe como un filtro más, con
+             una lista de parámetros (uno por paso), la suma de los halos y
+             la suma de los costos.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: ninguna
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Debe mantenerse coherente con el registro FILTROS de
+      workers/utils/image_filters.py (halo y costo de cada filtro).
+------------------------------------------------------------------------------
+"""
+
+
+def _params_pixelate(alto_bloque, ancho_bloque):
+    # Conserva el aspecto original (~10 celdas por bloque), pero con un tamaño
+    # de celda único para toda la imagen, alineado a la grilla global
+    return {"cell": max(1, round(min(alto_bloque, ancho_bloque) / 10))}
+
+
+def _params_blur(alto_bloque, ancho_bloque):
+    # Radio fijo: el desenfoque debe verse igual sea cual sea la grilla
+    return {"radius": 2}
+
+
+FILTROS = {
+    "negative": {"halo": lambda params: 0, "costo": 1.0},
+    "sepia": {"halo": lambda params: 0, "costo": 4.0},
+    # Una celda cortada por el borde del bloque necesita hasta cell-1 píxeles
+    # del bloque vecino para promediarse igual que en la imagen completa
+    # Las celdas se alinean a la grilla global: el resultado depende de la
+    # posición del bloque (afecta a la clave de caché, ver result_cache.py)
+    "pixelate": {"halo": lambda params: params.get("cell", 1) - 1, "params": _params_pixelate, "costo": 6.0,
+                 "posicional": True, "limites": {"cell": (1, 256)}},
+    # El núcleo gaussiano de (2 * radius + 1) px lee radius píxeles vecinos
+    "blur": {"halo": lambda params: params.get("radius", 2), "params": _params_blur, "costo": 5.0,
+             "limites": {"radius": (0, 64)}},
+}
+
+# Separador de los pasos de una cadena de filtros en el nombre de la tarea
+SEPARADOR_CADENA = "+"
+
+
+def pasos_cadena(filtro):
+    """Nombres de los filtros de una cadena ("sepia+pixelate" -> ['sepia', 'pixelate'])."""
+    return filtro.split(SEPARADOR_CADENA)
+
+
+def es_cadena(filtro):
+    """Indica si el filtro de la tarea es una cadena de más de un paso."""
+    return SEPARADOR_CADENA in filtro
+
+
+def nombre_cadena(pasos):
+    """
+    Nombre de tarea y parámetros a partir de una cadena explícita, p. ej.
+    [{"filter": "sepia"}, {"filter": "pixelate", "params": {"cell": 8}}].
+    """
+    nombres = [paso["filter"] for paso in pasos]
+    params = [paso.get("params") or {} for paso in pasos]
+    if len(pasos) == 1:
+        return nombres[0], params[0]
+    return SEPARADOR_CADENA.join(nombres), params
+
+
+def filtros_desconocidos(filtro):
+    """Filtros (o pasos de una cadena) que no son conocidos (vacío si todos lo son)."""
+    return [f for f in pasos_cadena(filtro) if f not in FILTROS]
+
+
+def _params_pasos(filtro, params):
+    """Empareja cada paso de una cadena con sus parámetros (lista, o {} si faltan)."""
+    pasos = pasos_cadena(filtro)
+    params = params if isinstance(params, list) else []
+    return list(zip(pasos, params + [{}] * (len(pasos) - len(params))))
+
+
+def validar_parametros(filtro, params):
+    """
+    Comprueba los parámetros indicados por el usuario contra los límites de
+    cada filtro (en una cadena, los de cada paso): solo se admiten los
+    parámetros declarados, como enteros dentro de su rango.
+
+    Returns:
+        str | None: Mensaje de error, o None si son válidos.
+    """
+    if es_cadena(filtro):
+        for f, p in _params_pasos(filtro, params):
+            error = validar_parametros(f, p)
+            if error:
+                return error
+        return None
+    if not params:
+        return None
+    if not isinstance(params, dict):
+        return f"Los params del filtro '{filtro}' deben ser un objeto"
+    limites = FILTROS.get(filtro, {}).get("limites", {})
+    for nombre, valor in params.items():
+        if nombre not in limites:
+            return f"Parámetro desconocido para el filtro '{filtro}': {nombre}"
+        minimo, maximo = limites[nombre]
+        if isinstance(valor, bool) or not isinstance(valor, int) or not minimo <= valor <= maximo:
+            return f"{filtro}.{nombre} debe ser un entero entre {minimo} y {maximo}: {valor!r}"
+    return None
+
+
+def parametros_filtro(filtro, alto_bloque, ancho_bloque, params=None):
+    """
+    Completa los parámetros de un filtro con sus valores por defecto.
+
+    Args:
+        filtro (str): Nombre del filtro.
+        alto_bloque (int): Alto nominal de los bloques de la tarea.
+        ancho_bloque (int): Ancho nominal de los bloques de la tarea.
+        params (dict): Parámetros indicados por el usuario (opcional).
+
+    Returns:
+        dict | list: Parámetros efectivos del filtro (una lista, un dict por
+                     paso, si el filtro es una cadena).
+    """
+    if es_cadena(filtro):
+        return [parametros_filtro(f, alto_bloque, ancho_bloque, p) for f, p in _params_pasos(filtro, params)]
+    spec = FILTROS.get(filtro, {})
+    por_defecto = spec["params"](alto_bloque, ancho_bloque) if "params" in spec else {}
+    return {**por_defecto, **(params or {})}
+
+
+def halo_filtro(filtro, params):
+    """
+    Halo (en píxeles) que necesita el filtro con esos parámetros. En una
+    cadena, cada paso consume el halo que lee, así que se suman.
+    """
+    if es_cadena(filtro):
+        return sum(halo_filtro(f, p) for f, p in _params_pasos(filtro, params))
+    spec = FILTROS.get(filtro)
+    return spec["halo"](params) if spec else 0
+
+
+def costo_filtro(filtro):
+    """Costo relativo de CPU por píxel del filtro (1 si es desconocido)."""
+    if es_cadena(filtro):
+        return sum(costo_filtro(f) for f in pasos_cadena(filtro))
+    return FILTROS.get(filtro, {}).get("costo", 1.0)
+
+
+def es_posicional(filtro):
+    """Indica si el resultado del filtro (o de algún paso de la cadena) depende de la posición del bloque."""
+    return any(FILTROS.get(f, {}).get("posicional", False) for f in pasos_cadena(filtro))
@@ -1,63 +1,137 @@
 """
 ------------------------------------------------------------------------------
 ARCHIVO: image_reconstructor.py
-DESCRIPCIÓN: Este módulo se encarga de reconstruir una imagen completa a partir
-             de bloques individuales codificados en base64, los cuales han sido
-             procesados por los workers del sistema DisPix. La imagen final se
-             guarda como archivo PNG.
+DESCRIPCIÓN: Este módulo se encarga de reconstruir la imagen completa a partir
+             de los bloques procesados por los workers del sistema DisPix.
+             La reconstrucción es incremental: el lienzo de salida se reserva
+             al crear la tarea, cada bloque se escribe en su posición apenas
+             llega (y su copia codificada se descarta) y, al completarse la
+             tarea, un hilo escritor en segundo plano guarda el lienzo como
+             archivo PNG.
+             Con varios procesos de máster, el lienzo vive en un archivo
+             .npy mapeado en memoria para que cualquier proceso pueda
+             escribir en él. Las tareas de imagen grande (ver
+             utils/large_image.py) usan siempre ese lienzo en disco, y al
+             terminar el mismo archivo .npy pasa a ser el resultado, sin
+             cargarlo en memoria ni recomprimirlo como PNG.
 AUTOR: Alejandro Castro Martínez
 FECHA DE CREACIÓN: 2025-04-17
-ÚLTIMA MODIFICACIÓN: 2025-04-17
-DEPENDENCIAS: numpy, opencv-python (cv2), base64, os
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, opencv-python (cv2), base64, os, threading, queue
 CONTEXTO:
     - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
-    - Se utiliza desde el máster al recibir todos los bloques procesados.
+    - Se utiliza desde el máster al crear cada tarea y al recibir cada
+      bloque procesado.
 ------------------------------------------------------------------------------
 """
 
+import os
+import queue
+import threading
+
 import numpy as np
 import cv2
-import os
 from base64 import b64decode
 
-def reconstruir_y_guardar_imagen(received_data, output_path, num_rows=4, num_cols=4):
+# Cola del escritor en segundo plano (se inicia con el primer guardado)
+_cola_escritura = queue.Queue()
+_escritor = None
+_escritor_lock = threading.Lock()
+
+
+def crear_lienzo(alto, ancho, canales=3):
     """
-    Reconstruye una imagen a partir de bloques codificados en base64 y la guarda como PNG.
+    Reserva el lienzo de salida de una tarea.
 
     Args:
-        received_data (dict): Diccionario con los bloques recibidos, cuyas llaves son strings
-                              del tipo 'i_j' indicando su posición, y los valores son strings
-                              base64 representando imágenes en formato PNG o JPG.
-        output_path (str): Ruta donde se guardará la imagen final.
-        num_rows (int): Número de filas esperadas de bloques.
-        num_cols (int): Número de columnas esperadas de bloques.
+        alto (int): Alto de la imagen final.
+        ancho (int): Ancho de la imagen final.
+        canales (int): Canales de color.
+
+    Returns:
+        np.ndarray: Lienzo vacío (uint8) del tamaño final.
     """
+    return np.zeros((alto, ancho, canales), dtype=np.uint8)
+
+
+def crear_lienzo_en_disco(ruta, alto, ancho, canales=3):
+    """
+    Reserva el lienzo de salida en un archivo .npy mapeado en memoria, que
+    otros procesos del máster abren con abrir_lienzo_en_disco.
+    """
+    return np.lib.format.open_memmap(ruta, mode="w+", dtype=np.uint8, shape=(alto, ancho, canales))
+
+
+def abrir_lienzo_en_disco(ruta):
+    """Abre para escritura un lienzo creado con crear_lienzo_en_disco."""
+    return np.lib.format.open_memmap(ruta, mode="r+")
+
 
-    h_total, w_total = None, None  # Altura y ancho total de la imagen final
-    bloques = {}  # Almacena los bloques ya decodificados por posición (i, j)
+def decodificar_bloque_legado(b64data):
+    """Decodifica un bloque del formato heredado (PNG o JPG en base64)."""
+    img_bytes = b64decode(b64data)
+    return cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
 
-    # Decodificación y lectura de cada bloque
-    for block_id, b64data in received_data.items():
-        i, j = map(int, block_id.split("_"))  # Extrae posición i, j
-        img_bytes = b64decode(b64data)        # Decodifica base64 a bytes
-        block_img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
 
-        if block_img is not None:
-            bloques[(i, j)] = block_img
+def colocar_bloque(lienzo, tile, bloque):
+    """
+    Escribe un bloque procesado en sus coordenadas exactas dentro del lienzo.
 
-            # Determinar tamaño final si es la primera vez
-            if h_total is None or w_total is None:
-                bh, bw = block_img.shape[:2]
-                h_total, w_total = bh * num_rows, bw * num_cols
+    Args:
+        lienzo (np.ndarray): Lienzo de salida de la tarea.
+        tile (Tile): Coordenadas del bloque (ver utils/tiling.py).
+        bloque (np.ndarray): Bloque ya decodificado.
 
-    # Crear imagen vacía del tamaño final
-    full_image = np.zeros((h_total, w_total, 3), dtype=np.uint8)
+    Raises:
+        ValueError: Si el bloque no tiene el tamaño de su posición.
+    """
+    destino = lienzo[tile.y0:tile.y1, tile.x0:tile.x1]
+    if bloque.shape[:2] != destino.shape[:2]:
+        raise ValueError(f"Bloque {tile.block_id} de {bloque.shape[:2]} no encaja en {destino.shape[:2]}")
+    destino[...] = bloque
 
-    # Ubicar cada bloque en su posición correspondiente
-    for (i, j), block in bloques.items():
-        bh, bw = block.shape[:2]
-        full_image[i*bh:(i+1)*bh, j*bw:(j+1)*bw] = block
 
-    # Guardar imagen resultante en disco
-    cv2.imwrite(output_path, full_image)
+def guardar_lienzo(lienzo, output_path):
+    """
+    Guarda el lienzo como imagen en disco (de forma síncrona). Con una ruta
+    .npy, el lienzo debe estar en disco (crear_lienzo_en_disco): se vuelca
+    y su archivo se mueve a output_path.
+    """
+    if output_path.endswith(".npy"):
+        lienzo.flush()
+        os.replace(lienzo.filename, output_path)
+    else:
+        cv2.imwrite(output_path, lienzo)
     print(f"🖼️ Imagen reconstruida guardada en {output_path}")
+
+
+def guardar_lienzo_async(lienzo, output_path, al_terminar=None):
+    """
+    Encola el guardado del lienzo en el hilo escritor, para no retener la
+    petición HTTP del último worker mientras se comprime el PNG.
+
+    Args:
+        lienzo (np.ndarray): Lienzo completo de la tarea.
+        output_path (str): Ruta donde se guardará la imagen final.
+        al_terminar (callable): Se invoca con True tras guardar, o con False
+                                si el guardado falló.
+    """
+    global _escritor
+    with _escritor_lock:
+        if _escritor is None:
+            _escritor = threading.Thread(target=_escribir, daemon=True)
+            _escritor.start()
+    _cola_escritura.put((lienzo, output_path, al_terminar))
+
+
+def _escribir():
+    while True:
+        lienzo, output_path, al_terminar = _cola_escritura.get()
+        try:
+            guardar_lienzo(lienzo, output_path)
+            ok = True
+        except Exception as e:
+            print(f"❌ Error guardando {output_path}: {e}")
+            ok = False
+        if al_terminar:
+            al_terminar(ok)
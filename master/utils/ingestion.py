@@ -0,0 +1,99 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: ingestion.py
+DESCRIPCIÓN: Ingesta asíncrona de imágenes del máster DisPix. /process solo
+             vuelca la subida a disco (en trozos, sin cargarla entera en
+             memoria) y encola la tarea; la decodificación, la planificación
+             de la grilla y la publicación de los bloques ocurren en una
+             etapa en segundo plano con sus propios hilos, de modo que la
+             petición HTTP responde de inmediato con el task_id.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: base64, os, queue, threading
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por app.py (ruta /process).
+------------------------------------------------------------------------------
+"""
+
+import os
+import queue
+import threading
+from base64 import b64decode
+
+# Hilos que preparan y publican tareas en segundo plano
+HILOS_INGESTA = int(os.environ.get("DISPIX_INGEST_THREADS", 2))
+# Tamaño de los trozos al volcar una subida a disco
+TAM_TROZO = 1024 * 1024
+
+
+def guardar_flujo(flujo, ruta, tam_trozo=TAM_TROZO):
+    """
+    Copia un flujo binario (cuerpo de la petición o archivo multipart) a
+    disco por trozos.
+
+    Returns:
+        int: Bytes escritos.
+    """
+    total = 0
+    with open(ruta, "wb") as f:
+        while True:
+            trozo = flujo.read(tam_trozo)
+            if not trozo:
+                break
+            f.write(trozo)
+            total += len(trozo)
+    return total
+
+
+def trozos_archivo(ruta, tam_trozo=TAM_TROZO):
+    """Lee un archivo por trozos (p. ej. para calcular su hash sin cargarlo entero)."""
+    with open(ruta, "rb") as f:
+        while True:
+            trozo = f.read(tam_trozo)
+            if not trozo:
+                return
+            yield trozo
+
+
+def guardar_data_url(data_url, ruta):
+    """Guarda una imagen enviada como data URL en base64 (formato heredado)."""
+    _, codificado = data_url.split(",", 1)
+    datos = b64decode(codificado)
+    with open(ruta, "wb") as f:
+        f.write(datos)
+    return len(datos)
+
+
+class EtapaSegundoPlano:
+    """
+    Cola con hilos daemon que ejecutan `funcion(*args)` por cada elemento.
+    Los errores se informan con `al_fallar(args, error)`.
+
+    Args:
+        funcion (callable): Trabajo a ejecutar por cada elemento encolado.
+        hilos (int): Hilos de la etapa.
+        al_fallar (callable): Manejador de excepciones (opcional).
+    """
+
+    def __init__(self, funcion, hilos=HILOS_INGESTA, al_fallar=None):
+        self.funcion = funcion
+        self.al_fallar = al_fallar
+        self.cola = queue.Queue()
+        self.hilos = [threading.Thread(target=self._ejecutar, daemon=True) for _ in range(max(1, hilos))]
+        for hilo in self.hilos:
+            hilo.start()
+
+    def encolar(self, *args):
+        self.cola.put(args)
+
+    def _ejecutar(self):
+        while True:
+            args = self.cola.get()
+            try:
+                self.funcion(*args)
+            except Exception as e:
+                print(f"❌ Error en la etapa en segundo plano: {e}")
+                if self.al_fallar:
+                    self.al_fallar(args, e)
@@ -0,0 +1,173 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: jobs.py
+DESCRIPCIÓN: Trabajos por lotes del máster DisPix: muchas imágenes enviadas
+             juntas (p. ej. un directorio completo) con el mismo filtro.
+             Cada imagen es una tarea normal (planificación, caché, bloques,
+             reconstrucción); el trabajo solo agrupa sus tareas y lleva la
+             cuenta en Redis, para que cualquier proceso del máster pueda
+             agregar imágenes, registrar las terminadas y responder:
+               - 'dispix-job:<id>': hash con las opciones de las tareas, los
+                 contadores (imágenes enviadas, terminadas, fallidas,
+                 píxeles, bloques) y los instantes de inicio y fin.
+               - 'dispix-job:<id>:finished': lista de las imágenes
+                 terminadas en orden de llegada; quien sigue el trabajo la
+                 lee desde su última posición (p. ej. /jobs/<id>/events).
+             El trabajo termina cuando llegaron las `expected` imágenes
+             anunciadas y todas terminaron (bien o con error).
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: redis, json, time, utils.task_store
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por app.py (rutas /jobs) y por el cliente client/dispix_batch.py.
+------------------------------------------------------------------------------
+"""
+
+import json
+import time
+
+import redis
+
+from utils.task_store import TTL_TAREAS
+
+PREFIJO = "dispix-job:"
+
+# Contadores del hash del trabajo (HINCRBY)
+CONTADORES = ("submitted", "done", "failed", "pixels", "blocks_total", "blocks_received")
+
+
+class RegistroTrabajos:
+    """
+    Estado de los trabajos por lotes en Redis.
+
+    Args:
+        redis_cliente: Conexión Redis.
+        ttl (int): Segundos de vida de las claves de cada trabajo (se
+                   renueva con cada cambio).
+    """
+
+    def __init__(self, redis_cliente, ttl=TTL_TAREAS):
+        self.r = redis_cliente
+        self.ttl = ttl
+
+    def _clave(self, job_id, sufijo=""):
+        return PREFIJO + job_id + sufijo
+
+    def _renovar(self, pipe, job_id):
+        pipe.expire(self._clave(job_id), self.ttl)
+        pipe.expire(self._clave(job_id, ":finished"), self.ttl)
+
+    def crear(self, job_id, opciones, esperadas):
+        """
+        Registra un trabajo con las opciones comunes de sus tareas (filtro,
+        parámetros, códec, ...) y la cantidad de imágenes anunciadas.
+        """
+        pipe = self.r.pipeline()
+        pipe.hset(self._clave(job_id), mapping={
+            "options": json.dumps(opciones),
+            "expected": json.dumps(esperadas),
+            "start_time": json.dumps(time.time()),
+            **{c: 0 for c in CONTADORES},
+        })
+        self._renovar(pipe, job_id)
+        pipe.execute()
+
+    def opciones(self, job_id):
+        """Opciones de las tareas del trabajo, o None si no existe (o venció)."""
+        if not job_id:
+            return None
+        opciones = self.r.hget(self._clave(job_id), "options")
+        return json.loads(opciones) if opciones is not None else None
+
+    def agregar_imagenes(self, job_id, cantidad):
+        """
+        Reserva `cantidad` imágenes más del trabajo sin pasar de las
+        anunciadas (expected). La comprobación y la suma son atómicas (WATCH
+        sobre el hash y MULTI/EXEC), aunque lleguen tandas a varios procesos.
+
+        Returns:
+            int | None: Total enviado hasta ahora, o None si se excedería
+            expected (o el trabajo no existe); en ese caso no se suma nada.
+        """
+        clave = self._clave(job_id)
+        with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(clave)
+                    esperadas, enviadas = pipe.hmget(clave, "expected", "submitted")
+                    if esperadas is None or int(enviadas) + cantidad > json.loads(esperadas):
+                        pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    pipe.hincrby(clave, "submitted", cantidad)
+                    self._renovar(pipe, job_id)
+                    return pipe.execute()[0]
+                except redis.exceptions.WatchError:
+                    # Otra tanda cambió el trabajo entre la lectura y la suma
+                    continue
+
+    def sumar(self, job_id, campo, cantidad=1):
+        """Suma a un contador del trabajo (p. ej. bloques planificados o recibidos)."""
+        self.r.hincrby(self._clave(job_id), campo, cantidad)
+
+    def terminar_imagen(self, job_id, imagen):
+        """
+        Registra una imagen terminada (bien o con error) y, si era la última,
+        marca el fin del trabajo.
+
+        Args:
+            imagen (dict): name, task_id, state, processed_filename, width,
+                           height y seconds de la tarea.
+
+        Returns:
+            bool: True si el trabajo quedó completo.
+        """
+        clave = self._clave(job_id)
+        fallida = imagen.get("state") != "done"
+        pipe = self.r.pipeline()
+        pipe.rpush(self._clave(job_id, ":finished"), json.dumps(imagen))
+        pipe.hincrby(clave, "failed" if fallida else "done", 1)
+        pipe.hincrby(clave, "pixels", (imagen.get("width") or 0) * (imagen.get("height") or 0))
+        pipe.hmget(clave, "expected", "done", "failed")
+        self._renovar(pipe, job_id)
+        esperadas, hechas, fallidas = pipe.execute()[3]
+        completo = esperadas is not None and int(hechas) + int(fallidas) >= json.loads(esperadas)
+        if completo:
+            self.r.hsetnx(clave, "end_time", json.dumps(time.time()))
+        return completo
+
+    def terminadas(self, job_id, desde=0):
+        """Imágenes terminadas a partir de la posición `desde` (en orden de llegada)."""
+        return [json.loads(i) for i in self.r.lrange(self._clave(job_id, ":finished"), desde, -1)]
+
+    def resumen(self, job_id):
+        """
+        Progreso agregado del trabajo, o None si no existe: imágenes
+        enviadas, terminadas, fallidas y pendientes, bloques, tiempo
+        transcurrido y rendimiento (imágenes/s y megapíxeles/s).
+        """
+        datos = self.r.hgetall(self._clave(job_id))
+        if not datos:
+            return None
+        datos = {k.decode(): json.loads(v) for k, v in datos.items()}
+        terminadas = datos["done"] + datos["failed"]
+        fin = datos.get("end_time")
+        transcurrido = max((fin or time.time()) - datos["start_time"], 1e-6)
+        return {
+            "job_id": job_id,
+            "expected": datos["expected"],
+            "submitted": datos["submitted"],
+            "done": datos["done"],
+            "failed": datos["failed"],
+            "pending": datos["expected"] - terminadas,
+            "blocks_received": datos["blocks_received"],
+            "blocks_total": datos["blocks_total"],
+            "megapixels": round(datos["pixels"] / 1e6, 3),
+            "elapsed": round(transcurrido, 3),
+            "images_per_sec": round(terminadas / transcurrido, 3),
+            "megapixels_per_sec": round(datos["pixels"] / 1e6 / transcurrido, 3),
+            "complete": fin is not None,
+            "filter": datos["options"].get("filter"),
+        }
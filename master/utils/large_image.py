@@ -0,0 +1,130 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: large_image.py
+DESCRIPCIÓN: Lectura por regiones de imágenes muy grandes (gigapíxel) para
+             el máster DisPix. En lugar de decodificar la subida entera con
+             cv2.imdecode, las imágenes en formatos con acceso aleatorio se
+             abren sin leer sus píxeles:
+               - .npy (uint8, alto x ancho x 3 en orden BGR, como OpenCV):
+                 mapeado en memoria con np.load(mmap_mode="r").
+               - TIFF de 8 bits RGB (requiere tifffile): mapeado en memoria
+                 si no está comprimido; si no, se decodifican solo las
+                 teselas (o tiras) que tocan la región pedida.
+             El resultado se comporta como un arreglo de solo lectura
+             (shape y recorte con [y0:y1, x0:x1]), así que los bloques se
+             cortan de él igual que de una imagen en memoria, y el máster
+             solo retiene los píxeles de los bloques en vuelo.
+             Por encima de DISPIX_LARGE_IMAGE_MP megapíxeles la tarea usa el
+             modo de imagen grande: entrada por regiones y lienzo de salida
+             .npy mapeado en memoria, que es también el resultado final.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, os, tifffile (opcional)
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por app.py (preparación de tareas) y utils/dispatcher.py
+      (relectura de la imagen para los reintentos).
+------------------------------------------------------------------------------
+"""
+
+import os
+
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:  # tifffile es opcional (solo para entradas TIFF grandes)
+    tifffile = None
+
+# Megapíxeles a partir de los cuales una tarea usa el modo de imagen grande
+UMBRAL_GRANDE_MP = float(os.environ.get("DISPIX_LARGE_IMAGE_MP", 64))
+
+# Firmas de los formatos con lectura por regiones
+MAGIA_NPY = b"\x93NUMPY"
+MAGIAS_TIFF = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+
+
+def formato_archivo(ruta):
+    """'npy', 'tiff' o None según la firma del archivo (no su extensión)."""
+    with open(ruta, "rb") as f:
+        cabecera = f.read(8)
+    if cabecera.startswith(MAGIA_NPY):
+        return "npy"
+    if cabecera[:4] in MAGIAS_TIFF:
+        return "tiff"
+    return None
+
+
+def abrir_por_regiones(ruta):
+    """
+    Abre una imagen para leerla por regiones, sin cargar sus píxeles.
+
+    Returns:
+        np.memmap | LectorTiff | None: Imagen de solo lectura en BGR, o None
+        si el formato no admite lectura por regiones (o falta tifffile).
+
+    Raises:
+        ValueError: Si el .npy o el TIFF no son imágenes uint8 de 3 canales.
+    """
+    formato = formato_archivo(ruta)
+    if formato == "npy":
+        imagen = np.load(ruta, mmap_mode="r")
+        if imagen.dtype != np.uint8 or imagen.ndim != 3 or imagen.shape[2] != 3:
+            raise ValueError(f"El .npy debe ser uint8 (alto, ancho, 3) en BGR; es {imagen.dtype} {imagen.shape}")
+        return imagen
+    if formato == "tiff" and tifffile is not None:
+        return LectorTiff(ruta)
+    return None
+
+
+def es_grande(forma):
+    """Indica si una imagen de esta forma (alto, ancho, ...) usa el modo de imagen grande."""
+    return forma[0] * forma[1] >= UMBRAL_GRANDE_MP * 1e6
+
+
+class LectorTiff:
+    """
+    Primera página de un TIFF RGB de 8 bits leída por regiones. Cada lectura
+    abre el archivo y decodifica solo los segmentos (teselas o tiras) que se
+    cruzan con la región; si la página no está comprimida se mapea en memoria.
+    Las regiones se devuelven en BGR, como las de OpenCV.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with tifffile.TiffFile(ruta) as tif:
+            pagina = tif.pages[0]
+            if pagina.dtype != np.uint8 or pagina.samplesperpixel != 3 or pagina.planarconfig != 1:
+                raise ValueError("El TIFF debe ser RGB de 8 bits con canales intercalados")
+            self.pagina = pagina
+            self.shape = tuple(pagina.shape)
+            self.alto_segmento, self.ancho_segmento = pagina.chunks[:2]
+            self.columnas = pagina.chunked[1]
+            self.desplazamientos = pagina.dataoffsets
+            self.longitudes = pagina.databytecounts
+            # Sin compresión: mapeo directo (las regiones son vistas del archivo)
+            self.mapa = tifffile.memmap(ruta, page=0, mode="r") if pagina.is_memmappable else None
+
+    def __getitem__(self, clave):
+        filas, columnas = clave[:2]
+        y0, y1, _ = filas.indices(self.shape[0])
+        x0, x1, _ = columnas.indices(self.shape[1])
+        if self.mapa is not None:
+            return self.mapa[y0:y1, x0:x1, ::-1]
+
+        region = np.empty((y1 - y0, x1 - x0, 3), np.uint8)
+        ah, aw = self.alto_segmento, self.ancho_segmento
+        with open(self.ruta, "rb") as f:
+            for i in range(y0 // ah, (y1 - 1) // ah + 1):
+                for j in range(x0 // aw, (x1 - 1) // aw + 1):
+                    indice = i * self.columnas + j
+                    f.seek(self.desplazamientos[indice])
+                    datos = f.read(self.longitudes[indice])
+                    segmento, posicion, _ = self.pagina.decode(datos, indice, jpegtables=self.pagina.jpegtables)
+                    # Intersección del segmento (que puede venir relleno en los bordes) con la región
+                    sy, sx = posicion[2], posicion[3]
+                    ya, yb = max(y0, sy), min(y1, sy + ah, self.shape[0])
+                    xa, xb = max(x0, sx), min(x1, sx + aw, self.shape[1])
+                    region[ya - y0:yb - y0, xa - x0:xb - x0] = segmento[0, ya - sy:yb - sy, xa - sx:xb - sx]
+        return region[..., ::-1]
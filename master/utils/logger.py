@@ -2,22 +2,39 @@
 # ARCHIVO: utils/logger.py
 # DESCRIPCIÓN: Utilidad para registrar tiempos de procesamiento de tareas
 #              distribuidas en DisPix. Guarda la información en un archivo CSV.
+#              Las filas se acumulan en memoria y un hilo las escribe por
+#              lotes (cada INTERVALO_CSV segundos o al juntar MAX_FILAS_CSV),
+#              así que terminar una tarea no espera la escritura en disco.
 #
 # AUTOR: Alejandro Castro Martínez
 # FECHA: 17 de abril de 2025
-# DEPENDENCIAS: built-in (csv, os, datetime)
+# ÚLTIMA MODIFICACIÓN: 2026-10-18
+# DEPENDENCIAS: built-in (csv, os, time, threading, atexit)
 # ------------------------------------------------------------------------------
 
+import atexit
 import csv
 import os
+import threading
 import time
 
 # Ruta del archivo de log
 LOG_CSV_PATH = "data/logs/processing_times.csv"
 
+# Segundos máximos que una fila espera en memoria y filas por escritura
+INTERVALO_CSV = 2.0
+MAX_FILAS_CSV = 256
+
+_filas = []
+_hay_filas = threading.Condition()
+_lock_archivo = threading.Lock()
+_escritor = None
+
+
 def registrar_tiempo_procesamiento(task_id, image_size, block_size, num_blocks, filtro, start_time):
     """
     Registra en un archivo CSV el tiempo total de procesamiento de una tarea.
+    La fila se escribe en segundo plano junto con las de otras tareas.
 
     Parámetros:
         task_id (str): ID de la transacción.
@@ -30,10 +47,39 @@ def registrar_tiempo_procesamiento(task_id, image_size, block_size, num_blocks,
     Retorna:
         None
     """
-    print(f"Saving processing time for task {task_id}...")
+    global _escritor
     end_time = time.time()
     processing_time = (end_time - start_time)
 
+    fila = [
+        task_id,
+        f"{image_size[0]}x{image_size[1]}",
+        f"{block_size[0]}x{block_size[1]}",
+        num_blocks,
+        filtro,
+        f"{processing_time:.3f}"
+    ]
+    with _hay_filas:
+        _filas.append(fila)
+        if _escritor is None:
+            _escritor = threading.Thread(target=_escribir_periodicamente, daemon=True)
+            _escritor.start()
+            atexit.register(vaciar_csv)
+        if len(_filas) >= MAX_FILAS_CSV:
+            _hay_filas.notify()
+
+
+def vaciar_csv():
+    """Escribe en el CSV todas las filas pendientes."""
+    with _lock_archivo:
+        with _hay_filas:
+            filas = _filas[:]
+            del _filas[:]
+        if filas:
+            _anexar_filas(filas)
+
+
+def _anexar_filas(filas):
     file_exists = os.path.isfile(LOG_CSV_PATH)
 
     # Crear carpeta si no existe
@@ -46,11 +92,14 @@ def registrar_tiempo_procesamiento(task_id, image_size, block_size, num_blocks,
                 "task_id", "image_size", "block_size",
                 "num_blocks", "filter", "processing_time_sec"
             ])
-        writer.writerow([
-            task_id,
-            f"{image_size[0]}x{image_size[1]}",
-            f"{block_size[0]}x{block_size[1]}",
-            num_blocks,
-            filtro,
-            f"{processing_time:.3f}"
-        ])
+        writer.writerows(filas)
+
+
+def _escribir_periodicamente():
+    while True:
+        with _hay_filas:
+            _hay_filas.wait(INTERVALO_CSV)
+        try:
+            vaciar_csv()
+        except OSError as e:
+            print(f"⚠️ No se pudieron guardar los tiempos de procesamiento: {e}")
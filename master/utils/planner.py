@@ -0,0 +1,136 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: planner.py
+DESCRIPCIÓN: Planificador de la grilla de bloques del sistema DisPix. Elige
+             cuántas filas y columnas usar a partir del área de la imagen, el
+             costo relativo del filtro, los workers vivos (y sus núcleos,
+             según el registro de latidos) y un tamaño objetivo de bloque en
+             bytes, y explica el motivo de la elección. También valida las grillas pedidas manualmente.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: math, os, utils.filter_specs
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Se utiliza desde /process cuando block_size es "auto" (y para acotar
+      grillas manuales desproporcionadas).
+------------------------------------------------------------------------------
+"""
+
+import math
+import os
+
+from utils.filter_specs import costo_filtro
+
+# Tamaño objetivo de cada bloque (sin halo) para un filtro de costo 1
+TILE_BYTES_OBJETIVO = int(os.environ.get("DISPIX_TILE_BYTES", 256 * 1024))
+# Por debajo de este tamaño el costo fijo por mensaje domina al filtro
+TILE_BYTES_MINIMO = int(os.environ.get("DISPIX_TILE_MIN_BYTES", 16 * 1024))
+# Bloques por worker vivo (o por núcleo, si se conocen) para repartir la
+# carga sin dejar workers ociosos
+BLOQUES_POR_WORKER = 4
+# Límite absoluto de bloques por imagen
+MAX_BLOQUES = int(os.environ.get("DISPIX_MAX_TILES", 4096))
+
+
+def _grilla(n, alto, ancho):
+    """Reparte `n` bloques en filas x columnas respetando la proporción de la imagen."""
+    filas = max(1, min(alto, round(math.sqrt(n * alto / ancho))))
+    columnas = max(1, min(ancho, n // filas))
+    return filas, columnas
+
+
+def _plan(filas, columnas, alto, ancho, canales, workers, motivo):
+    # Tamaño del bloque más grande: con dimensiones no divisibles, algunos
+    # bloques tienen un píxel más (ver utils/tiling.py)
+    alto_tile, ancho_tile = math.ceil(alto / filas), math.ceil(ancho / columnas)
+    return {
+        "rows": filas,
+        "cols": columnas,
+        "tiles": filas * columnas,
+        "tile_height": alto_tile,
+        "tile_width": ancho_tile,
+        "tile_bytes": alto_tile * ancho_tile * canales,
+        "workers": workers,
+        "reason": motivo,
+    }
+
+
+def planificar_grilla(alto, ancho, filtro, workers_vivos, canales=3, halo=0,
+                      bytes_objetivo=TILE_BYTES_OBJETIVO, nucleos=None):
+    """
+    Elige la grilla de bloques para una imagen.
+
+    Criterios, en orden:
+      1. Bytes: bloques de ~bytes_objetivo / costo del filtro (los filtros
+         caros usan bloques más pequeños para repartir mejor su CPU).
+      2. Paralelismo: al menos BLOQUES_POR_WORKER bloques por worker vivo
+         (por núcleo, si se conocen), siempre que cada bloque siga
+         superando TILE_BYTES_MINIMO.
+      3. Halo: el lado de cada bloque debe ser al menos 4 veces el halo,
+         para que la vecindad reenviada no supere ~50% de sobrecosto.
+      4. Límite absoluto de MAX_BLOQUES.
+
+    Args:
+        alto (int), ancho (int): Dimensiones de la imagen.
+        filtro (str): Nombre del filtro (define su costo relativo).
+        workers_vivos (int): Workers conectados en este momento.
+        canales (int): Canales de color de la imagen.
+        halo (int): Halo en píxeles que necesita el filtro.
+        bytes_objetivo (int): Tamaño objetivo de bloque para costo 1.
+        nucleos (int): Procesos de filtrado de los workers vivos (registro
+                       de latidos); si se indica, el paralelismo se mide
+                       por núcleo en lugar de por worker.
+
+    Returns:
+        dict: Plan con rows, cols, tiles, tamaño de bloque y 'reason'.
+    """
+    bytes_imagen = alto * ancho * canales
+    costo = costo_filtro(filtro)
+    workers = max(1, workers_vivos)
+
+    objetivo = max(TILE_BYTES_MINIMO, bytes_objetivo / costo)
+    n = math.ceil(bytes_imagen / objetivo)
+    motivo = f"bloques de ~{objetivo / 1024:.0f} KiB para el filtro '{filtro}' (costo {costo:g})"
+
+    unidades = max(workers, nucleos or 0)
+    por_paralelismo = min(unidades * BLOQUES_POR_WORKER, bytes_imagen // TILE_BYTES_MINIMO)
+    if por_paralelismo > n:
+        n = por_paralelismo
+        if nucleos:
+            motivo = f"{BLOQUES_POR_WORKER} bloques por núcleo ({nucleos} núcleo(s) en {workers} worker(s))"
+        else:
+            motivo = f"{BLOQUES_POR_WORKER} bloques por worker vivo ({workers} worker(s))"
+
+    if halo:
+        lado_minimo = 4 * halo
+        por_halo = max(1, (alto // lado_minimo)) * max(1, (ancho // lado_minimo))
+        if por_halo < n:
+            n = por_halo
+            motivo = f"lado mínimo de {lado_minimo} px para acotar el halo de {halo} px"
+
+    if n > MAX_BLOQUES:
+        n = MAX_BLOQUES
+        motivo = f"límite de {MAX_BLOQUES} bloques por imagen"
+
+    if n <= 1:
+        return _plan(1, 1, alto, ancho, canales, workers,
+                     f"imagen pequeña ({bytes_imagen / 1024:.0f} KiB): un solo bloque")
+
+    filas, columnas = _grilla(n, alto, ancho)
+    return _plan(filas, columnas, alto, ancho, canales, workers, motivo)
+
+
+def validar_grilla(filas, columnas, alto, ancho, canales=3, workers_vivos=1):
+    """
+    Acota una grilla pedida manualmente: no más filas/columnas que píxeles
+    ni más de MAX_BLOQUES bloques.
+    """
+    motivo = "grilla indicada por el usuario"
+    filas_ok, columnas_ok = max(1, min(filas, alto)), max(1, min(columnas, ancho))
+    if filas_ok * columnas_ok > MAX_BLOQUES:
+        filas_ok, columnas_ok = _grilla(MAX_BLOQUES, alto, ancho)
+    if (filas_ok, columnas_ok) != (filas, columnas):
+        motivo = (f"grilla {filas}x{columnas} ajustada a {filas_ok}x{columnas_ok} "
+                  f"(máx. {MAX_BLOQUES} bloques y al menos 1 px por bloque)")
+    return _plan(filas_ok, columnas_ok, alto, ancho, canales, max(1, workers_vivos), motivo)
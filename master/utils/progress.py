@@ -0,0 +1,104 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: progress.py
+DESCRIPCIÓN: Avisos de progreso de las tareas del máster DisPix para el
+             endpoint de Server-Sent Events (/events).
+             Cada cambio de una tarea (bloque recibido, plan elegido, imagen
+             guardada, error) solo incrementa un contador de versión y
+             despierta a las conexiones abiertas de esa tarea; cada conexión
+             lee entonces el estado actual y lo envía. Si llegan muchos
+             bloques seguidos, los avisos intermedios se agrupan en un único
+             evento con el estado más reciente.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: threading, time, contextlib
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por app.py (avisos) y consumido por static/script.js.
+------------------------------------------------------------------------------
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Segundos mínimos entre dos eventos de progreso de una misma conexión
+INTERVALO_MIN = 0.1
+# Segundos sin cambios tras los que se envía un comentario de mantenimiento
+# (y se vuelve a leer el estado, por si algún cambio no generó aviso)
+INTERVALO_LATIDO = 15.0
+
+
+class _Oyentes:
+    """Versión de una tarea y número de conexiones que la esperan."""
+
+    def __init__(self):
+        self.condicion = threading.Condition()
+        self.version = 0
+        self.conexiones = 0
+
+
+class AvisosProgreso:
+    """
+    Registro de conexiones que esperan cambios en una tarea. Solo se guarda
+    estado para las tareas con alguna conexión abierta.
+    """
+
+    def __init__(self):
+        self.tareas = {}
+        self.lock = threading.Lock()
+
+    def notificar(self, task_id):
+        """Señala que la tarea cambió (no hace nada si nadie la observa)."""
+        oyentes = self.tareas.get(task_id)
+        if oyentes is None:
+            return
+        with oyentes.condicion:
+            oyentes.version += 1
+            oyentes.condicion.notify_all()
+
+    @contextmanager
+    def suscribir(self, task_id):
+        """Registra una conexión mientras dure el bloque `with`."""
+        with self.lock:
+            oyentes = self.tareas.setdefault(task_id, _Oyentes())
+            oyentes.conexiones += 1
+        try:
+            yield oyentes
+        finally:
+            with self.lock:
+                oyentes.conexiones -= 1
+                if oyentes.conexiones == 0:
+                    self.tareas.pop(task_id, None)
+
+    def eventos(self, task_id, leer_estado):
+        """
+        Generador de eventos SSE de una tarea. Envía el estado inicial y, a
+        continuación, uno por cada cambio (como mucho cada INTERVALO_MIN
+        segundos), hasta que la tarea termina.
+
+        Args:
+            task_id (str): Tarea observada.
+            leer_estado (callable): Devuelve (evento, datos_json, terminado)
+                                    con el estado actual de la tarea.
+        """
+        with self.suscribir(task_id) as oyentes:
+            version = -1
+            anterior = None
+            while True:
+                with oyentes.condicion:
+                    oyentes.condicion.wait_for(lambda: oyentes.version != version,
+                                               INTERVALO_LATIDO)
+                    version = oyentes.version
+
+                evento, datos, terminado = leer_estado()
+                if datos != anterior:
+                    anterior = datos
+                    yield f"event: {evento}\ndata: {datos}\n\n"
+                else:
+                    yield ": latido\n\n"
+                if terminado:
+                    return
+                # Agrupar los avisos que lleguen mientras tanto
+                time.sleep(INTERVALO_MIN)
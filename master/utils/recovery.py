@@ -1,45 +1,180 @@
 # ------------------------------------------------------------------------------
 # ARCHIVO: utils/recovery.py
-# DESCRIPCIÓN: Lógica de recuperación para bloques faltantes en DisPix. Verifica
-#                si todos los bloques han sido recibidos y reintenta publicar
-#                aquellos que no llegaron, hasta un máximo de reintentos.
+# DESCRIPCIÓN: Lógica de recuperación para bloques faltantes en DisPix. Un solo
+#                hilo planificador lleva un plazo (lease) por bloque publicado
+#                en un heap ordenado por vencimiento y vuelve a publicar
+#                únicamente los bloques vencidos, hasta un máximo de
+#                reintentos por bloque.
+#                El plazo se adapta a la latencia observada de cada filtro
+#                (media móvil exponencial de publicación -> resultado) y un
+#                bloque vencido solo se reenvía si su tarea dejó de recibir
+#                resultados: mientras la cola avanza, el plazo se renueva.
+#                Tampoco se reenvía (ni gasta reintentos) mientras no haya
+#                workers vivos: el bloque se publicaría sin nadie que lo
+#                reciba; se espera a que alguno se registre.
 # AUTOR: Alejandro Castro Martínez
 # FECHA: 2025-04-17
-# DEPENDENCIAS: threading, time
+# ÚLTIMA MODIFICACIÓN: 2026-10-18
+# DEPENDENCIAS: threading, time, heapq, itertools, utils.dispatcher
 # ------------------------------------------------------------------------------
 
+import heapq
+import itertools
 import threading
 import time
-from utils.redis_publisher import publish_block
-
-def iniciar_verificacion_recuperacion(task_ref):
-    threading.Thread(target=verificar_bloques_completos, args=(task_ref,), daemon=True).start()
-
-def verificar_bloques_completos(task_ref):
-    timeout_total = 30  # segundos
-    intervalo = 10       # cada cuanto revisar
-    intentos = timeout_total // intervalo
-
-    for _ in range(intentos):
-        if task_ref["blocks_received"] >= task_ref["blocks_sent"]:
-            return  # todo recibido
-        time.sleep(intervalo)
-
-    # revisar si faltaron bloques
-    missing = [
-        i for i in range(task_ref["blocks_sent"])
-        if str(i) not in task_ref["received_data"]
-    ]
-
-    if missing and task_ref.get("retries", 0) < task_ref.get("max_retries", 2):
-        task_ref["retries"] = task_ref.get("retries", 0) + 1
-        print(f"⚠️ Reintentando bloques faltantes: {missing}")
-
-        for i in missing:
-            bloque = task_ref["image_blocks"][i]
-            publish_block(bloque["task_id"], bloque["block_id"], bloque["filter"], bloque["data"])
-
-        verificar_bloques_completos(task_ref)  # vuelve a intentar
-    elif missing:
-        print(f"❌ Faltaron bloques incluso tras reintentos: {missing}")
-        task_ref["error"] = True
+from utils.dispatcher import tile_tarea, publicar_tile, imagen_tarea
+
+# Plazo inicial de un bloque, antes de observar latencias del filtro
+PLAZO_INICIAL = 30.0
+# Límites del plazo adaptativo (segundos)
+PLAZO_MIN = 2.0
+PLAZO_MAX = 120.0
+# Plazo = FACTOR_PLAZO x latencia media observada del filtro
+FACTOR_PLAZO = 4.0
+# Peso de cada nueva muestra en la media móvil de latencia
+ALFA_LATENCIA = 0.2
+
+
+class PlanificadorReintentos:
+    """
+    Plazos por bloque y reenvío de los vencidos, en un único hilo.
+
+    Args:
+        obtener_tarea (callable): Devuelve la tarea activa de un task_id, o
+                                  None si ya terminó o no existe.
+        al_cambiar (callable): Se llama con el task_id cuando una tarea
+                               pasa a reintentar bloques o falla (opcional).
+        hay_workers (callable): Indica si hay workers vivos; sin ellos los
+                                plazos vencidos se renuevan (opcional).
+    """
+
+    def __init__(self, obtener_tarea, al_cambiar=None, hay_workers=None):
+        self.obtener_tarea = obtener_tarea
+        self.al_cambiar = al_cambiar
+        self.hay_workers = hay_workers
+        self.heap = []
+        self.latencias = {}
+        self.secuencia = itertools.count()
+        self.condicion = threading.Condition()
+        self.hilo = None
+
+    def plazo(self, filtro):
+        """Plazo actual (segundos) para un bloque del filtro indicado."""
+        latencia = self.latencias.get(filtro)
+        if latencia is None:
+            return PLAZO_INICIAL
+        return min(PLAZO_MAX, max(PLAZO_MIN, FACTOR_PLAZO * latencia))
+
+    def registrar_envio(self, task, block_id):
+        """Abre (o renueva) el plazo de un bloque recién publicado."""
+        ahora = time.time()
+        with task["lock"]:
+            _, intentos = task["leases"].get(block_id, (ahora, 0))
+            task["leases"][block_id] = (ahora, intentos + 1)
+        self._programar(ahora + self.plazo(task["filter"]), task["task_id"], block_id)
+
+    def confirmar(self, task, block_id):
+        """
+        Cierra el plazo de un bloque cuyo resultado llegó y actualiza la
+        latencia del filtro. Devuelve False si el bloque ya estaba cerrado.
+        """
+        with task["lock"]:
+            lease = task["leases"].pop(block_id, None)
+        if lease is None:
+            return False
+        latencia = time.time() - lease[0]
+        anterior = self.latencias.get(task["filter"], latencia)
+        self.latencias[task["filter"]] = (1 - ALFA_LATENCIA) * anterior + ALFA_LATENCIA * latencia
+        return True
+
+    def _programar(self, vence, task_id, block_id):
+        with self.condicion:
+            heapq.heappush(self.heap, (vence, next(self.secuencia), task_id, block_id))
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._bucle, daemon=True)
+                self.hilo.start()
+            elif self.heap[0][2:] == (task_id, block_id):
+                # El nuevo plazo es el más próximo: despertar al hilo
+                self.condicion.notify()
+
+    def _bucle(self):
+        while True:
+            with self.condicion:
+                while not self.heap or self.heap[0][0] > time.time():
+                    espera = self.heap[0][0] - time.time() if self.heap else None
+                    self.condicion.wait(espera)
+                vencidos = []
+                while self.heap and self.heap[0][0] <= time.time():
+                    vencidos.append(heapq.heappop(self.heap))
+
+            # Agrupar por tarea para leer su imagen una sola vez
+            por_tarea = {}
+            for _, _, task_id, block_id in vencidos:
+                por_tarea.setdefault(task_id, []).append(block_id)
+            for task_id, bloques in por_tarea.items():
+                try:
+                    self._revisar(task_id, bloques)
+                except Exception as e:
+                    print(f"❌ Error revisando bloques de la tarea {task_id}: {e}")
+                    self._fallar(task_id, bloques, e)
+
+    def _revisar(self, task_id, bloques):
+        task = self.obtener_tarea(task_id)
+        if task is None or task.get("error"):
+            return
+
+        ahora = time.time()
+        plazo = self.plazo(task["filter"])
+        # Intentos de cada bloque que sigue abierto, leídos con el lock: un
+        # resultado puede cerrar su plazo mientras tanto
+        with task["lock"]:
+            intentos = {b: task["leases"][b][1] for b in bloques if b in task["leases"]}
+        pendientes = list(intentos)
+        if not pendientes:
+            return
+
+        # La tarea sigue recibiendo resultados (la cola avanza) o no hay
+        # workers que puedan recibir el reenvío: se renueva el plazo
+        if (ahora - task.get("last_received", task["start_time"]) < plazo
+                or (self.hay_workers is not None and not self.hay_workers())):
+            for block_id in pendientes:
+                self._programar(ahora + plazo, task_id, block_id)
+            return
+
+        agotados = [b for b in pendientes if intentos[b] > task.get("max_retries", 1)]
+        if agotados:
+            print(f"❌ Faltaron bloques incluso tras reintentos: {agotados}")
+            task["error"] = True
+            self._avisar(task_id)
+            return
+
+        task["retries"] = task.get("retries", 0) + 1
+        self._avisar(task_id)
+        print(f"⚠️ Reintentando bloques vencidos: {pendientes}")
+
+        # Los bloques se vuelven a recortar de la imagen subida, leída una vez
+        imagen = imagen_tarea(task)
+        for block_id in pendientes:
+            publicar_tile(task, tile_tarea(task, block_id), imagen)
+            self.registrar_envio(task, block_id)
+
+    def _fallar(self, task_id, bloques, error):
+        """
+        No se pudieron revisar o reenviar los bloques vencidos: la tarea
+        termina con error. Si ni siquiera se puede marcar (p. ej. sin Redis),
+        los plazos vuelven al heap y se revisan más tarde.
+        """
+        try:
+            task = self.obtener_tarea(task_id)
+            if task is not None and not task.get("error"):
+                task["error"] = True
+                task["message"] = f"No se pudieron reenviar los bloques vencidos: {error}"
+                self._avisar(task_id)
+        except Exception as e:
+            print(f"⚠️ No se pudo marcar la tarea {task_id} como fallida: {e}")
+            for block_id in bloques:
+                self._programar(time.time() + PLAZO_MIN, task_id, block_id)
+
+    def _avisar(self, task_id):
+        if self.al_cambiar is not None:
+            self.al_cambiar(task_id)
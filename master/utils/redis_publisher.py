@@ -1,50 +1,319 @@
 """
 ------------------------------------------------------------------------------
 ARCHIVO: redis_publisher.py
-DESCRIPCIÓN: Publica tareas individuales en el canal Redis del sistema DisPix.
-             Cada tarea contiene un bloque de imagen codificado en base64,
-             junto con el ID de tarea, ID de bloque y filtro a aplicar.
+DESCRIPCIÓN: Publica tareas individuales en Redis para el sistema DisPix.
+             Cada tarea contiene un bloque de imagen en el formato binario de
+             utils/block_codec.py (o PNG + base64 + JSON con el códec
+             heredado "json"), junto con el ID de tarea, ID de bloque y
+             filtro a aplicar.
+             Soporta dos modos de despacho:
+               - "pubsub": se publica en el canal 'dispix-tasks' y TODOS los
+                 workers suscritos reciben cada bloque (modo original).
+               - "queue": se agrega a un Redis Stream consumido por un grupo
+                 de consumidores; cada bloque es reclamado y confirmado por
+                 un único worker (consumidores en competencia).
+             Los bloques pequeños (p. ej. las imágenes chicas de un trabajo
+             por lotes) pueden agruparse con EmpaquetadorBloques: varios
+             mensajes viajan en un solo mensaje de Redis (lote DPXB de
+             utils/block_codec.py) y el worker los separa al leerlos.
+             estado_cluster resume los workers vivos y sus núcleos a partir
+             del registro de latidos (utils/worker_registry.py).
 AUTOR: Alejandro Castro Martínez
 FECHA DE CREACIÓN: 2025-04-17
-ÚLTIMA MODIFICACIÓN: 2025-04-17
-DEPENDENCIAS: redis, json, base64, opencv-python (cv2)
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: redis, json, base64, opencv-python (cv2), os, time, threading,
+              utils.block_codec, utils.metrics, utils.worker_registry
 CONTEXTO:
     - Proyecto DisPix: sistema distribuido para procesamiento de imágenes.
     - Este módulo es invocado por el máster para publicar tareas que
-      serán recibidas por los workers mediante suscripción al canal Redis.
+      serán recibidas por los workers mediante Redis.
 ------------------------------------------------------------------------------
 """
 
 import redis
 import json
 import base64
+import os
+import time
+import threading
 import cv2
 
-# Configura la conexión al servidor Redis (puerto y host por defecto)
-r = redis.Redis(host="localhost", port=6379, db=0)
+from utils.block_codec import codificar_bloque, codec_por_defecto, codec_mensaje, empaquetar_lote, CODEC_LEGADO
+from utils.metrics import observar, observar_codec
+from utils.worker_registry import leer_workers
 
-def publish_block(task_id, block_id, filtro, block_image):
+# Configuración de Redis y del modo de despacho (sobrescribible por entorno)
+REDIS_HOST = os.environ.get("DISPIX_REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("DISPIX_REDIS_PORT", 6379))
+DISPATCH_MODE = os.environ.get("DISPIX_DISPATCH_MODE", "pubsub")
+
+# Nombres compartidos con los workers
+CANAL_TAREAS = "dispix-tasks"
+STREAM_TAREAS = "dispix-tasks-stream"
+GRUPO_WORKERS = "dispix-workers"
+
+MODOS_DESPACHO = ("pubsub", "queue")
+
+# Empaquetado de bloques pequeños: mensajes por paquete, bytes por paquete
+# (un mensaje más grande se publica solo) y espera máxima (s) de un bloque
+# a que se complete su paquete
+PAQUETE_MAX_BLOQUES = int(os.environ.get("DISPIX_PACK_BLOCKS", 32))
+PAQUETE_MAX_BYTES = int(os.environ.get("DISPIX_PACK_BYTES", 512 * 1024))
+PAQUETE_ESPERA = float(os.environ.get("DISPIX_PACK_DELAY_MS", 10)) / 1000
+
+# Configura la conexión al servidor Redis
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+
+_grupo_creado = False
+
+
+def asegurar_grupo(conexion=r):
+    """
+    Crea el stream de tareas y su grupo de consumidores si aún no existen.
+
+    El grupo se crea desde el ID "0" para que los bloques agregados antes de
+    que se conecte cualquier worker no se pierdan (a diferencia de pub/sub).
     """
-    Publica una tarea de bloque en el canal Redis como un mensaje JSON.
+    try:
+        conexion.xgroup_create(STREAM_TAREAS, GRUPO_WORKERS, id="0", mkstream=True)
+    except redis.exceptions.ResponseError as e:
+        # BUSYGROUP: el grupo ya existe, no es un error
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def contar_workers_vivos(modo=None):
+    """
+    Estima cuántos workers están conectados en el modo de despacho dado:
+    suscriptores del canal (pubsub) o consumidores del grupo que leyeron del
+    stream en el último minuto (queue). Devuelve 0 si Redis no responde.
+    """
+    modo = modo or DISPATCH_MODE
+    try:
+        if modo == "queue":
+            consumidores = r.xinfo_consumers(STREAM_TAREAS, GRUPO_WORKERS)
+            return sum(1 for c in consumidores if c["idle"] < 60000)
+        return dict(r.pubsub_numsub(CANAL_TAREAS)).get(CANAL_TAREAS.encode(), 0)
+    except redis.exceptions.RedisError:
+        return 0
+
+
+def estado_cluster(modo=None):
+    """
+    Workers vivos del modo de despacho dado según el registro de latidos
+    (utils/worker_registry.py). Si ningún worker late (versiones
+    anteriores), se estiman con contar_workers_vivos.
+
+    En pubsub cuentan los suscritos al canal: un bloque publicado sin
+    suscriptores se pierde aunque haya workers registrados, y los suscritos
+    que no laten cuentan con la capacidad por defecto.
+
+    Returns:
+        dict: workers (vivos), registered (estados de los que laten),
+              unregistered (vivos sin latido), cores (procesos de filtrado)
+              y broadcast (True en pubsub: todos reciben todos los bloques).
+    """
+    modo = modo or DISPATCH_MODE
+    try:
+        registrados = [w for w in leer_workers(r) if w.get("dispatch") == modo]
+    except redis.exceptions.RedisError:
+        registrados = []
+    if modo == "pubsub":
+        vivos = contar_workers_vivos(modo)
+    else:
+        # Los consumidores del grupo siguen activos un minuto después de caer:
+        # si hay latidos, el registro manda
+        vivos = len(registrados) or contar_workers_vivos(modo)
+    registrados = registrados[:vivos]
+    sin_latido = vivos - len(registrados)
+    nucleos = [w.get("cores", 1) for w in registrados] + [1] * sin_latido
+    return {
+        "workers": vivos,
+        "registered": registrados,
+        "unregistered": sin_latido,
+        # En pubsub cada worker filtra todos los bloques: el paralelismo es el de uno
+        "cores": (max(nucleos) if modo == "pubsub" else sum(nucleos)) if nucleos else 0,
+        "broadcast": modo == "pubsub",
+    }
+
+
+def enviar_mensaje(message, modo=None):
+    """Publica un mensaje ya codificado en el canal (pubsub) o en el stream (queue)."""
+    global _grupo_creado
+    modo = modo or DISPATCH_MODE
+    if modo == "queue":
+        # Agregar al stream: un solo worker del grupo reclamará el bloque
+        if not _grupo_creado:
+            asegurar_grupo()
+            _grupo_creado = True
+        r.xadd(STREAM_TAREAS, {"data": message})
+    else:
+        # Publicar mensaje al canal de tareas (difusión a todos los workers)
+        r.publish(CANAL_TAREAS, message)
+
+
+def publish_block(task_id, block_id, filtro, block_image, modo=None, codec=None, extra=None, paquete=None):
+    """
+    Publica una tarea de bloque en Redis.
 
     Args:
         task_id (str): ID global de la tarea.
         block_id (str): ID del bloque (ej: '0_1') según su posición.
         filtro (str): Filtro a aplicar (ej: 'negative', 'blur', etc.).
-        block_image (np.ndarray): Bloque de imagen en formato OpenCV.
+        block_image (np.ndarray): Bloque de imagen en formato OpenCV, o None
+                                  para un mensaje sin píxeles (transporte por
+                                  memoria compartida: el worker lee el
+                                  bloque de la imagen indicada en 'extra').
+        modo (str): 'pubsub' o 'queue'. Si es None se usa DISPATCH_MODE.
+        codec (str): Códec del bloque ('raw', 'lz4', 'zstd', 'png', 'auto'
+                     o el heredado 'json'). Si es None se usa el códec por
+                     defecto. El worker responde con el mismo códec (con
+                     'auto', eligiendo también por bloque).
+        extra (dict): Metadatos adicionales del bloque (p. ej. 'halo',
+                      'origin' y 'params' del filtro; ver utils/tiling.py)
+                      y 'quality', la política de calidad del códec 'auto'.
+                      Si trae 't' (tiempos del bloque), se le agrega 'ts':
+                      el instante de publicación, con el que el worker mide
+                      la espera en cola.
+        paquete (EmpaquetadorBloques): Si se indica y el mensaje es pequeño,
+                                       se agrupa con otros en lugar de
+                                       publicarse solo.
     """
+    codec = codec or codec_por_defecto()
 
-    # Codificar el bloque como imagen PNG en base64 para transmitirlo como texto
-    _, buffer = cv2.imencode(".png", block_image)
-    block_base64 = base64.b64encode(buffer).decode("utf-8")
+    inicio = time.perf_counter()
+    extra = dict(extra or {})
+    # Política de calidad del códec 'auto': viaja dentro de los metadatos del códec
+    calidad = extra.pop("quality", None)
+    if "t" in extra:
+        extra["t"] = {**extra["t"], "ts": time.time()}
+    clase = extra.get("t", {}).get("block", "0")
 
-    # Armar el mensaje en formato JSON
-    message = {
-        "task_id": task_id,
-        "block_id": block_id,
-        "filter": filtro,
-        "block_data": block_base64
-    }
+    if block_image is None:
+        # Solo coordenadas y metadatos: los píxeles están en memoria compartida
+        message = json.dumps({
+            "task_id": task_id,
+            "block_id": block_id,
+            "filter": filtro,
+            **(extra or {}),
+        })
+    elif codec == CODEC_LEGADO:
+        # Codificar el bloque como imagen PNG en base64 para transmitirlo como texto
+        _, buffer = cv2.imencode(".png", block_image)
+        block_base64 = base64.b64encode(buffer).decode("utf-8")
+
+        # Armar el mensaje en formato JSON
+        message = json.dumps({
+            "task_id": task_id,
+            "block_id": block_id,
+            "filter": filtro,
+            **(extra or {}),
+            "block_data": block_base64
+        })
+    else:
+        # Mensaje binario: cabecera + metadatos + píxeles (sin base64)
+        message = codificar_bloque(block_image, {
+            "task_id": task_id,
+            "block_id": block_id,
+            "filter": filtro,
+            **(extra or {}),
+        }, codec, calidad)
+
+    codificado = time.perf_counter()
+    observar("encode", codificado - inicio, filtro, clase)
+    if block_image is not None and codec != CODEC_LEGADO:
+        observar_codec(codec_mensaje(message), codificado - inicio, block_image.nbytes, len(message), clase)
+
+    if paquete is not None and len(message) < paquete.max_bytes:
+        paquete.agregar(message, filtro, clase)
+        return
+    enviar_mensaje(message, modo)
+    observar("publish", time.perf_counter() - codificado, filtro, clase)
+
+
+class EmpaquetadorBloques:
+    """
+    Agrupa mensajes de bloques pequeños en un solo mensaje de Redis.
+
+    Un paquete se publica cuando junta `max_bloques` mensajes o `max_bytes`
+    bytes, o cuando su primer mensaje lleva `max_espera` segundos esperando
+    (como los lotes de subida del worker, utils/result_uploader.py). Un
+    paquete de un solo mensaje se publica tal cual, sin envoltorio.
+
+    Args:
+        max_bloques (int): Mensajes por paquete como máximo.
+        max_bytes (int): Bytes por paquete como máximo.
+        max_espera (float): Segundos que puede esperar un mensaje.
+        modo (str): 'pubsub' o 'queue'. Si es None se usa DISPATCH_MODE.
+    """
+
+    def __init__(self, max_bloques=PAQUETE_MAX_BLOQUES, max_bytes=PAQUETE_MAX_BYTES,
+                 max_espera=PAQUETE_ESPERA, modo=None):
+        self.max_bloques = max_bloques
+        self.max_bytes = max_bytes
+        self.max_espera = max_espera
+        self.modo = modo
+        self.mensajes = []
+        self.etiquetas = []
+        self.bytes = 0
+        self.primero = 0.0
+        self.condicion = threading.Condition()
+        self.hilo = None
+
+    def agregar(self, message, filtro, clase):
+        """Agrega un mensaje codificado; publica el paquete si quedó lleno."""
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        with self.condicion:
+            if self.bytes + len(message) > self.max_bytes:
+                # No entra: sale primero lo que ya estaba esperando
+                self._enviar(self._tomar())
+            if not self.mensajes:
+                self.primero = time.time()
+            self.mensajes.append(message)
+            self.etiquetas.append((filtro, clase))
+            self.bytes += len(message)
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._bucle, daemon=True)
+                self.hilo.start()
+            if len(self.mensajes) >= self.max_bloques:
+                self._enviar(self._tomar())
+            else:
+                self.condicion.notify()
+
+    def vaciar(self):
+        """Publica de inmediato lo que esté esperando."""
+        with self.condicion:
+            self._enviar(self._tomar())
+
+    def _tomar(self):
+        paquete = (self.mensajes, self.etiquetas)
+        self.mensajes, self.etiquetas, self.bytes = [], [], 0
+        return paquete
+
+    def _enviar(self, paquete):
+        # Se publica con el lock tomado: los paquetes salen en orden
+        mensajes, etiquetas = paquete
+        if not mensajes:
+            return
+        inicio = time.perf_counter()
+        try:
+            enviar_mensaje(mensajes[0] if len(mensajes) == 1 else empaquetar_lote(mensajes), self.modo)
+        except redis.exceptions.RedisError as e:
+            # Los bloques perdidos se reenvían al vencer su plazo (utils/recovery.py)
+            print(f"❌ Error publicando un paquete de {len(mensajes)} bloques: {e}")
+            return
+        duracion = (time.perf_counter() - inicio) / len(mensajes)
+        for filtro, clase in etiquetas:
+            observar("publish", duracion, filtro, clase)
 
-    # Publicar mensaje al canal de tareas
-    r.publish("dispix-tasks", json.dumps(message))
+    def _bucle(self):
+        while True:
+            with self.condicion:
+                while not self.mensajes:
+                    self.condicion.wait()
+                restante = self.primero + self.max_espera - time.time()
+                if restante > 0:
+                    self.condicion.wait(restante)
+                    continue
+                self._enviar(self._tomar())
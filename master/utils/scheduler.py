@@ -0,0 +1,301 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: scheduler.py
+DESCRIPCIÓN: Planificador de envíos entre las tareas activas del máster
+             DisPix. En lugar de que cada tarea publique todos sus bloques
+             seguidos en la cola FIFO de Redis (y una grilla grande deje
+             esperando a todas las tareas que llegan detrás), las tareas se
+             registran aquí con su generador de bloques y un único hilo los
+             publica intercalados:
+               - Round-robin ponderado suave (como el de nginx): en cada
+                 turno gana la tarea con mayor crédito acumulado, y el peso
+                 de su clase de prioridad (PESOS_PRIORIDAD) decide cuántos
+                 turnos le tocan por ronda.
+               - Ventana de envíos: como máximo tantos bloques publicados
+                 sin resultado como admiten los workers vivos según el
+                 registro de latidos (capacidad de cada uno; los workers sin
+                 latido cuentan BLOQUES_POR_WORKER), o VENTANA_ENVIOS si se
+                 fija, entre todas las tareas y repartida entre los procesos
+                 del máster. Así la cola de Redis se mantiene corta y una
+                 tarea nueva entra en la siguiente ronda en vez de esperar
+                 detrás de toda la grilla anterior.
+               - Sin workers vivos no se publica nada (en pubsub el bloque
+                 se perdería y la tarea quedaría esperando a los reintentos):
+                 los bloques esperan aquí hasta que un worker se registre.
+               - Tope por cliente: como máximo MAX_EN_VUELO_CLIENTE bloques
+                 en vuelo de un mismo cliente (0 = sin tope).
+             Los bloques en vuelo de cada tarea se calculan como publicados
+             menos recibidos; los recibidos se consultan con una función
+             externa (el contador compartido en Redis), así que se
+             descuentan aunque el resultado llegue a otro proceso del máster.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: os, threading, time, collections
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por app.py entre la etapa de preparación (preparar_tarea) y
+      la publicación de bloques (utils/dispatcher.py). Los reenvíos de
+      utils/recovery.py no pasan por aquí: son pocos y urgentes.
+    - Con varios procesos de máster, cada uno planifica sus propias tareas
+      con su parte de la ventana.
+------------------------------------------------------------------------------
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+# Peso de cada clase de prioridad en el round-robin (turnos por ronda)
+PESOS_PRIORIDAD = {"high": 4, "normal": 2, "low": 1}
+PRIORIDAD_POR_DEFECTO = "normal"
+
+# Bloques publicados sin resultado por cada worker vivo que no informa su
+# capacidad en el registro: lo justo para que no se quede sin trabajo
+BLOQUES_POR_WORKER = int(os.environ.get("DISPIX_SCHED_BLOCKS_PER_WORKER", 32))
+# Ventana fija entre todas las tareas (0 = sin límite); si no se define, se
+# usa la capacidad de los workers vivos
+VENTANA_ENVIOS = int(os.environ["DISPIX_SCHED_WINDOW"]) if os.environ.get("DISPIX_SCHED_WINDOW") else None
+# Bloques en vuelo de un mismo cliente (0 = sin tope)
+MAX_EN_VUELO_CLIENTE = int(os.environ.get("DISPIX_CLIENT_MAX_INFLIGHT", 0))
+# Retener los envíos mientras no haya workers vivos (0 = publicar igual)
+RETENER_SIN_WORKERS = os.environ.get("DISPIX_HOLD_WITHOUT_WORKERS", "1") != "0"
+
+# Segundos entre revisiones de los recibidos cuando la ventana está llena
+# (los resultados que llegan a este proceso despiertan antes al hilo)
+INTERVALO_REVISION = 0.05
+# Bloques publicados como máximo entre dos revisiones de los recibidos
+LOTE_SIN_VENTANA = 64
+# Segundos entre dos consultas del estado de los workers vivos
+INTERVALO_WORKERS = 2.0
+
+
+def capacidad_cluster(estado):
+    """
+    Bloques en vuelo que admiten los workers vivos de `estado` (ver
+    estado_cluster en utils/redis_publisher.py).
+    """
+    capacidades = [w.get("capacity", BLOQUES_POR_WORKER) for w in estado["registered"]]
+    capacidades += [BLOQUES_POR_WORKER] * estado["unregistered"]
+    if not capacidades:
+        return 0
+    # En pubsub cada bloque llega a todos los workers: manda el de menor capacidad
+    return min(capacidades) if estado["broadcast"] else sum(capacidades)
+
+
+class _Entrada:
+    """Tarea registrada en el planificador."""
+
+    def __init__(self, task_id, fuente, peso, cliente):
+        self.task_id = task_id
+        self.fuente = fuente
+        self.peso = peso
+        self.cliente = cliente
+        self.enviados = 0
+        self.recibidos = 0
+        self.credito = 0
+        # Ya publicó todos sus bloques; sigue contando en la ventana hasta
+        # que lleguen sus resultados
+        self.agotada = False
+
+    @property
+    def en_vuelo(self):
+        return max(self.enviados - self.recibidos, 0)
+
+
+class PlanificadorEnvios:
+    """
+    Publica intercalados los bloques de las tareas activas, en un único hilo.
+
+    Args:
+        obtener_tarea (callable): Devuelve la tarea activa de un task_id, o
+                                  None si ya terminó o no existe.
+        publicar (callable): publicar(task, elemento) publica un elemento
+                             producido por la fuente de la tarea.
+        contar_recibidos (callable): Recibe una lista de task_id y devuelve
+                                     {task_id: bloques recibidos}.
+        al_agotar (callable): Se llama con la tarea cuando ya se publicaron
+                              todos sus bloques (opcional).
+        al_fallar (callable): al_fallar(task_id, error) se llama si publicar
+                              un bloque de la tarea lanza una excepción; la
+                              tarea sale del planificador (opcional).
+        consultar_cluster (callable): Devuelve el estado de los workers vivos
+                                      (estado_cluster); con él la ventana es
+                                      su capacidad y sin workers se retienen
+                                      los envíos.
+        ventana (int): Bloques en vuelo entre todas las tareas (0 = sin
+                       límite); si es None, se calcula con consultar_cluster.
+        max_cliente (int): Bloques en vuelo por cliente (0 = sin tope).
+        procesos (int): Procesos del máster que comparten la capacidad.
+    """
+
+    def __init__(self, obtener_tarea, publicar, contar_recibidos, al_agotar=None, al_fallar=None,
+                 consultar_cluster=None, ventana=VENTANA_ENVIOS, max_cliente=MAX_EN_VUELO_CLIENTE,
+                 procesos=1):
+        self.obtener_tarea = obtener_tarea
+        self.publicar = publicar
+        self.contar_recibidos = contar_recibidos
+        self.al_agotar = al_agotar
+        self.al_fallar = al_fallar
+        self.consultar_cluster = consultar_cluster
+        self.ventana = ventana
+        self.max_cliente = max_cliente
+        self.procesos = max(procesos, 1)
+        self.cluster = (0.0, None)
+        self.entradas = {}
+        self.condicion = threading.Condition()
+        self.hilo = None
+
+    def agregar(self, task, fuente, prioridad=PRIORIDAD_POR_DEFECTO, cliente=None):
+        """
+        Registra una tarea con su fuente de bloques (un iterable, p. ej. sus
+        tiles). Sus bloques se publicarán intercalados con los de las demás.
+        """
+        entrada = _Entrada(task["task_id"], iter(fuente),
+                           PESOS_PRIORIDAD.get(prioridad, PESOS_PRIORIDAD[PRIORIDAD_POR_DEFECTO]),
+                           cliente)
+        with self.condicion:
+            self.entradas[entrada.task_id] = entrada
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._bucle, daemon=True)
+                self.hilo.start()
+            self.condicion.notify()
+
+    def despertar(self):
+        """Avisa que llegaron resultados (hay lugar en la ventana)."""
+        with self.condicion:
+            self.condicion.notify()
+
+    def estado_cluster(self):
+        """
+        Estado de los workers vivos, consultado como mucho cada
+        INTERVALO_WORKERS segundos (None sin consultar_cluster).
+        """
+        contado, estado = self.cluster
+        if self.consultar_cluster is not None and time.time() - contado > INTERVALO_WORKERS:
+            estado = self.consultar_cluster()
+            self.cluster = (time.time(), estado)
+        return estado
+
+    def hay_workers(self):
+        """Indica si hay workers vivos (True si no se sabe)."""
+        estado = self.estado_cluster()
+        return estado is None or estado["workers"] > 0
+
+    def ventana_actual(self):
+        """
+        Bloques en vuelo permitidos ahora entre todas las tareas (0 = sin
+        límite), o None si no hay workers vivos y los envíos se retienen.
+        """
+        estado = self.estado_cluster()
+        if estado is not None and not estado["workers"] and RETENER_SIN_WORKERS:
+            return None
+        if self.ventana is not None:
+            return self.ventana
+        if estado is None:
+            return BLOQUES_POR_WORKER
+        return max(capacidad_cluster(estado) // self.procesos, 1)
+
+    def resumen(self):
+        """
+        Tareas, bloques en vuelo y ventana de este proceso (para /cluster);
+        la ventana es None mientras los envíos están retenidos.
+        """
+        with self.condicion:
+            entradas = list(self.entradas.values())
+        ventana = self.ventana_actual()
+        return {
+            "tasks": len(entradas),
+            "in_flight": sum(e.en_vuelo for e in entradas),
+            "window": ventana,
+            "held": ventana is None and any(not e.agotada for e in entradas),
+        }
+
+    def _bucle(self):
+        while True:
+            with self.condicion:
+                while not self.entradas:
+                    self.condicion.wait()
+                entradas = list(self.entradas.values())
+
+            turnos = self._turnos(entradas)
+            if not turnos:
+                with self.condicion:
+                    self.condicion.wait(INTERVALO_REVISION)
+                continue
+
+            for entrada in turnos:
+                try:
+                    self._publicar_uno(entrada)
+                except Exception as e:
+                    print(f"❌ Error publicando bloques de la tarea {entrada.task_id}: {e}")
+                    if self._quitar(entrada) and self.al_fallar is not None:
+                        self.al_fallar(entrada.task_id, e)
+
+    def _turnos(self, entradas):
+        """
+        Actualiza los bloques en vuelo y elige, por round-robin ponderado,
+        qué tarea publica cada uno de los lugares libres de la ventana.
+        """
+        recibidos = self.contar_recibidos([e.task_id for e in entradas])
+        vigentes = []
+        for entrada in entradas:
+            entrada.recibidos = recibidos.get(entrada.task_id, entrada.recibidos)
+            task = self.obtener_tarea(entrada.task_id)
+            if task is None or task.get("error") or (entrada.agotada and not entrada.en_vuelo):
+                # Terminó, falló o ya no ocupa lugar en la ventana
+                self._quitar(entrada)
+            else:
+                vigentes.append(entrada)
+        entradas = vigentes
+
+        libres = LOTE_SIN_VENTANA
+        ventana = self.ventana_actual()
+        if ventana is None:
+            # Sin workers vivos: los bloques esperan a que alguno se registre
+            return []
+        if ventana:
+            libres = min(libres, ventana - sum(e.en_vuelo for e in entradas))
+        por_cliente = Counter()
+        for entrada in entradas:
+            por_cliente[entrada.cliente] += entrada.en_vuelo
+
+        turnos = []
+        candidatas = [e for e in entradas if not e.agotada]
+        peso_total = sum(e.peso for e in candidatas)
+        while libres > 0 and candidatas:
+            for entrada in candidatas:
+                entrada.credito += entrada.peso
+            elegida = max(candidatas, key=lambda e: e.credito)
+            elegida.credito -= peso_total
+            if self.max_cliente and por_cliente[elegida.cliente] >= self.max_cliente:
+                # El cliente llegó a su tope: sus tareas esperan a la próxima revisión
+                candidatas = [e for e in candidatas if e.cliente != elegida.cliente]
+                peso_total = sum(e.peso for e in candidatas)
+                continue
+            turnos.append(elegida)
+            por_cliente[elegida.cliente] += 1
+            libres -= 1
+        return turnos
+
+    def _publicar_uno(self, entrada):
+        task = self.obtener_tarea(entrada.task_id)
+        if task is None or task.get("error"):
+            # La tarea terminó (o falló) mientras esperaba su turno
+            self._quitar(entrada)
+            return
+        if entrada.agotada:
+            return
+        elemento = next(entrada.fuente, None)
+        if elemento is None:
+            entrada.agotada = True
+            if self.al_agotar is not None:
+                self.al_agotar(task)
+            return
+        entrada.enviados += 1
+        self.publicar(task, elemento)
+
+    def _quitar(self, entrada):
+        with self.condicion:
+            return self.entradas.pop(entrada.task_id, None) is not None
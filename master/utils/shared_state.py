@@ -0,0 +1,250 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: shared_state.py
+DESCRIPCIÓN: Estado de las tareas compartido en Redis entre los procesos del
+             máster DisPix, para que cualquier proceso (p. ej. cualquier
+             worker de gunicorn) pueda aceptar resultados y responder
+             /status, no solo el que recibió la imagen.
+             Por tarea se guardan:
+               - 'dispix-task:<id>': hash con los metadatos (valores JSON),
+                 los contadores (HINCRBY atómico) y la ubicación del lienzo.
+               - 'dispix-task:<id>:bits': mapa de bits de bloques recibidos
+                 (SETBIT devuelve el valor anterior, así que cada bloque se
+                 reserva una sola vez aunque llegue repetido).
+               - 'dispix-task:<id>:keys': claves de caché de los bloques.
+             La reconstrucción final la reclama un único proceso (HSETNX),
+             y los cambios se avisan por el canal 'dispix-task-events' para
+             las conexiones de /events y para que el proceso dueño libere
+             los recursos locales de la tarea.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: redis, json, threading, time, collections, utils.image_reconstructor,
+              utils.shm_transport, utils.task_store
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por app.py; el proceso dueño de cada tarea (el que la
+      preparó) conserva en utils/task_store.py lo que no se puede compartir
+      (plazos de reintento, imagen original, segmentos de memoria).
+------------------------------------------------------------------------------
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from utils.image_reconstructor import abrir_lienzo_en_disco
+from utils.shm_transport import adjuntar_salida
+from utils.task_store import TTL_TAREAS
+
+PREFIJO = "dispix-task:"
+CANAL_EVENTOS = "dispix-task-events"
+
+# Segundos mínimos entre dos avisos de progreso de una tarea (por proceso);
+# los avisos finales nunca se omiten
+INTERVALO_AVISOS = 0.1
+# Tareas de otros procesos cuyo lienzo se mantiene abierto en este proceso
+MAX_VISTAS = 64
+
+
+def abrir_lienzo(descriptor):
+    """
+    Abre el lienzo de salida de una tarea creada por otro proceso: archivo
+    .npy en disco ({"path"}) o segmento de memoria compartida ({"shm"}).
+    """
+    if descriptor.get("path"):
+        return abrir_lienzo_en_disco(descriptor["path"])
+    if descriptor.get("shm"):
+        return adjuntar_salida(descriptor["shm"])
+    return None
+
+
+def bloque_en_mapa(mapa, indice):
+    """Indica si el bit de un bloque está activo en el mapa leído con GET."""
+    byte = indice // 8
+    return byte < len(mapa) and bool(mapa[byte] & (0x80 >> (indice % 8)))
+
+
+class EstadoCompartido:
+    """
+    Metadatos, contadores y avisos de las tareas en Redis.
+
+    Args:
+        redis_cliente: Conexión Redis.
+        ttl (int): Segundos de vida de las claves de cada tarea.
+    """
+
+    def __init__(self, redis_cliente, ttl=TTL_TAREAS):
+        self.r = redis_cliente
+        self.ttl = ttl
+        self.vistas = OrderedDict()
+        self.ultimos_avisos = {}
+        self.lock = threading.Lock()
+
+    def _clave(self, task_id, sufijo=""):
+        return PREFIJO + task_id + sufijo
+
+    def publicar(self, task_id, campos):
+        """Escribe (o actualiza) campos de la tarea y renueva su TTL."""
+        clave = self._clave(task_id)
+        pipe = self.r.pipeline()
+        pipe.hset(clave, mapping={k: json.dumps(v) for k, v in campos.items()})
+        pipe.expire(clave, self.ttl)
+        pipe.execute()
+
+    def publicar_si(self, task_id, campos, campo, esperado):
+        """
+        Actualiza campos solo si `campo` sigue valiendo `esperado` (p. ej. para
+        no pisar un estado final escrito por otro proceso). Devuelve True si
+        se actualizó.
+        """
+        clave = self._clave(task_id)
+
+        def actualizar(pipe):
+            actual = pipe.hget(clave, campo)
+            if actual is None or json.loads(actual) != esperado:
+                return False
+            pipe.multi()
+            pipe.hset(clave, mapping={k: json.dumps(v) for k, v in campos.items()})
+            return True
+
+        return self.r.transaction(actualizar, clave, value_from_callable=True)
+
+    def leer(self, task_id):
+        """Devuelve los campos de la tarea, o None si no existe (o venció)."""
+        if not task_id:
+            return None
+        datos = self.r.hgetall(self._clave(task_id))
+        if not datos:
+            return None
+        return {k.decode(): json.loads(v) for k, v in datos.items()}
+
+    def reservar_bloque(self, task_id, indice):
+        """
+        Marca un bloque (por su posición en la grilla) como recibido. Devuelve
+        False si ya lo estaba (el resultado es un duplicado y se cuenta como tal).
+        """
+        if self.r.setbit(self._clave(task_id, ":bits"), indice, 1):
+            self.r.hincrby(self._clave(task_id), "duplicates", 1)
+            return False
+        return True
+
+    def soltar_bloque(self, task_id, indice):
+        """Deshace la reserva de un bloque que no se pudo ubicar."""
+        self.r.setbit(self._clave(task_id, ":bits"), indice, 0)
+
+    def mapa_recibidos(self, task_id):
+        """Mapa de bits de los bloques recibidos (ver bloque_en_mapa)."""
+        return self.r.get(self._clave(task_id, ":bits")) or b""
+
+    def contar_bloque(self, task_id):
+        """Suma un bloque ubicado en el lienzo y devuelve el total recibido."""
+        pipe = self.r.pipeline()
+        pipe.hincrby(self._clave(task_id), "blocks_received", 1)
+        pipe.hset(self._clave(task_id), "last_received", json.dumps(time.time()))
+        pipe.expire(self._clave(task_id), self.ttl)
+        pipe.expire(self._clave(task_id, ":bits"), self.ttl)
+        return pipe.execute()[0]
+
+    def recibidos(self, task_ids):
+        """{task_id: bloques recibidos} de varias tareas en una sola ida a Redis."""
+        pipe = self.r.pipeline()
+        for task_id in task_ids:
+            pipe.hget(self._clave(task_id), "blocks_received")
+        return {t: int(v or 0) for t, v in zip(task_ids, pipe.execute())}
+
+    def reclamar_reconstruccion(self, task_id):
+        """True solo para el primer proceso que lo pide en cada tarea."""
+        return bool(self.r.hsetnx(self._clave(task_id), "reconstruction", json.dumps(True)))
+
+    def guardar_claves(self, task_id, claves):
+        """Claves de caché por bloque, para los procesos que no publicaron la tarea."""
+        if not claves:
+            return
+        clave = self._clave(task_id, ":keys")
+        pipe = self.r.pipeline()
+        pipe.hset(clave, mapping={str(b): c for b, c in claves.items()})
+        pipe.expire(clave, self.ttl)
+        pipe.execute()
+
+    def clave_cache(self, task_id, block_id):
+        """Clave de caché de un bloque publicado por otro proceso, o None."""
+        clave = self.r.hget(self._clave(task_id, ":keys"), str(block_id))
+        return clave.decode() if clave is not None else None
+
+    def vista(self, task_id):
+        """
+        Campos de una tarea de otro proceso con su lienzo ya abierto, o None
+        si no existe o ya no tiene lienzo. Se conserva abierta hasta que la
+        tarea termina (o se expulsa por MAX_VISTAS).
+        """
+        with self.lock:
+            vista = self.vistas.get(task_id)
+            if vista is not None:
+                self.vistas.move_to_end(task_id)
+                return vista
+
+        registro = self.leer(task_id)
+        if not registro or not registro.get("canvas_ref") or registro.get("reconstruction"):
+            return None
+        try:
+            registro["canvas"] = abrir_lienzo(registro["canvas_ref"])
+        except (OSError, ValueError):
+            # El dueño ya lo liberó: la tarea está terminando
+            return None
+        if registro["canvas"] is None:
+            return None
+        with self.lock:
+            self.vistas[task_id] = registro
+            while len(self.vistas) > MAX_VISTAS:
+                self.vistas.popitem(last=False)
+        return registro
+
+    def olvidar(self, task_id):
+        """Cierra la vista local de una tarea terminada."""
+        with self.lock:
+            self.vistas.pop(task_id, None)
+            self.ultimos_avisos.pop(task_id, None)
+
+    def avisar(self, task_id, fin=False):
+        """
+        Avisa a todos los procesos que la tarea cambió. Los avisos de
+        progreso se limitan a uno cada INTERVALO_AVISOS por tarea.
+        """
+        ahora = time.time()
+        if not fin:
+            with self.lock:
+                if ahora - self.ultimos_avisos.get(task_id, 0) < INTERVALO_AVISOS:
+                    return
+                self.ultimos_avisos[task_id] = ahora
+        try:
+            self.r.publish(CANAL_EVENTOS, json.dumps({"task_id": task_id, "fin": fin}))
+        except redis.exceptions.RedisError as e:
+            print(f"⚠️ No se pudo avisar el cambio de la tarea {task_id}: {e}")
+
+    def escuchar(self, al_avisar):
+        """
+        Inicia un hilo que llama a al_avisar(task_id, fin) por cada aviso de
+        cualquier proceso (incluido este). Se reconecta si Redis se cae.
+        """
+        def bucle():
+            while True:
+                try:
+                    pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CANAL_EVENTOS)
+                    for mensaje in pubsub.listen():
+                        aviso = json.loads(mensaje["data"])
+                        try:
+                            al_avisar(aviso["task_id"], aviso["fin"])
+                        except Exception as e:
+                            print(f"❌ Error atendiendo aviso de la tarea {aviso['task_id']}: {e}")
+                except redis.exceptions.RedisError as e:
+                    print(f"⚠️ Escucha de avisos interrumpida: {e}")
+                    time.sleep(1)
+
+        hilo = threading.Thread(target=bucle, daemon=True)
+        hilo.start()
+        return hilo
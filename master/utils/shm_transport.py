@@ -0,0 +1,110 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: shm_transport.py
+DESCRIPCIÓN: Transporte local por memoria compartida del sistema DisPix, para
+             workers que corren en la misma máquina que el máster.
+             El máster copia la imagen decodificada en un segmento de
+             entrada y reserva el lienzo de salida en otro segmento
+             (multiprocessing.shared_memory). Los mensajes de Redis llevan
+             solo el nombre de los segmentos y las coordenadas del bloque;
+             el worker lee el bloque (con halo) del segmento de entrada y
+             escribe los píxeles filtrados directamente en el lienzo
+             compartido, así que los píxeles no pasan por Redis ni por HTTP.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, os, collections, multiprocessing.shared_memory
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Se utiliza desde app.py cuando la tarea pide transport=shm; la
+      contraparte del worker está en workers/utils/shm_transport.py.
+------------------------------------------------------------------------------
+"""
+
+import os
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# Transportes de bloques disponibles: por Redis (píxeles en el mensaje) o
+# por memoria compartida (solo coordenadas en el mensaje)
+TRANSPORTES = ("redis", "shm")
+TRANSPORTE_POR_DEFECTO = os.environ.get("DISPIX_TRANSPORT", "redis")
+
+# Lienzos de otros procesos del máster que este proceso mantiene abiertos
+MAX_ADJUNTOS = 8
+
+_adjuntos = OrderedDict()
+
+
+class SegmentosTarea:
+    """
+    Segmentos de memoria compartida de una tarea: imagen de entrada y lienzo
+    de salida.
+
+    Args:
+        task_id (str): ID de la tarea (da nombre a los segmentos).
+        imagen (np.ndarray): Imagen decodificada (se copia al segmento).
+    """
+
+    def __init__(self, task_id, imagen):
+        base = "dispix-" + task_id.replace("-", "")[:16]
+        self.forma = list(imagen.shape)
+        self._entrada = shared_memory.SharedMemory(name=base + "-in", create=True, size=imagen.nbytes)
+        try:
+            self._salida = shared_memory.SharedMemory(name=base + "-out", create=True, size=imagen.nbytes)
+        except Exception:
+            self._entrada.close()
+            self._entrada.unlink()
+            raise
+        self.entrada = np.ndarray(imagen.shape, dtype=np.uint8, buffer=self._entrada.buf)
+        self.salida = np.ndarray(imagen.shape, dtype=np.uint8, buffer=self._salida.buf)
+        self.entrada[...] = imagen
+        self.salida[...] = 0
+
+    def descriptor(self):
+        """Metadatos que viajan en cada mensaje para que el worker adjunte los segmentos."""
+        return {"input": self._entrada.name, "output": self._salida.name, "shape": self.forma}
+
+    def liberar(self):
+        """Cierra y elimina ambos segmentos (al terminar o descartar la tarea)."""
+        self.entrada = self.salida = None
+        for segmento in (self._entrada, self._salida):
+            # Primero se elimina el nombre: la memoria se libera cuando se
+            # cierre la última vista, aunque alguna siga abierta ahora
+            try:
+                segmento.unlink()
+            except FileNotFoundError:
+                pass
+            try:
+                segmento.close()
+            except BufferError:
+                pass
+
+
+def adjuntar_salida(descriptor):
+    """
+    Abre el lienzo compartido de una tarea creada por otro proceso del
+    máster (a partir de su descriptor()), sin tomar posesión del segmento.
+    """
+    nombre = descriptor["output"]
+    if nombre in _adjuntos:
+        _adjuntos.move_to_end(nombre)
+        return _adjuntos[nombre][1]
+
+    segmento = shared_memory.SharedMemory(name=nombre)
+    # El segmento lo elimina el proceso que lo creó
+    try:
+        resource_tracker.unregister(segmento._name, "shared_memory")
+    except Exception:
+        pass
+    arreglo = np.ndarray(descriptor["shape"], dtype=np.uint8, buffer=segmento.buf)
+    _adjuntos[nombre] = (segmento, arreglo)
+    while len(_adjuntos) > MAX_ADJUNTOS:
+        _, (viejo, _) = _adjuntos.popitem(last=False)
+        try:
+            viejo.close()
+        except BufferError:
+            pass
+    return arreglo
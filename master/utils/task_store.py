@@ -0,0 +1,211 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: task_store.py
+DESCRIPCIÓN: Almacén acotado del estado de las tareas del máster DisPix.
+             Reemplaza el diccionario global que guardaba cada tarea para
+             siempre:
+               - Las tareas activas cuentan contra un presupuesto de memoria
+                 (su lienzo de salida); si una tarea nueva no cabe, /process
+                 la rechaza en lugar de agotar la RAM del máster.
+               - Al terminar, una tarea se reduce a un registro pequeño de
+                 metadatos que además se escribe en data/tasks/<id>.json.
+               - Los registros terminados se expulsan de la memoria pasado su
+                 TTL (o al superar MAX_TERMINADAS) y se vuelven a leer del
+                 disco si se consultan; las tareas activas que superan el TTL
+                 se dan por fallidas.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: json, os, threading, time, collections
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por app.py (task_store).
+------------------------------------------------------------------------------
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Memoria máxima (MiB) para los lienzos de las tareas activas
+MEMORIA_MAX_MB = int(os.environ.get("DISPIX_TASK_MEMORY_MB", 1024))
+# Segundos que se conserva en memoria una tarea (terminada o sin avances)
+TTL_TAREAS = int(os.environ.get("DISPIX_TASK_TTL", 3600))
+# Registros terminados que se conservan en memoria como máximo
+MAX_TERMINADAS = int(os.environ.get("DISPIX_TASK_MAX_DONE", 1000))
+
+# Campos que sobreviven cuando una tarea se reduce a metadatos
+CAMPOS_METADATOS = (
+    "task_id", "start_time", "end_time", "width", "height", "block_width", "block_height",
+    "filter", "params", "halo", "plan", "codec", "blocks_sent", "total_blocks",
+    "blocks_received", "duplicates", "retries", "original_filename", "processed_filename", "error",
+    "state", "message", "transport", "cached", "cached_blocks", "priority", "client",
+    "job_id", "name", "large", "quality",
+)
+
+
+def bytes_tarea(task):
+    """
+    Memoria retenida por una tarea activa (lienzo e imagen, si están). Las
+    tareas de imagen grande leen y escriben archivos mapeados en memoria,
+    así que solo retienen los bloques en vuelo y no se cuentan.
+    """
+    if task.get("large"):
+        return 0
+    return sum(getattr(task.get(k), "nbytes", 0) for k in ("canvas", "image"))
+
+
+def metadatos(task):
+    """Registro pequeño y serializable de una tarea terminada."""
+    registro = {k: task[k] for k in CAMPOS_METADATOS if k in task}
+    registro["done"] = True
+    return registro
+
+
+class TaskStore:
+    """
+    Estado de las tareas con presupuesto de memoria, TTL y volcado a disco.
+
+    Args:
+        directorio (str): Carpeta donde se vuelcan las tareas terminadas.
+        memoria_max (int): Bytes de lienzos activos permitidos.
+        ttl (float): Segundos sin actividad antes de expulsar una tarea (para
+                     las activas cuenta también el último bloque recibido,
+                     task["last_received"]).
+        max_terminadas (int): Registros terminados conservados en memoria.
+        al_completar (callable): Se llama con la tarea justo antes de
+                                 reducirla a metadatos (opcional; p. ej. para
+                                 sincronizar el estado compartido).
+    """
+
+    def __init__(self, directorio="data/tasks", memoria_max=MEMORIA_MAX_MB * 1024 * 1024,
+                 ttl=TTL_TAREAS, max_terminadas=MAX_TERMINADAS, al_completar=None):
+        self.directorio = directorio
+        self.al_completar = al_completar
+        self.memoria_max = memoria_max
+        self.ttl = ttl
+        self.max_terminadas = max_terminadas
+        self.activas = {}
+        self.terminadas = OrderedDict()
+        self.lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def memoria_en_uso(self):
+        """Bytes retenidos por las tareas activas."""
+        with self.lock:
+            return sum(bytes_tarea(t) for t in self.activas.values())
+
+    def hay_espacio(self, nbytes):
+        """
+        Indica si una tarea nueva de `nbytes` cabe en el presupuesto, después
+        de expulsar lo vencido.
+        """
+        self.purgar()
+        return self.memoria_en_uso() + nbytes <= self.memoria_max
+
+    def __setitem__(self, task_id, task):
+        task.setdefault("last_activity", time.time())
+        with self.lock:
+            self.activas[task_id] = task
+
+    def get(self, task_id, default=None):
+        """
+        Devuelve la tarea activa, o el registro de una terminada (de memoria
+        o, si ya fue expulsada, del disco).
+        """
+        with self.lock:
+            task = self.activas.get(task_id)
+            if task is not None:
+                task["last_activity"] = time.time()
+                return task
+            registro = self.terminadas.get(task_id)
+            if registro is not None:
+                self.terminadas.move_to_end(task_id)
+                return registro
+
+        registro = self._leer(task_id)
+        if registro is None:
+            return default
+        with self.lock:
+            self._guardar_terminada(task_id, registro)
+        return registro
+
+    def activa(self, task_id):
+        """Devuelve la tarea si sigue activa (sin contarlo como actividad), o None."""
+        with self.lock:
+            return self.activas.get(task_id)
+
+    def completar(self, task_id):
+        """
+        Reduce una tarea a sus metadatos (libera lienzo, imagen, bloques
+        recibidos y lo indicado en task["liberar"]) y la vuelca a disco.
+        """
+        with self.lock:
+            task = self.activas.pop(task_id, None)
+        if task is None:
+            return
+        # Recursos externos de la tarea (p. ej. segmentos de memoria compartida)
+        liberar = task.pop("liberar", None)
+        if liberar:
+            liberar()
+        task["end_time"] = task.get("end_time") or time.time()
+        if self.al_completar:
+            try:
+                self.al_completar(task)
+            except Exception as e:
+                print(f"⚠️ Error sincronizando la tarea terminada {task_id}: {e}")
+        registro = metadatos(task)
+        self._escribir(task_id, registro)
+        with self.lock:
+            self._guardar_terminada(task_id, registro)
+
+    def purgar(self):
+        """Expulsa registros terminados vencidos y da por fallidas las tareas activas estancadas."""
+        limite = time.time() - self.ttl
+        with self.lock:
+            vencidas = [tid for tid, t in self.activas.items()
+                        if t.get("error") or max(t["last_activity"], t.get("last_received", 0)) < limite]
+            for tid in [tid for tid, r in self.terminadas.items() if r["cached_at"] < limite]:
+                del self.terminadas[tid]
+
+        for tid in vencidas:
+            task = self.activas.get(tid)
+            if task is not None:
+                task["error"] = True
+                self.completar(tid)
+
+    def _guardar_terminada(self, task_id, registro):
+        registro["cached_at"] = time.time()
+        self.terminadas[task_id] = registro
+        self.terminadas.move_to_end(task_id)
+        while len(self.terminadas) > self.max_terminadas:
+            self.terminadas.popitem(last=False)
+
+    def _ruta(self, task_id):
+        # Solo se aceptan ids con formato de UUID para no salir del directorio
+        if not task_id or not all(c.isalnum() or c == "-" for c in task_id):
+            return None
+        return os.path.join(self.directorio, f"{task_id}.json")
+
+    def _escribir(self, task_id, registro):
+        ruta = self._ruta(task_id)
+        if ruta is None:
+            return
+        try:
+            with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(registro, f)
+            os.replace(ruta + ".tmp", ruta)
+        except OSError as e:
+            print(f"❌ Error guardando metadatos de la tarea {task_id}: {e}")
+
+    def _leer(self, task_id):
+        ruta = self._ruta(task_id)
+        if ruta is None or not os.path.exists(ruta):
+            return None
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
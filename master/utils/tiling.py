@@ -0,0 +1,92 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: tiling.py
+DESCRIPCIÓN: Corte de la imagen en bloques con halo para el sistema DisPix.
+             La grilla reparte filas y columnas de forma exacta: cada bloque
+             registra sus coordenadas [y0, y1) x [x0, x1) y los bloques de
+             borde absorben el resto cuando las dimensiones no son
+             divisibles, así que no se pierde ningún píxel. Los bloques se
+             generan de forma perezosa, sin construir la lista completa.
+             Cada bloque se envía con un borde extra de píxeles vecinos (el
+             halo, limitado por los bordes de la imagen); el worker filtra el
+             bloque completo y recorta el halo antes de devolverlo. Así los
+             filtros que leen vecindad producen el mismo resultado que sobre
+             la imagen entera, sin costuras entre bloques.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, collections
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Se utiliza desde el máster al dividir la imagen en bloques.
+------------------------------------------------------------------------------
+"""
+
+from collections import namedtuple
+
+# Bloque de la grilla con sus coordenadas exactas en la imagen completa
+Tile = namedtuple("Tile", ["block_id", "y0", "y1", "x0", "x1"])
+
+
+def limites(n, total):
+    """
+    Cortes de `total` píxeles en `n` tramos de tamaños que difieren a lo sumo
+    en 1 (los sobrantes se reparten en lugar de descartarse).
+    """
+    return [i * total // n for i in range(n + 1)]
+
+
+def generar_tiles(alto, ancho, filas, columnas):
+    """
+    Genera perezosamente los bloques de una grilla filas x columnas que cubre
+    exactamente la imagen.
+
+    Yields:
+        Tile: block_id 'i_j' y coordenadas (y0, y1, x0, x1).
+    """
+    ys, xs = limites(filas, alto), limites(columnas, ancho)
+    for i in range(filas):
+        for j in range(columnas):
+            yield Tile(f"{i}_{j}", ys[i], ys[i + 1], xs[j], xs[j + 1])
+
+
+def tile_por_id(block_id, alto, ancho, filas, columnas):
+    """Reconstruye el Tile de un block_id 'i_j' sin recorrer la grilla."""
+    i, j = map(int, block_id.split("_"))
+    return Tile(block_id,
+                i * alto // filas, (i + 1) * alto // filas,
+                j * ancho // columnas, (j + 1) * ancho // columnas)
+
+
+def indice_bloque(block_id, columnas):
+    """Posición de un block_id 'i_j' en el orden de la grilla (fila por fila)."""
+    i, j = map(int, block_id.split("_"))
+    return i * columnas + j
+
+
+def recortar_con_halo(imagen, y0, y1, x0, x1, halo):
+    """
+    Extrae el bloque [y0:y1, x0:x1] de la imagen junto con su halo.
+
+    Args:
+        imagen (np.ndarray): Imagen completa.
+        y0, y1, x0, x1 (int): Límites del bloque (sin halo).
+        halo (int): Píxeles de vecindad a incluir por cada lado.
+
+    Returns:
+        tuple: (bloque (np.ndarray), meta (dict)) donde meta contiene
+               'halo' = [arriba, izquierda, abajo, derecha] que el worker debe
+               recortar y 'origin' = [y, x] del primer píxel enviado en
+               coordenadas de la imagen completa.
+    """
+    h, w = imagen.shape[:2]
+    ya, xa = max(0, y0 - halo), max(0, x0 - halo)
+    yb, xb = min(h, y1 + halo), min(w, x1 + halo)
+
+    bloque = imagen[ya:yb, xa:xb]
+    meta = {
+        "halo": [y0 - ya, x0 - xa, yb - y1, xb - x1],
+        "origin": [ya, xa],
+    }
+    return bloque, meta
+
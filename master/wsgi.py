@@ -0,0 +1,18 @@
+# ------------------------------------------------------------------------------
+# ARCHIVO: wsgi.py
+# DESCRIPCIÓN: Punto de entrada WSGI del máster DisPix para servidores de
+#              producción (gunicorn). El estado de las tareas se comparte en
+#              Redis, así que varios procesos pueden atender /process,
+#              /result, /status y /events a la vez.
+# AUTOR: Alejandro Castro Martínez
+# FECHA DE CREACIÓN: 2026-10-18
+# ÚLTIMA MODIFICACIÓN: 2026-10-18
+# DEPENDENCIAS: app
+# CONTEXTO:
+#     - Proyecto DisPix.
+#     - Uso: gunicorn -c gunicorn.conf.py wsgi:app (desde master/).
+# ------------------------------------------------------------------------------
+
+from app import app
+
+application = app
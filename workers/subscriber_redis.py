@@ -1,14 +1,48 @@
 """
 ------------------------------------------------------------------------------
 ARCHIVO: subscriber_redis.py
-DESCRIPCIÓN: Worker principal del sistema DisPix. Se suscribe al canal Redis
-             'dispix-tasks', recibe bloques de imagen junto con el filtro a
-             aplicar, los procesa y luego envía el resultado de vuelta al
-             servidor Flask mediante una solicitud HTTP POST.
+DESCRIPCIÓN: Worker principal del sistema DisPix. Recibe bloques de imagen
+             desde Redis junto con el filtro a aplicar, los procesa y luego
+             envía el resultado de vuelta al servidor Flask mediante una
+             solicitud HTTP POST.
+             Los bloques llegan y se devuelven en el formato binario de
+             utils/block_codec.py, usando el mismo códec que eligió el
+             máster para la tarea (con el códec "auto", la codificación de
+             cada resultado se elige por bloque, respetando la política de
+             calidad de la tarea); el formato JSON heredado (PNG + base64)
+             se sigue aceptando.
+             Modos de despacho (--dispatch):
+               - "pubsub": se suscribe al canal 'dispix-tasks' (todos los
+                 workers reciben todos los bloques).
+               - "queue": consume el stream 'dispix-tasks-stream' dentro del
+                 grupo 'dispix-workers'; cada bloque lo procesa un solo worker
+                 y se confirma (XACK) una vez entregado al máster.
+             El proceso principal actúa como supervisor (utils/pipeline.py):
+             lee bloques por lotes y los reparte en un pool de --concurrency
+             procesos, mientras utils/result_uploader.py agrupa los
+             resultados y los sube por lotes a /results/batch sobre
+             conexiones persistentes.
+             Con transporte por memoria compartida (mensajes con 'shm',
+             workers en la misma máquina que el máster) los píxeles se leen
+             y escriben directamente en los segmentos del máster
+             (utils/shm_transport.py) y solo se sube un aviso sin píxeles.
+             Antes de filtrar, cada bloque se busca en la caché de
+             resultados por contenido (utils/result_cache.py).
+             Las duraciones de cada etapa (espera en cola, decodificación,
+             filtro, codificación y subida) se registran en histogramas
+             (utils/metrics.py) expuestos en /metrics con --metrics-port, y
+             viajan en el resultado para que el máster complete el recorrido.
+             Cada worker late en el registro de Redis
+             (utils/worker_registry.py) con sus núcleos, su capacidad, los
+             bloques en vuelo y el ritmo por filtro; el máster lo usa para
+             no publicar sin workers vivos ni más bloques de los que admiten.
 AUTOR: Alejandro Castro Martínez
 FECHA DE CREACIÓN: 2025-04-17
-ÚLTIMA MODIFICACIÓN: 2025-04-17
-DEPENDENCIAS: redis, json, logging, requests, base64, numpy, opencv-python
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: redis, json, logging, base64, numpy, opencv-python,
+              argparse, socket, utils.block_codec, utils.pipeline,
+              utils.result_uploader, utils.result_cache, utils.shm_transport,
+              utils.metrics, utils.worker_registry
 CONTEXTO:
     - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
     - Este archivo se ejecuta en cada worker y es responsable de recibir,
@@ -19,15 +53,26 @@ CONTEXTO:
 import redis
 import json
 import os
+import socket
+import argparse
 import logging
-import requests
+import time
 from logging.handlers import TimedRotatingFileHandler
 from datetime import datetime
 import base64
 import numpy as np
 import cv2
 
-from utils.image_filters import aplicar_filtro
+from utils.image_filters import aplicar_filtro, quitar_halo, es_posicional
+from utils.block_codec import (es_binario, es_lote, codificar_bloque, decodificar_bloque,
+                               desempaquetar_lote, codec_mensaje, CODEC_LEGADO)
+from utils.result_cache import CacheResultados, clave_bloque, CACHE_MB, CACHE_REDIS, CACHE_TTL
+from utils.pipeline import Supervisor, TokenPaquete
+from utils.result_uploader import ResultUploader
+from utils.shm_transport import leer_bloque, escribir_bloque
+from utils.metrics import observar, observar_codec, servir_metricas
+from utils.worker_registry import Latido, INTERVALO_LATIDO
+from utils.async_logging import configurar_logger, ResumenPeriodico, NIVEL_LOG
 
 # -----------------------------
 # Configuración del Logger
@@ -50,84 +95,374 @@ handler.suffix = "%Y-%m-%d"
 formatter = logging.Formatter('%(asctime)s - %(message)s')
 handler.setFormatter(formatter)
 
+# Consola: reemplaza los print por bloque; pasa por la misma cola
+consola = logging.StreamHandler()
+consola.setFormatter(formatter)
+
+# Los mensajes se encolan y un hilo los escribe (ver utils/async_logging.py);
+# el nivel se elige con --log-level o DISPIX_LOG_LEVEL
 logger = logging.getLogger("subscriber_logger")
-logger.setLevel(logging.INFO)
-logger.addHandler(handler)
+configurar_logger(logger, [handler, consola])
 
-# -----------------------------
-# Conexión a Redis
-# -----------------------------
-r = redis.Redis(host="localhost", port=6379, db=0)
-pubsub = r.pubsub()
-pubsub.subscribe("dispix-tasks")
+# Bloques procesados, resumidos por filtro cada pocos segundos en el
+# proceso principal (el detalle de cada bloque queda en nivel DEBUG)
+bloques_procesados = ResumenPeriodico(logger, "✅ {n} bloques entregados al máster con filtro {clave}")
 
 # -----------------------------
-# Dirección del servidor Flask
+# Nombres compartidos con el máster
 # -----------------------------
-FLASK_SERVER_URL = "http://localhost:5000/result"
+CANAL_TAREAS = "dispix-tasks"
+STREAM_TAREAS = "dispix-tasks-stream"
+GRUPO_WORKERS = "dispix-workers"
 
-print("🟢 Esperando tareas en el canal 'dispix-tasks'...\n")
+# Tiempo (ms) tras el cual un bloque pendiente de un worker caído puede ser
+# reclamado por otro consumidor del grupo
+RECLAMO_INACTIVO_MS = 60000
 
 # -----------------------------
-# Bucle principal del worker
+# Dirección del servidor Flask (los lotes van a /results/batch)
 # -----------------------------
-for message in pubsub.listen():
-    if message["type"] == "message":
-        try:
-            # -------------------------
-            # Decodificar mensaje JSON
-            # -------------------------
-            data = json.loads(message["data"])
-            task_id = data.get("task_id", "N/A")
-            block_id = data.get("block_id", "N/A")
-            filtro = data.get("filter", "N/A")
-            block_data = data.get("block_data", "")
+FLASK_SERVER_URL = os.environ.get("DISPIX_MASTER_URL", "http://localhost:5000/result")
 
-            msg = f"📦 Bloque recibido -> Task: {task_id} | Block: {block_id} | Filtro: {filtro}"
-            print(msg)
-            logger.info(msg)
+# Caché de resultados por contenido de cada proceso del pool (ver
+# configurar_cache); bloques idénticos no se vuelven a filtrar
+cache = CacheResultados(CACHE_MB * 1024 * 1024)
 
-            # -------------------------
-            # Decodificar imagen base64
-            # -------------------------
-            img_bytes = base64.b64decode(block_data)
-            img_np = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(img_np, cv2.IMREAD_COLOR)
 
-            # -------------------------
-            # Aplicar el filtro indicado
-            # -------------------------
-            msg = f"🔄 Aplicando filtro: {filtro}"
-            print(msg)
-            logger.info(msg)
-            img_procesado = aplicar_filtro(img, filtro)
+def configurar_cache(mb, redis_host=None, redis_port=None, usar_redis=False):
+    """
+    Inicializador de cada proceso del pool: dimensiona la caché local y, si
+    se pide, conecta el nivel compartido en Redis.
+    """
+    global cache
+    cliente = redis.Redis(host=redis_host, port=redis_port, db=0) if usar_redis else None
+    cache = CacheResultados(mb * 1024 * 1024, cliente, CACHE_TTL)
 
-            # -------------------------
-            # Re-encodificar imagen
-            # -------------------------
-            _, buffer = cv2.imencode(".png", img_procesado)
-            block_data = base64.b64encode(buffer).decode("utf-8")
 
+def procesar_bloque(raw):
+    """
+    Etapa de CPU del worker: decodifica el bloque, aplica el filtro y
+    re-codifica el resultado. Se ejecuta dentro del pool de procesos.
+
+    Args:
+        raw (bytes | str): Mensaje recibido desde Redis, en formato binario
+                           (utils/block_codec.py), JSON heredado o JSON sin
+                           píxeles del transporte por memoria compartida.
+
+    Returns:
+        dict | None: Petición lista para enviarse al máster (argumentos de
+                     requests.post) más la clave 'tiempos' con la duración
+                     de cada etapa (ver Supervisor), o None si el mensaje es
+                     inválido y no tiene sentido reintentarlo.
+    """
+    llegada = time.time()
+    inicio = time.perf_counter()
+    try:
+        if es_binario(raw):
             # -------------------------
-            # Enviar bloque procesado al máster
+            # Decodificar mensaje binario (cabecera + píxeles)
             # -------------------------
-            response = requests.post(FLASK_SERVER_URL, json={
+            img, meta = decodificar_bloque(raw)
+            codec = meta.get("codec", "raw")
+        else:
+            meta = json.loads(raw)
+            if "shm" in meta:
+                # -------------------------
+                # Transporte local: el bloque se lee de la memoria compartida
+                # -------------------------
+                codec = "shm"
+                img = leer_bloque(meta)
+            else:
+                # -------------------------
+                # Decodificar mensaje JSON (formato heredado PNG + base64)
+                # -------------------------
+                codec = CODEC_LEGADO
+                img_bytes = base64.b64decode(meta.pop("block_data", ""))
+                img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+        decodificado = time.perf_counter()
+        task_id = meta.get("task_id", "N/A")
+        block_id = meta.get("block_id", "N/A")
+        filtro = meta.get("filter", "N/A")
+
+        # Tiempos que viajan con el bloque: el máster los suma a su recorrido
+        t = meta.get("t") or {}
+        tiempos = {
+            "block": t.get("block", "0"),
+            "queue": max(llegada - t["ts"], 0.0) if "ts" in t else None,
+            "decode": decodificado - inicio,
+        }
+
+        logger.debug("📦 Bloque recibido -> Task: %s | Block: %s | Filtro: %s | Códec: %s",
+                     task_id, block_id, filtro, codec)
+
+        # -------------------------
+        # Aplicar el filtro indicado
+        # -------------------------
+        clave = None
+        if cache.activa:
+            origen = meta.get("origin", (0, 0)) if es_posicional(filtro) else None
+            clave = clave_bloque(img, filtro, meta.get("params"), meta.get("halo"), origen)
+        img_procesado = cache.obtener(clave) if clave else None
+
+        if img_procesado is not None:
+            logger.debug("♻️ Resultado en caché para el bloque %s", block_id)
+        else:
+            img_procesado = aplicar_filtro(img, filtro, meta.get("params"), meta.get("origin", (0, 0)))
+
+            # Recortar el halo de vecindad: solo se devuelve el interior del bloque
+            if "halo" in meta:
+                img_procesado = quitar_halo(img_procesado, meta["halo"])
+            if clave:
+                img_procesado = np.ascontiguousarray(img_procesado)
+                cache.guardar(clave, img_procesado)
+
+        filtrado = time.perf_counter()
+        tiempos["filter"] = filtrado - decodificado
+        # 'ts' marca la entrega a la subida; el máster mide desde ahí
+        t_resultado = {**tiempos, "ts": time.time()}
+
+        # -------------------------
+        # Re-encodificar imagen con el mismo códec de la tarea
+        # -------------------------
+        codificacion = None
+        if codec == "shm":
+            # Los píxeles van directo al lienzo compartido; al máster solo se
+            # le avisa con un mensaje binario vacío
+            escribir_bloque(meta, img_procesado)
+            peticion = {
+                "data": codificar_bloque(np.zeros((0, 0, 3), np.uint8), {
+                    "task_id": task_id,
+                    "block_id": block_id,
+                    "filter": filtro,
+                    "shm": True,
+                    "t": t_resultado,
+                }, "raw"),
+                "headers": {"Content-Type": "application/octet-stream"},
+            }
+        elif codec == CODEC_LEGADO:
+            _, buffer = cv2.imencode(".png", img_procesado)
+            peticion = {"json": {
                 "task_id": task_id,
                 "block_id": block_id,
                 "filter": filtro,
-                "block_data": block_data
-            })
+                "t": t_resultado,
+                "block_data": base64.b64encode(buffer).decode("utf-8")
+            }}
+        else:
+            # Con el códec 'auto' se elige de nuevo por bloque: el resultado
+            # puede comprimirse distinto que la entrada (p. ej. un bloque plano)
+            data = codificar_bloque(img_procesado, {
+                "task_id": task_id,
+                "block_id": block_id,
+                "filter": filtro,
+                "t": t_resultado,
+            }, codec, meta.get("quality"))
+            peticion = {
+                "data": data,
+                "headers": {"Content-Type": "application/octet-stream"},
+            }
+            # Costo y bytes por códec elegido (los registra el proceso principal)
+            codificacion = (codec_mensaje(data), time.perf_counter() - filtrado, img_procesado.nbytes, len(data))
 
-            if response.status_code == 200:
-                send_msg = f"✅ Bloque enviado al servidor Flask: {response.json()}"
-                print(send_msg)
-                logger.info(send_msg)
-            else:
-                error_msg = f"⚠️ Error al enviar al servidor Flask: {response.status_code}"
-                print(error_msg)
-                logger.warning(error_msg)
-
-        except Exception as e:
-            error_msg = f"❌ Error procesando mensaje: {e}"
-            print(error_msg)
-            logger.error(error_msg)
+    except Exception as e:
+        logger.error(f"❌ Error procesando mensaje: {e}")
+        # Un mensaje corrupto no mejorará al reintentarlo
+        return None
+
+    tiempos["encode"] = time.perf_counter() - filtrado
+    # Las métricas se registran en el proceso principal (el pool no expone
+    # /metrics); el Supervisor quita esta clave antes de subir
+    peticion["tiempos"] = {"filter": filtro, "block": tiempos.pop("block"), "stages": tiempos,
+                           "codec": codificacion}
+    return peticion
+
+
+def registrar_tiempos(tiempos):
+    """
+    Registra en los histogramas del proceso las etapas de un bloque entregado
+    y lo cuenta para el resumen periódico del log.
+    """
+    for etapa, segundos in tiempos["stages"].items():
+        if segundos is not None:
+            observar(etapa, segundos, tiempos["filter"], tiempos["block"])
+    if tiempos.get("codec"):
+        observar_codec(*tiempos["codec"], tiempos["block"])
+    bloques_procesados.contar(tiempos["filter"])
+
+
+def separar_paquetes(lote):
+    """
+    Separa los mensajes que agrupan varios bloques (paquetes de bloques
+    pequeños, ver EmpaquetadorBloques en el máster): cada bloque se procesa
+    por separado en el pool y comparte un TokenPaquete con sus vecinos.
+    """
+    separados = []
+    for raw, token in lote:
+        if not es_lote(raw):
+            separados.append((raw, token))
+            continue
+        partes = desempaquetar_lote(raw)
+        compartido = TokenPaquete(token, len(partes))
+        separados.extend((bytes(parte), compartido) for parte in partes)
+    return separados
+
+
+def leer_lote_pubsub(pubsub, tamano, espera=1.0):
+    """
+    Lee hasta `tamano` mensajes del canal: espera el primero como máximo
+    `espera` segundos y luego drena sin bloquear lo que ya esté en el socket.
+    """
+    lote = []
+    timeout = espera
+    while len(lote) < tamano:
+        message = pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            break
+        if message["type"] == "message":
+            lote.append((message["data"], None))
+        timeout = 0
+    return lote
+
+
+def consumir_pubsub(r, supervisor, tamano_lote):
+    """
+    Bucle de consumo en modo pub/sub: cada worker recibe todos los bloques.
+    """
+    pubsub = r.pubsub()
+    pubsub.subscribe(CANAL_TAREAS)
+
+    print(f"🟢 Esperando tareas en el canal '{CANAL_TAREAS}'...\n")
+
+    while True:
+        supervisor.enviar_lote(separar_paquetes(leer_lote_pubsub(pubsub, tamano_lote)))
+
+
+def consumir_cola(r, supervisor, consumidor, tamano_lote):
+    """
+    Bucle de consumo en modo cola (Redis Stream + grupo de consumidores).
+
+    Cada entrada del stream se entrega a un único consumidor del grupo. Se
+    confirma (XACK) y elimina (XDEL) solo cuando el máster aceptó el
+    resultado; si el worker cae antes, la entrada queda pendiente y otro
+    worker la reclama con XAUTOCLAIM pasado RECLAMO_INACTIVO_MS.
+    """
+    try:
+        r.xgroup_create(STREAM_TAREAS, GRUPO_WORKERS, id="0", mkstream=True)
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+    print(f"🟢 Consumiendo tareas del stream '{STREAM_TAREAS}' como '{consumidor}'...\n")
+
+    while True:
+        # Primero, reclamar bloques abandonados por workers caídos
+        _, entradas, *_ = r.xautoclaim(STREAM_TAREAS, GRUPO_WORKERS, consumidor,
+                                       min_idle_time=RECLAMO_INACTIVO_MS, count=tamano_lote)
+
+        if not entradas:
+            respuesta = r.xreadgroup(GRUPO_WORKERS, consumidor, {STREAM_TAREAS: ">"},
+                                     count=tamano_lote, block=5000)
+            entradas = respuesta[0][1] if respuesta else []
+
+        lote = []
+        for entry_id, campos in entradas:
+            if campos is None:
+                # La entrada fue eliminada del stream mientras estaba pendiente
+                r.xack(STREAM_TAREAS, GRUPO_WORKERS, entry_id)
+                continue
+            lote.append((campos[b"data"], entry_id))
+        supervisor.enviar_lote(separar_paquetes(lote))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de procesamiento DisPix")
+    parser.add_argument("--dispatch", choices=["pubsub", "queue"],
+                        default=os.environ.get("DISPIX_DISPATCH_MODE", "pubsub"),
+                        help="Modo de despacho: difusión pub/sub o cola de trabajo")
+    parser.add_argument("--redis-host", default=os.environ.get("DISPIX_REDIS_HOST", "localhost"))
+    parser.add_argument("--redis-port", type=int, default=int(os.environ.get("DISPIX_REDIS_PORT", 6379)))
+    parser.add_argument("--master-url", default=FLASK_SERVER_URL,
+                        help="Endpoint /result del servidor Flask")
+    parser.add_argument("--consumer-name", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="Nombre del worker en el registro y del consumidor en el grupo (modo queue)")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1,
+                        help="Procesos que filtran bloques en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Máximo de bloques leídos de Redis por lote")
+    parser.add_argument("--upload-threads", type=int, default=2,
+                        help="Hilos que suben resultados al máster en paralelo")
+    parser.add_argument("--upload-batch", type=int, default=32,
+                        help="Máximo de bloques por POST a /results/batch")
+    parser.add_argument("--upload-delay-ms", type=float, default=20,
+                        help="Espera máxima (ms) de un bloque antes de enviar un lote incompleto")
+    parser.add_argument("--cache-mb", type=int, default=CACHE_MB,
+                        help="Memoria (MiB) de la caché de resultados de cada proceso (0 la desactiva)")
+    parser.add_argument("--cache-redis", action="store_true", default=CACHE_REDIS,
+                        help="Compartir la caché de resultados en Redis (DISPIX_CACHE_REDIS=1)")
+    parser.add_argument("--log-level", default=NIVEL_LOG,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Nivel de registro (DEBUG incluye el detalle de cada bloque)")
+    parser.add_argument("--metrics-port", type=int,
+                        default=int(os.environ.get("DISPIX_METRICS_PORT", 0)),
+                        help="Puerto HTTP de /metrics (formato Prometheus); 0 lo desactiva")
+    args = parser.parse_args()
+    logger.setLevel(args.log_level)
+
+    if args.metrics_port:
+        servir_metricas(args.metrics_port)
+        print(f"📈 Métricas en http://0.0.0.0:{args.metrics_port}/metrics")
+
+    # -----------------------------
+    # Conexión a Redis
+    # -----------------------------
+    r = redis.Redis(host=args.redis_host, port=args.redis_port, db=0)
+
+    def confirmar(entry_id):
+        r.xack(STREAM_TAREAS, GRUPO_WORKERS, entry_id)
+        r.xdel(STREAM_TAREAS, entry_id)
+
+    def medir(tiempos):
+        registrar_tiempos(tiempos)
+        latido.contar(tiempos["filter"], tiempos["stages"].get("filter"))
+
+    subidor = ResultUploader(
+        args.master_url,
+        hilos=args.upload_threads,
+        max_bloques=args.upload_batch,
+        max_espera=args.upload_delay_ms / 1000,
+    )
+    supervisor = Supervisor(
+        procesar=procesar_bloque,
+        subidor=subidor,
+        concurrencia=args.concurrency,
+        al_confirmar=confirmar,
+        al_medir=medir,
+        inicializador=configurar_cache,
+        init_args=(args.cache_mb, args.redis_host, args.redis_port, args.cache_redis),
+    )
+    print(f"⚙️ Pool de {supervisor.concurrencia} procesos, lotes de hasta {args.batch_size} bloques")
+
+    # Registro por latidos: el máster sabe que este worker está vivo y
+    # cuántos bloques admite (los del pipeline más un lote leído en espera)
+    latido = Latido(r, args.consumer_name, {
+        "dispatch": args.dispatch,
+        "cores": supervisor.concurrencia,
+        "capacity": supervisor.capacidad + args.batch_size,
+    }, en_cola=lambda: supervisor.en_vuelo).iniciar()
+    print(f"💓 Registrado como '{args.consumer_name}' (latido cada {INTERVALO_LATIDO:g} s)")
+
+    try:
+        if args.dispatch == "queue":
+            consumir_cola(r, supervisor, args.consumer_name, args.batch_size)
+        else:
+            consumir_pubsub(r, supervisor, args.batch_size)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        latido.detener()
+        supervisor.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: async_logging.py
+DESCRIPCIÓN: Registro (logging) fuera del camino crítico de DisPix.
+               - configurar_logger: los mensajes se encolan con un
+                 QueueHandler y un QueueListener los escribe en disco desde
+                 su propio hilo, así que quien registra no espera la E/S.
+               - ResumenPeriodico: los eventos que ocurren una vez por
+                 bloque (publicado, recibido, procesado) no se registran uno
+                 a uno: se cuentan y cada INTERVALO_RESUMEN segundos se
+                 escribe una línea por clave (p. ej. por tarea). El detalle
+                 por bloque se registra en nivel DEBUG o, con
+                 DISPIX_LOG_SAMPLE=N, uno de cada N bloques en nivel INFO.
+             El nivel se configura con DISPIX_LOG_LEVEL (por defecto INFO).
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: logging, queue, threading, atexit, os, time, collections
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Existe una copia idéntica en workers/utils/async_logging.py; ambas
+      deben mantenerse sincronizadas (igual que block_codec.py).
+------------------------------------------------------------------------------
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+
+# Nivel de registro (DEBUG, INFO, WARNING, ERROR)
+NIVEL_LOG = os.environ.get("DISPIX_LOG_LEVEL", "INFO").upper()
+# Segundos entre dos resúmenes de eventos por bloque
+INTERVALO_RESUMEN = float(os.environ.get("DISPIX_LOG_SUMMARY_SECS", 5))
+# Registrar en INFO el detalle de uno de cada N bloques (0 = ninguno)
+MUESTREO_BLOQUES = int(os.environ.get("DISPIX_LOG_SAMPLE", 0))
+
+
+def configurar_logger(logger, manejadores, nivel=NIVEL_LOG):
+    """
+    Conecta `logger` a `manejadores` (p. ej. un TimedRotatingFileHandler) a
+    través de una cola: registrar solo encola el mensaje y un hilo de
+    QueueListener lo formatea y escribe. Los mensajes pendientes se vacían
+    al terminar el proceso.
+
+    En los procesos hijos creados con fork (p. ej. el pool del worker) el
+    hilo del listener no existe, así que ahí el logger escribe directamente
+    en los manejadores (solo registran errores y detalle en DEBUG).
+
+    Returns:
+        QueueListener: El listener en marcha (se detiene con stop()).
+    """
+    cola = queue.SimpleQueue()
+    manejador_cola = QueueHandler(cola)
+    logger.addHandler(manejador_cola)
+    logger.setLevel(nivel)
+    # Sin propagar: el logger raíz escribiría el mismo mensaje en el hilo actual
+    logger.propagate = False
+
+    listener = QueueListener(cola, *manejadores, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def en_hijo():
+        logger.removeHandler(manejador_cola)
+        for manejador in manejadores:
+            logger.addHandler(manejador)
+
+    os.register_at_fork(after_in_child=en_hijo)
+    return listener
+
+
+class ResumenPeriodico:
+    """
+    Agrupa eventos repetitivos (uno por bloque) y los resume periódicamente.
+
+    Args:
+        logger (logging.Logger): Destino de los resúmenes y del detalle.
+        mensaje (str): Formato del resumen; recibe {clave} y {n}.
+        intervalo (float): Segundos entre resúmenes.
+        muestreo (int): Registrar en INFO el detalle de uno de cada
+                        `muestreo` eventos (0 = solo en DEBUG).
+    """
+
+    def __init__(self, logger, mensaje, intervalo=INTERVALO_RESUMEN, muestreo=MUESTREO_BLOQUES):
+        self.logger = logger
+        self.mensaje = mensaje
+        self.intervalo = intervalo
+        self.muestreo = muestreo
+        self.conteos = Counter()
+        self.eventos = 0
+        self.hilo = None
+        self.lock = threading.Lock()
+
+    def contar(self, clave, detalle=None, *args):
+        """
+        Cuenta un evento de `clave`. `detalle` y `args` forman el mensaje por
+        bloque (formato de logging, solo se formatea si se registra).
+        """
+        with self.lock:
+            self.conteos[clave] += 1
+            self.eventos += 1
+            muestra = self.muestreo and self.eventos % self.muestreo == 0
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._bucle, daemon=True)
+                self.hilo.start()
+                atexit.register(self.vaciar)
+
+        if detalle is not None:
+            if muestra:
+                self.logger.info(detalle, *args)
+            else:
+                self.logger.debug(detalle, *args)
+
+    def vaciar(self):
+        """Registra el resumen de lo contado desde el último y reinicia los conteos."""
+        with self.lock:
+            conteos, self.conteos = self.conteos, Counter()
+        for clave, n in conteos.items():
+            self.logger.info(self.mensaje.format(clave=clave, n=n))
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.vaciar()
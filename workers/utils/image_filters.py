@@ -4,10 +4,24 @@ ARCHIVO: image_filters.py
 DESCRIPCIÓN: Contiene la lógica de filtros de imagen utilizados por los workers
              en el sistema DisPix. Cada filtro toma un bloque de imagen en
              formato OpenCV y retorna el bloque procesado según el filtro
-             especificado.
+             especificado. Los filtros que leen vecindad reciben el bloque
+             con halo y su posición en la imagen completa, para producir el
+             mismo resultado que sobre la imagen entera.
+             Los filtros se declaran en un registro (FILTROS) mediante el
+             decorador registrar_filtro, indicando su núcleo, el halo que
+             necesitan y su costo relativo de CPU. Los núcleos trabajan en
+             uint8 (o float32 dentro de OpenCV), sin arreglos intermedios de
+             float64.
+             Una tarea puede pedir una cadena de filtros ("sepia+pixelate",
+             con una lista de parámetros, uno por paso): todos los pasos se
+             aplican sobre el bloque en memoria, y los pasos consecutivos
+             que son transformaciones afines por píxel (negativo, sepia) se
+             fusionan en un único cv2.transform cuando el resultado es el
+             mismo que aplicarlos uno a uno (salvo redondeos de ±1, los
+             mismos que ya tiene cv2.transform frente al cálculo exacto).
 AUTOR: Alejandro Castro Martínez
 FECHA DE CREACIÓN: 2025-04-17
-ÚLTIMA MODIFICACIÓN: 2025-04-17
+ÚLTIMA MODIFICACIÓN: 2026-10-18
 DEPENDENCIAS: OpenCV (cv2), numpy
 CONTEXTO:
     - Proyecto DisPix: procesamiento distribuido de imágenes.
@@ -19,51 +33,192 @@ CONTEXTO:
 import cv2
 import numpy as np
 
-def aplicar_filtro(img, filtro):
+# Registro de filtros: nombre -> {"kernel", "halo", "costo", "posicional", "afin"}
+FILTROS = {}
+
+# Separador de los pasos de una cadena de filtros (igual que en el máster)
+SEPARADOR_CADENA = "+"
+
+# Matriz sepia sobre píxeles BGR (filas: B, G, R de salida)
+MATRIZ_SEPIA = np.array([
+    [0.131, 0.534, 0.272],
+    [0.168, 0.686, 0.349],
+    [0.189, 0.769, 0.393],
+], dtype=np.float32)
+
+
+def registrar_filtro(nombre, halo=lambda params: 0, costo=1.0, posicional=False, afin=None):
+    """
+    Decorador que registra el núcleo de un filtro.
+
+    El núcleo recibe (img, params, origen) y devuelve el bloque filtrado.
+
+    Args:
+        nombre (str): Nombre del filtro en los mensajes de tarea.
+        halo (callable): Recibe los parámetros y devuelve los píxeles de
+                         vecindad que el filtro necesita leer.
+        costo (float): Costo relativo de CPU por píxel (1 = negativo).
+        posicional (bool): Si el resultado depende del origen del bloque
+                           (entra en la clave de caché).
+        afin (tuple): (matriz 3x4, exacto) si el filtro es una transformación
+                      afín por píxel (salida = M @ [B, G, R, 1]); 'exacto'
+                      indica que el resultado es entero y está en [0, 255]
+                      sin redondear ni saturar, condición para fusionarlo
+                      con el paso siguiente de una cadena.
+    """
+    def decorador(kernel):
+        FILTROS[nombre] = {"kernel": kernel, "halo": halo, "costo": costo, "posicional": posicional,
+                           "afin": afin}
+        return kernel
+    return decorador
+
+
+def pixelar(img, cell, origen=(0, 0)):
+    """
+    Pixelado por promedio de celdas de `cell` x `cell` píxeles alineadas a la
+    grilla global de la imagen (no a la del bloque), de modo que bloques
+    vecinos con halo suficiente (cell - 1) producen celdas idénticas.
+
+    Args:
+        img (np.ndarray): Bloque (con halo) en formato OpenCV.
+        cell (int): Lado de cada celda en píxeles.
+        origen (tuple): Posición (y, x) del primer píxel del bloque en la
+                        imagen completa.
+    """
+    h, w = img.shape[:2]
+
+    # Inicio de cada celda dentro del bloque (la primera puede ser parcial)
+    ys = np.unique(np.r_[0, np.arange((-origen[0]) % cell, h, cell)])
+    xs = np.unique(np.r_[0, np.arange((-origen[1]) % cell, w, cell)])
+    alto_celdas = np.diff(np.r_[ys, h])
+    ancho_celdas = np.diff(np.r_[xs, w])
+
+    # Suma por celda y división por su área (redondeo al entero más cercano)
+    sumas = np.add.reduceat(np.add.reduceat(img.astype(np.uint32), ys, axis=0), xs, axis=1)
+    areas = np.outer(alto_celdas, ancho_celdas).reshape(len(ys), len(xs), *([1] * (img.ndim - 2)))
+    medias = ((sumas + areas // 2) // areas).astype(np.uint8)
+
+    return np.repeat(np.repeat(medias, alto_celdas, axis=0), ancho_celdas, axis=1)
+
+
+def quitar_halo(img, halo):
+    """Recorta el halo [arriba, izquierda, abajo, derecha] de un bloque filtrado."""
+    arriba, izquierda, abajo, derecha = halo
+    h, w = img.shape[:2]
+    return img[arriba:h - abajo, izquierda:w - derecha]
+
+
+@registrar_filtro("negative", costo=1.0,
+                  afin=(np.hstack([-np.eye(3), np.full((3, 1), 255.0)]).astype(np.float32), True))
+def _negativo(img, params, origen):
+    # Invierte los valores de los píxeles para crear un efecto negativo
+    return cv2.bitwise_not(img)
+
+
+@registrar_filtro("sepia", costo=4.0,
+                  afin=(np.hstack([MATRIZ_SEPIA, np.zeros((3, 1), np.float32)]), False))
+def _sepia(img, params, origen):
+    # Una sola transformación lineal por píxel; OpenCV acumula en float32 y
+    # satura a uint8 al escribir la salida
+    return cv2.transform(img, MATRIZ_SEPIA)
+
+
+@registrar_filtro("pixelate", halo=lambda params: params.get("cell", 1) - 1, costo=6.0, posicional=True)
+def _pixelado(img, params, origen):
+    # Promedia celdas alineadas a la grilla global para crear efecto pixelado
+    cell = params.get("cell") or max(1, min(img.shape[:2]) // 10)
+    return pixelar(img, cell, origen)
+
+
+@registrar_filtro("blur", halo=lambda params: params.get("radius", 2), costo=5.0)
+def _desenfoque(img, params, origen):
+    # Desenfoque gaussiano de (2 * radius + 1) px; con halo = radius los
+    # bordes internos del bloque ven los mismos vecinos que en la imagen
+    # completa, y en los bordes reales se usa el mismo reflejo de OpenCV
+    lado = 2 * params.get("radius", 2) + 1
+    return cv2.GaussianBlur(img, (lado, lado), 0)
+
+
+def es_posicional(filtro):
+    """Indica si el resultado del filtro (o de algún paso de la cadena) depende de la posición del bloque."""
+    return any(FILTROS.get(f, {}).get("posicional", False) for f in filtro.split(SEPARADOR_CADENA))
+
+
+def pasos_cadena(filtro, params=None):
+    """Pares (filtro, params) de cada paso; un filtro simple es una cadena de un paso."""
+    if SEPARADOR_CADENA not in filtro:
+        return [(filtro, params or {})]
+    pasos = filtro.split(SEPARADOR_CADENA)
+    params = params if isinstance(params, list) else []
+    return list(zip(pasos, params + [{}] * (len(pasos) - len(params))))
+
+
+def fusionar_pasos(pasos):
+    """
+    Agrupa los pasos de una cadena en etapas: un paso suelto, o varios pasos
+    afines consecutivos fusionados en una sola matriz 3x4.
+
+    Un paso afín se fusiona con el siguiente solo si es exacto (no redondea
+    ni satura), así la etapa fusionada da el mismo resultado que aplicar los
+    pasos uno a uno, salvo redondeos de ±1 en algunos píxeles; p. ej.
+    "negative+sepia" se fusiona, pero "sepia+sepia" no (la primera sepia
+    satura antes de la segunda). Todos los bloques de una tarea usan la
+    misma etapa, así que no aparecen costuras.
+
+    Returns:
+        list: Etapas ("paso", filtro, params) o ("afin", matriz 3x4, nombres).
     """
-    Aplica un filtro de imagen sobre un bloque dado.
+    etapas = []
+    grupo = None  # (matriz 4x4 acumulada, nombres, admite otro paso)
+    for filtro, params in pasos:
+        afin = FILTROS.get(filtro, {}).get("afin")
+        if afin is None:
+            if grupo is not None:
+                etapas.append(("afin", grupo[0][:3], grupo[1]))
+                grupo = None
+            etapas.append(("paso", filtro, params))
+            continue
+        matriz, exacto = afin
+        paso = np.vstack([matriz, [0, 0, 0, 1]]).astype(np.float64)
+        if grupo is not None and grupo[2]:
+            grupo = (paso @ grupo[0], grupo[1] + [filtro], exacto)
+        else:
+            if grupo is not None:
+                etapas.append(("afin", grupo[0][:3], grupo[1]))
+            grupo = (paso, [filtro], exacto)
+    if grupo is not None:
+        etapas.append(("afin", grupo[0][:3], grupo[1]))
+    return etapas
+
+
+def aplicar_filtro(img, filtro, params=None, origen=(0, 0)):
+    """
+    Aplica un filtro de imagen (o una cadena de filtros) sobre un bloque dado.
 
     Args:
         img (np.ndarray): Imagen original en formato OpenCV.
-        filtro (str): Tipo de filtro a aplicar ('negative', 'blur', 'pixelate').
+        filtro (str): Nombre de un filtro registrado en FILTROS
+                      ('negative', 'sepia', 'pixelate', 'blur') o una cadena
+                      de ellos separados por '+' ('sepia+pixelate').
+        params (dict | list): Parámetros del filtro (p. ej. {'cell': 8} para
+                              pixelate); en una cadena, una lista con los
+                              de cada paso.
+        origen (tuple): Posición (y, x) del bloque en la imagen completa.
 
     Returns:
         np.ndarray: Imagen procesada con el filtro solicitado.
     """
-
-    if filtro == "negative":
-        # Invierte los valores de los píxeles para crear un efecto negativo
-        return cv2.bitwise_not(img)
-
-    elif filtro == "sepia":
-        # Conversión a float para evitar sobreflujo durante la multiplicación
-        img_float = img.astype(np.float64)
-
-        # Separar canales
-        B = img_float[:, :, 0]
-        G = img_float[:, :, 1]
-        R = img_float[:, :, 2]
-
-        # Aplicar fórmula sepia a cada canal (vectorizada)
-        tr = 0.393 * R + 0.769 * G + 0.189 * B
-        tg = 0.349 * R + 0.686 * G + 0.168 * B
-        tb = 0.272 * R + 0.534 * G + 0.131 * B
-
-        # Limitar a rango válido
-        sepia = np.stack([
-            np.clip(tb, 0, 255),
-            np.clip(tg, 0, 255),
-            np.clip(tr, 0, 255)
-        ], axis=-1)
-
-        return sepia.astype(np.uint8)
-
-    elif filtro == "pixelate":
-        # Reduce la imagen y la vuelve a escalar para crear efecto pixelado
-        h, w = img.shape[:2]
-        temp = cv2.resize(img, (w // 10, h // 10), interpolation=cv2.INTER_LINEAR)
-        return cv2.resize(temp, (w, h), interpolation=cv2.INTER_NEAREST)
-
-    else:
-        # Si el filtro no se reconoce, se devuelve la imagen sin modificar
-        return img
+    for tipo, *etapa in fusionar_pasos(pasos_cadena(filtro, params)):
+        if tipo == "afin" and len(etapa[1]) > 1:
+            # Pasos por píxel fusionados: una sola pasada sobre el bloque
+            img = cv2.transform(img, etapa[0].astype(np.float32))
+            continue
+        nombre, params_paso = (etapa[1][0], {}) if tipo == "afin" else etapa
+        spec = FILTROS.get(nombre)
+        if spec is None:
+            # Si el filtro no se reconoce, el paso deja la imagen sin modificar
+            continue
+        # Cada paso lee el halo que necesita del bloque completo: el halo de
+        # la cadena es la suma de los halos y se recorta una sola vez al final
+        img = spec["kernel"](img, params_paso or {}, origen)
+    return img
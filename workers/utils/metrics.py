@@ -0,0 +1,244 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: metrics.py
+DESCRIPCIÓN: Métricas de rendimiento por etapa de DisPix en formato de texto
+             de Prometheus (endpoint /metrics), sin dependencias externas.
+             Cada etapa del camino de un bloque (recorte, codificación,
+             publicación, espera en cola, decodificación, filtro, subida,
+             decodificación en el máster y reconstrucción) se registra en
+             el histograma 'dispix_stage_seconds' con las etiquetas stage,
+             filter y block (lado aproximado del bloque en píxeles, potencia
+             de 2), para ubicar el cuello de botella por filtro y tamaño.
+             La codificación de cada bloque se registra además por códec
+             elegido (ver el códec "auto" de block_codec.py), para comparar
+             la CPU gastada con los bytes ahorrados: 'dispix_codec_seconds'
+             y 'dispix_codec_ratio' (bytes del mensaje / bytes de píxeles).
+             Con varios procesos (máster bajo gunicorn), cada uno vuelca
+             periódicamente sus incrementos en un hash de Redis y /metrics
+             expone la suma.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: bisect, json, math, os, threading, time, contextlib, http.server
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Existe una copia idéntica en workers/utils/metrics.py; ambas deben
+      mantenerse sincronizadas (igual que block_codec.py).
+------------------------------------------------------------------------------
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Límites superiores (segundos) de los buckets de los histogramas
+LIMITES = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Límites de la razón de compresión (bytes del mensaje / bytes de píxeles)
+LIMITES_RAZON = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0, 1.1)
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def clase_bloque(forma):
+    """Lado aproximado de un bloque (potencia de 2) para la etiqueta 'block'."""
+    pixeles = forma[0] * forma[1] if len(forma) > 1 else 0
+    if pixeles <= 0:
+        return "0"
+    return str(2 ** round(math.log2(math.sqrt(pixeles))))
+
+
+def escapar_etiqueta(valor):
+    """Valor de etiqueta escapado como exige el formato de texto (\\, \" y salto de línea)."""
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histograma:
+    """Histograma con etiquetas (conteos por bucket, suma y total)."""
+
+    def __init__(self, nombre, ayuda, etiquetas, limites=LIMITES):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        """Registra una observación; las etiquetas van en el orden declarado."""
+        i = bisect.bisect_left(self.limites, valor)
+        with self.lock:
+            serie = self.series.get(etiquetas)
+            if serie is None:
+                # Conteos por bucket (el último es +Inf), suma y total
+                serie = self.series[etiquetas] = [0] * (len(self.limites) + 1) + [0.0, 0]
+            serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def instantanea(self):
+        with self.lock:
+            return {k: list(v) for k, v in self.series.items()}
+
+
+class Registro:
+    """Conjunto de histogramas de un proceso."""
+
+    def __init__(self):
+        self.histogramas = {}
+        self.volcado = {}
+        self.lock = threading.Lock()
+        # Serializa los volcados (hilo periódico y peticiones a /metrics)
+        self.lock_volcado = threading.Lock()
+
+    def histograma(self, nombre, ayuda, etiquetas, limites=LIMITES):
+        with self.lock:
+            if nombre not in self.histogramas:
+                self.histogramas[nombre] = Histograma(nombre, ayuda, etiquetas, limites)
+            return self.histogramas[nombre]
+
+    def instantanea(self):
+        """{nombre: {etiquetas: serie}} de todos los histogramas."""
+        return {n: h.instantanea() for n, h in self.histogramas.items()}
+
+    def exponer(self, datos=None):
+        """
+        Texto en formato de exposición de Prometheus. `datos` permite exponer
+        una instantánea ajena (p. ej. la suma de varios procesos en Redis).
+        """
+        datos = self.instantanea() if datos is None else datos
+        lineas = []
+        for nombre, h in self.histogramas.items():
+            lineas.append(f"# HELP {nombre} {h.ayuda}")
+            lineas.append(f"# TYPE {nombre} histogram")
+            for etiquetas, serie in sorted(datos.get(nombre, {}).items()):
+                base = ",".join(f'{k}="{escapar_etiqueta(v)}"' for k, v in zip(h.etiquetas, etiquetas))
+                acumulado = 0
+                for limite, conteo in zip(h.limites + ("+Inf",), serie):
+                    acumulado += conteo
+                    lineas.append(f'{nombre}_bucket{{{base},le="{limite}"}} {acumulado}')
+                lineas.append(f"{nombre}_sum{{{base}}} {serie[-2]}")
+                lineas.append(f"{nombre}_count{{{base}}} {serie[-1]}")
+        return "\n".join(lineas) + "\n"
+
+    def volcar_redis(self, r, clave):
+        """Suma en el hash `clave` de Redis lo observado desde el último volcado."""
+        with self.lock_volcado:
+            actual = self.instantanea()
+            pipe = r.pipeline()
+            cambios = 0
+            for nombre, series in actual.items():
+                anteriores = self.volcado.get(nombre, {})
+                for etiquetas, serie in series.items():
+                    previa = anteriores.get(etiquetas)
+                    campo = json.dumps([nombre, list(etiquetas)])
+                    for i, valor in enumerate(serie):
+                        delta = valor - (previa[i] if previa else 0)
+                        if delta:
+                            pipe.hincrbyfloat(clave, f"{campo}|{i}", delta)
+                            cambios += 1
+            if cambios:
+                pipe.execute()
+            self.volcado = actual
+
+    def leer_redis(self, r, clave):
+        """Instantánea sumada de todos los procesos que vuelcan en `clave`."""
+        datos = {}
+        for campo, valor in r.hgetall(clave).items():
+            serie_id, i = campo.decode().rsplit("|", 1)
+            nombre, etiquetas = json.loads(serie_id)
+            h = self.histogramas.get(nombre)
+            if h is None:
+                continue
+            serie = datos.setdefault(nombre, {}).setdefault(
+                tuple(etiquetas), [0] * (len(h.limites) + 1) + [0.0, 0])
+            valor = float(valor)
+            serie[int(i)] = valor if int(i) == len(serie) - 2 else int(valor)
+        return datos
+
+    def volcar_periodicamente(self, r, clave, intervalo=5.0):
+        """Hilo que vuelca los incrementos en Redis cada `intervalo` segundos."""
+        def bucle():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    self.volcar_redis(r, clave)
+                except Exception as e:
+                    print(f"⚠️ No se pudieron volcar las métricas: {e}")
+
+        threading.Thread(target=bucle, daemon=True).start()
+
+
+# Registro del proceso y histograma de etapas del camino de un bloque
+REGISTRO = Registro()
+ETAPAS = REGISTRO.histograma(
+    "dispix_stage_seconds",
+    "Duración de cada etapa del procesamiento de un bloque",
+    ("stage", "filter", "block"),
+)
+
+
+CODIFICACION = REGISTRO.histograma(
+    "dispix_codec_seconds",
+    "Tiempo de codificación de cada bloque según el códec elegido",
+    ("codec", "block"),
+)
+RAZON = REGISTRO.histograma(
+    "dispix_codec_ratio",
+    "Bytes del mensaje codificado por byte de píxeles según el códec elegido",
+    ("codec", "block"),
+    LIMITES_RAZON,
+)
+
+
+def observar(etapa, segundos, filtro, bloque):
+    """Registra la duración de una etapa (bloque = clase_bloque(forma))."""
+    ETAPAS.observar(max(segundos, 0.0), etapa, filtro, bloque)
+
+
+def observar_codec(codec, segundos, crudos, codificados, bloque):
+    """Registra el costo (segundos) y la razón de compresión de un bloque codificado."""
+    CODIFICACION.observar(max(segundos, 0.0), codec, bloque)
+    RAZON.observar(codificados / crudos if crudos else 1.0, codec, bloque)
+
+
+@contextmanager
+def medir(etapa, filtro, bloque):
+    """Contexto que registra la duración del bloque `with` como una etapa."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(etapa, time.perf_counter() - inicio, filtro, bloque)
+
+
+def servir_metricas(puerto, registro=REGISTRO, host="0.0.0.0"):
+    """Servidor HTTP mínimo en un hilo que responde /metrics (para los workers)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = registro.exponer().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", TIPO_CONTENIDO)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), Handler)
+    servidor.daemon_threads = True
+    # Los procesos hijos (p. ej. el pool del worker) no deben heredar el
+    # socket de escucha: retendrían el puerto sin atenderlo
+    os.register_at_fork(after_in_child=servidor.socket.close)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
@@ -0,0 +1,172 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: pipeline.py
+DESCRIPCIÓN: Supervisor del worker DisPix. Reparte los bloques recibidos en
+             un pool persistente de procesos (uno por núcleo por defecto) y
+             entrega los resultados al subidor por lotes
+             (utils/result_uploader.py), de modo que la lectura de Redis, la
+             etapa de CPU (decodificar, filtrar, codificar) y la subida al
+             máster se solapan:
+
+                 Redis --lote--> [supervisor] --> pool de procesos
+                                                    (decod. + filtro + cod.)
+                                                          |
+                 XACK <-- subidor (POST /results/batch) <-+
+
+             Un semáforo limita los bloques en vuelo para no acumular
+             memoria cuando el máster o la red son más lentos que la CPU.
+             Ese límite (capacidad) y los bloques en vuelo se publican en el
+             registro de workers (utils/worker_registry.py) para que el
+             máster no envíe más de lo que el worker admite.
+             Las duraciones de las etapas que devuelve el pool (clave
+             'tiempos' de la petición) se completan con la de la subida y se
+             entregan a al_medir en el proceso principal.
+             Un mensaje de Redis puede traer varios bloques (paquete): cada
+             bloque se procesa por separado y el mensaje se confirma cuando
+             se entregaron todos (TokenPaquete).
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: concurrent.futures, threading, time, logging
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por subscriber_redis.py; también por benchmarks/ para medir
+      el rendimiento del worker sin Redis.
+------------------------------------------------------------------------------
+"""
+
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("subscriber_logger")
+
+
+class TokenPaquete:
+    """
+    Token compartido por los bloques de un mismo mensaje: el token original
+    se confirma una sola vez, cuando se entregó el último de sus bloques.
+    """
+
+    def __init__(self, token, partes):
+        self.token = token
+        self.pendientes = partes
+        self.lock = threading.Lock()
+
+    def entregar(self):
+        """Descuenta un bloque entregado; True si era el último."""
+        with self.lock:
+            self.pendientes -= 1
+            return self.pendientes == 0
+
+
+class Supervisor:
+    """
+    Encadena las etapas del worker sobre un pool de procesos y un subidor.
+
+    Args:
+        procesar (callable): Función de nivel de módulo (serializable) que
+                             recibe el mensaje crudo y devuelve la petición a
+                             subir, o None si el mensaje debe descartarse.
+        subidor: Objeto con agregar(peticion, al_terminar) y cerrar(), p. ej.
+                 ResultUploader; llama a al_terminar(True) cuando el máster
+                 aceptó el resultado.
+        concurrencia (int): Procesos del pool de CPU (por defecto, núcleos).
+        en_vuelo (int): Máximo de bloques entre la lectura y la confirmación
+                        (por defecto, 2 por proceso más un lote de subida,
+                        para que el subidor pueda completar sus lotes).
+        al_confirmar (callable): Se llama con el token del bloque cuando su
+                                 resultado fue entregado (p. ej. XACK); con
+                                 un TokenPaquete, cuando se entregaron todos
+                                 los bloques del mensaje.
+        al_medir (callable): Recibe los 'tiempos' de cada bloque entregado,
+                             con la etapa 'upload' agregada (p. ej. para
+                             registrarlos en utils/metrics.py).
+        inicializador (callable): Se ejecuta al arrancar cada proceso del
+                                  pool (p. ej. para configurar su caché).
+        init_args (tuple): Argumentos del inicializador.
+    """
+
+    def __init__(self, procesar, subidor, concurrencia=None, en_vuelo=None, al_confirmar=None,
+                 al_medir=None, inicializador=None, init_args=()):
+        self.concurrencia = concurrencia or os.cpu_count() or 1
+        self.procesar = procesar
+        self.subidor = subidor
+        self.al_confirmar = al_confirmar
+        self.al_medir = al_medir
+        self.pool = ProcessPoolExecutor(max_workers=self.concurrencia,
+                                        initializer=inicializador, initargs=init_args)
+        self.capacidad = en_vuelo or self.concurrencia * 2 + getattr(subidor, "max_bloques", 0)
+        self.cupos = threading.BoundedSemaphore(self.capacidad)
+        self.ocupados = 0
+        self.lock = threading.Lock()
+
+    @property
+    def en_vuelo(self):
+        """Bloques entre la lectura y la confirmación (para el registro de workers)."""
+        return self.ocupados
+
+    def enviar(self, raw, token=None):
+        """
+        Encola un mensaje para su procesamiento. Bloquea si ya hay demasiados
+        bloques en vuelo (contrapresión hacia la lectura de Redis).
+        """
+        self.cupos.acquire()
+        with self.lock:
+            self.ocupados += 1
+        try:
+            futuro = self.pool.submit(self.procesar, raw)
+        except Exception:
+            self._liberar()
+            raise
+        futuro.add_done_callback(lambda f: self._subir(f, token))
+
+    def enviar_lote(self, lote):
+        """Encola una lista de pares (mensaje, token)."""
+        for raw, token in lote:
+            self.enviar(raw, token)
+
+    def _subir(self, futuro, token):
+        try:
+            peticion = futuro.result()
+        except Exception as e:
+            # El bloque no se confirma: en modo cola otro worker lo reclamará
+            logger.error(f"❌ Error en el pipeline del worker: {e}")
+            self._liberar()
+            return
+
+        if peticion is None:
+            # Mensaje inválido: se confirma para no reintentarlo
+            self._terminar(True, token)
+        else:
+            tiempos = peticion.pop("tiempos", None)
+            entrega = time.perf_counter()
+            self.subidor.agregar(peticion, lambda ok: self._terminar(ok, token, tiempos, entrega))
+
+    def _terminar(self, entregado, token, tiempos=None, entrega=None):
+        try:
+            if isinstance(token, TokenPaquete):
+                # Un bloque sin entregar deja el mensaje sin confirmar: en
+                # modo cola se reclama entero y el máster descarta repetidos
+                token = token.token if entregado and token.entregar() else None
+            if entregado and token is not None and self.al_confirmar:
+                self.al_confirmar(token)
+            if entregado and tiempos is not None and self.al_medir:
+                tiempos["stages"]["upload"] = time.perf_counter() - entrega
+                self.al_medir(tiempos)
+        except Exception as e:
+            logger.error(f"❌ Error confirmando bloque: {e}")
+        finally:
+            self._liberar()
+
+    def _liberar(self):
+        with self.lock:
+            self.ocupados -= 1
+        self.cupos.release()
+
+    def cerrar(self):
+        """Espera a que terminen los bloques en vuelo y libera los pools."""
+        self.pool.shutdown(wait=True)
+        self.subidor.cerrar()
@@ -0,0 +1,170 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: result_cache.py
+DESCRIPCIÓN: Caché direccionada por contenido de los resultados de DisPix.
+             La clave de un bloque es un hash (BLAKE2b) de sus píxeles (con
+             halo), su forma, el filtro y sus parámetros; los filtros que
+             dependen de la posición (p. ej. pixelate) añaden además el
+             origen del bloque. Así, bloques idénticos (fondos planos o la
+             misma imagen procesada otra vez) se resuelven sin volver a
+             filtrarse.
+             Dos niveles:
+               - LRU en memoria del proceso, acotada en bytes.
+               - Opcional: Redis compartido (claves 'dispix-cache:<hash>' con
+                 TTL), para que máster y workers reaprovechen resultados
+                 entre procesos y máquinas.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, hashlib, json, os, threading, collections, redis (opcional),
+              utils.block_codec
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Existe una copia idéntica en workers/utils/result_cache.py; ambas deben
+      mantenerse sincronizadas (igual que block_codec.py) para que las claves
+      coincidan en el nivel compartido de Redis.
+------------------------------------------------------------------------------
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.block_codec import codificar_bloque, decodificar_bloque, codec_por_defecto
+
+# Memoria del nivel local (MiB), nivel Redis (1 = activo) y TTL en Redis
+CACHE_MB = int(os.environ.get("DISPIX_CACHE_MB", 256))
+CACHE_REDIS = os.environ.get("DISPIX_CACHE_REDIS", "0") == "1"
+CACHE_TTL = int(os.environ.get("DISPIX_CACHE_TTL", 3600))
+
+PREFIJO_REDIS = "dispix-cache:"
+
+
+def clave_bloque(bloque, filtro, params=None, halo=None, origen=None):
+    """
+    Clave de contenido de un bloque de entrada. Máster y workers la calculan
+    igual, así que comparten entradas en el nivel Redis.
+
+    Args:
+        bloque (np.ndarray): Píxeles de entrada (con halo).
+        filtro (str): Nombre del filtro.
+        params (dict): Parámetros efectivos del filtro.
+        halo (list): Halo [arriba, izquierda, abajo, derecha] del bloque.
+        origen (list): Posición del bloque en la imagen; solo para filtros
+                       cuyo resultado depende de ella (None en los demás).
+
+    Returns:
+        str: Hash hexadecimal de 32 caracteres.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    descripcion = [filtro, params or {}, list(halo or [0, 0, 0, 0]),
+                   list(origen) if origen is not None else None,
+                   list(bloque.shape), str(bloque.dtype)]
+    h.update(json.dumps(descripcion, sort_keys=True).encode("utf-8"))
+    h.update(np.ascontiguousarray(bloque).data)
+    return h.hexdigest()
+
+
+def clave_archivo(datos, filtro, params=None):
+    """
+    Clave de una imagen completa a partir de los bytes del archivo subido
+    (o de un iterable de trozos, para no leer archivos grandes enteros).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([filtro, params or {}], sort_keys=True).encode("utf-8"))
+    for trozo in ([datos] if isinstance(datos, (bytes, bytearray, memoryview)) else datos):
+        h.update(trozo)
+    return h.hexdigest()
+
+
+def serializar_bloque(img):
+    """Bloque -> bytes para el nivel Redis (formato binario de block_codec)."""
+    return codificar_bloque(img, {}, codec_por_defecto())
+
+
+def deserializar_bloque(data):
+    """Bytes del nivel Redis -> bloque (copia escribible)."""
+    return np.array(decodificar_bloque(data)[0])
+
+
+class CacheResultados:
+    """
+    Caché LRU acotada en bytes con un nivel compartido opcional en Redis.
+
+    Args:
+        max_bytes (int): Memoria máxima del nivel local (0 lo desactiva).
+        redis_cliente: Conexión Redis para el nivel compartido (opcional).
+        ttl (int): Segundos de vida de las entradas en Redis.
+        serializar (callable): Valor -> bytes para Redis.
+        deserializar (callable): Bytes de Redis -> valor.
+    """
+
+    def __init__(self, max_bytes, redis_cliente=None, ttl=3600,
+                 serializar=serializar_bloque, deserializar=deserializar_bloque):
+        self.max_bytes = max_bytes
+        self.redis = redis_cliente
+        self.ttl = ttl
+        self.serializar = serializar
+        self.deserializar = deserializar
+        self.entradas = OrderedDict()
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.lock = threading.Lock()
+
+    @property
+    def activa(self):
+        return self.max_bytes > 0 or self.redis is not None
+
+    def obtener(self, clave):
+        """Devuelve el valor cacheado o None."""
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is not None:
+                self.entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[0]
+
+        valor = None
+        if self.redis is not None:
+            try:
+                data = self.redis.get(PREFIJO_REDIS + clave)
+                valor = self.deserializar(data) if data is not None else None
+            except Exception as e:
+                # El nivel compartido es opcional: un fallo equivale a no acertar
+                print(f"⚠️ Caché Redis no disponible: {e}")
+
+        with self.lock:
+            if valor is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+        self._guardar_local(clave, valor)
+        return valor
+
+    def guardar(self, clave, valor):
+        """Guarda un resultado en ambos niveles."""
+        self._guardar_local(clave, valor)
+        if self.redis is not None:
+            try:
+                self.redis.set(PREFIJO_REDIS + clave, self.serializar(valor), ex=self.ttl)
+            except Exception as e:
+                print(f"⚠️ Caché Redis no disponible: {e}")
+
+    def _guardar_local(self, clave, valor):
+        tam = getattr(valor, "nbytes", None) or len(valor)
+        if tam > self.max_bytes:
+            return
+        with self.lock:
+            anterior = self.entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self.entradas[clave] = (valor, tam)
+            self.bytes += tam
+            while self.bytes > self.max_bytes:
+                _, (_, tam_viejo) = self.entradas.popitem(last=False)
+                self.bytes -= tam_viejo
@@ -0,0 +1,163 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: result_uploader.py
+DESCRIPCIÓN: Subida de resultados del worker DisPix hacia el máster. Mantiene
+             un pool de conexiones HTTP persistentes (keep-alive) mediante
+             requests.Session y agrupa varios bloques terminados en un solo
+             POST al endpoint /results/batch.
+             Un lote se envía cuando alcanza `max_bloques` o `max_bytes`
+             (por tamaño), o cuando su primer bloque lleva `max_espera`
+             segundos esperando (por tiempo), de modo que la latencia queda
+             acotada aunque lleguen pocos bloques.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: requests, threading, queue, logging, utils.block_codec
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Utilizado por el supervisor del worker (utils/pipeline.py).
+------------------------------------------------------------------------------
+"""
+
+import time
+import queue
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.block_codec import empaquetar_lote
+
+logger = logging.getLogger("subscriber_logger")
+
+
+def url_lote(master_url):
+    """Deriva la URL de /results/batch a partir de la de /result."""
+    base = master_url.rstrip("/")
+    if base.endswith("/result"):
+        base = base[:-len("/result")]
+    return base + "/results/batch"
+
+
+class ResultUploader:
+    """
+    Cola de subida con hilos emisores que agrupan resultados por lotes.
+
+    Args:
+        master_url (str): Endpoint /result del máster.
+        hilos (int): Hilos emisores (cada uno arma y envía sus lotes).
+        max_bloques (int): Bloques por lote como máximo.
+        max_bytes (int): Bytes por lote como máximo.
+        max_espera (float): Segundos que puede esperar un bloque a que se
+                            complete su lote antes de enviarse.
+        reintentos (int): Reintentos de un lote ante errores de red o 5xx.
+    """
+
+    def __init__(self, master_url, hilos=2, max_bloques=32, max_bytes=8 * 1024 * 1024,
+                 max_espera=0.02, reintentos=2):
+        self.master_url = master_url
+        self.batch_url = url_lote(master_url)
+        self.max_bloques = max_bloques
+        self.max_bytes = max_bytes
+        self.max_espera = max_espera
+        self.reintentos = reintentos
+
+        # Pool de conexiones persistentes compartido por los hilos emisores
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=hilos)
+        self.session.mount("http://", adaptador)
+        self.session.mount("https://", adaptador)
+
+        self.cola = queue.Queue()
+        self.hilos = [threading.Thread(target=self._emitir, daemon=True) for _ in range(hilos)]
+        for hilo in self.hilos:
+            hilo.start()
+
+    def agregar(self, peticion, al_terminar=None):
+        """
+        Encola un resultado para su envío.
+
+        Args:
+            peticion (dict): Argumentos de requests.post generados por el
+                             worker ('data' binario o 'json' heredado).
+            al_terminar (callable): Se llama con True/False cuando el máster
+                                    aceptó (o rechazó) el resultado.
+        """
+        self.cola.put((peticion, al_terminar))
+
+    def cerrar(self):
+        """Envía lo pendiente y detiene los hilos emisores."""
+        for _ in self.hilos:
+            self.cola.put(None)
+        for hilo in self.hilos:
+            hilo.join()
+        self.session.close()
+
+    # ------------------------------------------------------------------
+    # Hilos emisores
+    # ------------------------------------------------------------------
+
+    def _emitir(self):
+        while True:
+            item = self.cola.get()
+            if item is None:
+                return
+
+            # Formato heredado (JSON): no admite lotes, se envía tal cual
+            if "json" in item[0]:
+                self._terminar([item], self._post(self.master_url, json=item[0]["json"]))
+                continue
+
+            lote, total, fin = [item], len(item[0]["data"]), False
+            limite = time.monotonic() + self.max_espera
+            while len(lote) < self.max_bloques and total < self.max_bytes:
+                restante = limite - time.monotonic()
+                try:
+                    siguiente = self.cola.get(timeout=restante) if restante > 0 else self.cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    fin = True
+                    break
+                if "json" in siguiente[0]:
+                    self._terminar([siguiente], self._post(self.master_url, json=siguiente[0]["json"]))
+                    continue
+                lote.append(siguiente)
+                total += len(siguiente[0]["data"])
+
+            cuerpo = empaquetar_lote([p["data"] for p, _ in lote])
+            ok = self._post(self.batch_url, data=cuerpo,
+                            headers={"Content-Type": "application/octet-stream"})
+            self._terminar(lote, ok)
+
+            if fin:
+                return
+
+    def _post(self, url, **kwargs):
+        """POST con reintentos. Devuelve True si el máster aceptó el envío."""
+        for intento in range(self.reintentos + 1):
+            try:
+                response = self.session.post(url, timeout=30, **kwargs)
+            except requests.RequestException as e:
+                logger.error(f"❌ Error de conexión con el servidor Flask: {e}")
+            else:
+                if response.status_code == 200:
+                    # Un mensaje por lote: solo en DEBUG (el resumen periódico
+                    # del worker ya informa los bloques entregados)
+                    logger.debug("✅ Resultados enviados al servidor Flask: %s", response.text)
+                    return True
+                logger.warning(f"⚠️ Error al enviar al servidor Flask: {response.status_code}")
+                # 404: la tarea ya no existe en el máster, no vale la pena reintentar
+                if response.status_code == 404:
+                    return True
+                if response.status_code < 500:
+                    return False
+            time.sleep(0.2 * (2 ** intento))
+        return False
+
+    @staticmethod
+    def _terminar(lote, ok):
+        for _, al_terminar in lote:
+            if al_terminar:
+                al_terminar(ok)
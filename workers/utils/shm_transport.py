@@ -0,0 +1,79 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: shm_transport.py
+DESCRIPCIÓN: Lado del worker del transporte local por memoria compartida de
+             DisPix. Los mensajes con el campo 'shm' no traen píxeles: traen
+             el nombre del segmento con la imagen de entrada, el del lienzo
+             de salida y las coordenadas del bloque. El worker lee el bloque
+             (con su halo) del segmento de entrada y escribe el resultado
+             directamente en el lienzo compartido del máster.
+             Los segmentos adjuntados se reutilizan entre bloques de la misma
+             tarea y se cierran cuando dejan de usarse (se conservan los
+             MAX_SEGMENTOS más recientes).
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: numpy, multiprocessing.shared_memory, multiprocessing.resource_tracker
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Solo sirve si el worker corre en la misma máquina que el máster; la
+      contraparte está en master/utils/shm_transport.py.
+------------------------------------------------------------------------------
+"""
+
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# Segmentos adjuntados que cada proceso mantiene abiertos
+MAX_SEGMENTOS = 8
+
+_segmentos = OrderedDict()
+
+
+def _adjuntar(nombre, forma):
+    """Abre (o reutiliza) un segmento creado por el máster como arreglo uint8."""
+    if nombre in _segmentos:
+        _segmentos.move_to_end(nombre)
+        return _segmentos[nombre][1]
+
+    segmento = shared_memory.SharedMemory(name=nombre)
+    # El segmento pertenece al máster: el resource_tracker de este proceso
+    # no debe eliminarlo cuando el worker termine
+    try:
+        resource_tracker.unregister(segmento._name, "shared_memory")
+    except Exception:
+        pass
+
+    arreglo = np.ndarray(forma, dtype=np.uint8, buffer=segmento.buf)
+    _segmentos[nombre] = (segmento, arreglo)
+    while len(_segmentos) > MAX_SEGMENTOS:
+        _, (viejo, _) = _segmentos.popitem(last=False)
+        try:
+            viejo.close()
+        except BufferError:
+            pass
+    return arreglo
+
+
+def leer_bloque(meta):
+    """
+    Devuelve la vista del bloque con halo dentro del segmento de entrada.
+
+    Args:
+        meta (dict): Metadatos del mensaje ('shm', 'rect', 'halo', 'origin').
+    """
+    shm = meta["shm"]
+    entrada = _adjuntar(shm["input"], tuple(shm["shape"]))
+    y0, y1, x0, x1 = meta["rect"]
+    arriba, izquierda, abajo, derecha = meta.get("halo", (0, 0, 0, 0))
+    return entrada[y0 - arriba:y1 + abajo, x0 - izquierda:x1 + derecha]
+
+
+def escribir_bloque(meta, bloque):
+    """Escribe el bloque filtrado (sin halo) en su posición del lienzo compartido."""
+    shm = meta["shm"]
+    salida = _adjuntar(shm["output"], tuple(shm["shape"]))
+    y0, y1, x0, x1 = meta["rect"]
+    salida[y0:y1, x0:x1] = bloque
@@ -0,0 +1,150 @@
+"""
+------------------------------------------------------------------------------
+ARCHIVO: worker_registry.py
+DESCRIPCIÓN: Registro de workers vivos de DisPix en Redis, por latidos.
+             Cada worker publica cada INTERVALO_LATIDO segundos (Latido, en
+             un hilo propio) su estado en la clave 'dispix-worker:<nombre>',
+             que Redis vence a los VIDA_LATIDO segundos si el worker deja de
+             latir (así no influyen los relojes de cada máquina), y se anota
+             en el índice 'dispix-workers:registry'.
+             El estado incluye los procesos del pool (cores), los bloques
+             que admite en vuelo (capacity), los que tiene ahora entre la
+             lectura y la confirmación (queue) y, por filtro, los bloques
+             procesados, el ritmo del último intervalo y el tiempo medio de
+             filtrado.
+             El máster lee el registro con leer_workers para saber cuántos
+             workers hay y cuánto trabajo admiten.
+AUTOR: Alejandro Castro Martínez
+FECHA DE CREACIÓN: 2026-10-18
+ÚLTIMA MODIFICACIÓN: 2026-10-18
+DEPENDENCIAS: json, os, socket, threading, time, redis
+CONTEXTO:
+    - Proyecto DisPix: sistema distribuido de procesamiento de imágenes.
+    - Existe una copia idéntica en master/utils/worker_registry.py; ambas
+      deben mantenerse sincronizadas (igual que block_codec.py).
+    - Workers: subscriber_redis.py (Latido). Máster: utils/redis_publisher.py
+      (estado_cluster), el planificador de envíos y /cluster.
+------------------------------------------------------------------------------
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+import redis
+
+# Segundos entre dos latidos de un worker
+INTERVALO_LATIDO = float(os.environ.get("DISPIX_HEARTBEAT_SECS", 2.0))
+# Segundos sin latir tras los que un worker se da por caído
+VIDA_LATIDO = float(os.environ.get("DISPIX_HEARTBEAT_TTL", 3 * INTERVALO_LATIDO))
+
+PREFIJO_WORKER = "dispix-worker:"
+INDICE_WORKERS = "dispix-workers:registry"
+
+
+class Latido:
+    """
+    Publica periódicamente el estado de un worker en el registro.
+
+    Args:
+        conexion (redis.Redis): Conexión a Redis.
+        nombre (str): Identificador del worker (p. ej. el nombre de consumidor).
+        datos (dict): Campos fijos del worker (dispatch, cores, capacity...).
+        en_cola (callable): Devuelve los bloques que el worker tiene en vuelo.
+        intervalo (float): Segundos entre latidos.
+    """
+
+    def __init__(self, conexion, nombre, datos, en_cola=None, intervalo=INTERVALO_LATIDO):
+        self.conexion = conexion
+        self.nombre = nombre
+        self.datos = {"name": nombre, "host": socket.gethostname(), "pid": os.getpid(),
+                      "started": round(time.time(), 3), **datos}
+        self.en_cola = en_cola
+        self.intervalo = intervalo
+        # filtro -> [bloques, segundos de filtrado, bloques filtrados]
+        self.filtros = {}
+        self.ultimo = ({}, time.time())
+        self.lock = threading.Lock()
+        self.parar = threading.Event()
+        self.hilo = threading.Thread(target=self._bucle, daemon=True)
+
+    def contar(self, filtro, segundos=None):
+        """Cuenta un bloque procesado de `filtro` (segundos: tiempo de filtrado, si lo hubo)."""
+        with self.lock:
+            conteo = self.filtros.setdefault(filtro, [0, 0.0, 0])
+            conteo[0] += 1
+            if segundos is not None:
+                conteo[1] += segundos
+                conteo[2] += 1
+
+    def estado(self):
+        """Estado actual del worker, tal como se publica en el registro."""
+        ahora = time.time()
+        with self.lock:
+            filtros = {f: list(c) for f, c in self.filtros.items()}
+        anteriores, desde = self.ultimo
+        self.ultimo = ({f: c[0] for f, c in filtros.items()}, ahora)
+        transcurrido = max(ahora - desde, 1e-6)
+        return {
+            **self.datos,
+            "queue": self.en_cola() if self.en_cola is not None else 0,
+            "processed": sum(c[0] for c in filtros.values()),
+            "filters": {
+                f: {"blocks": bloques,
+                    "per_sec": round((bloques - anteriores.get(f, 0)) / transcurrido, 2),
+                    "filter_ms": round(1000 * segundos / filtrados, 3) if filtrados else None}
+                for f, (bloques, segundos, filtrados) in filtros.items()
+            },
+            "seen": round(ahora, 3),
+        }
+
+    def latir(self):
+        """Publica un latido: estado con vencimiento y nombre en el índice."""
+        with self.conexion.pipeline(transaction=False) as pipe:
+            pipe.set(PREFIJO_WORKER + self.nombre, json.dumps(self.estado()), px=int(VIDA_LATIDO * 1000))
+            pipe.sadd(INDICE_WORKERS, self.nombre)
+            pipe.execute()
+
+    def iniciar(self):
+        self.latir()
+        self.hilo.start()
+        return self
+
+    def detener(self):
+        """Deja de latir y se quita del registro (salida ordenada)."""
+        self.parar.set()
+        try:
+            with self.conexion.pipeline(transaction=False) as pipe:
+                pipe.delete(PREFIJO_WORKER + self.nombre)
+                pipe.srem(INDICE_WORKERS, self.nombre)
+                pipe.execute()
+        except redis.exceptions.RedisError:
+            pass
+
+    def _bucle(self):
+        while not self.parar.wait(self.intervalo):
+            try:
+                self.latir()
+            except redis.exceptions.RedisError as e:
+                # Sin Redis el worker tampoco recibe bloques: se reintenta en el próximo latido
+                print(f"⚠️ No se pudo registrar el latido: {e}")
+
+
+def leer_workers(conexion):
+    """
+    Workers cuyo último latido sigue vigente, con el estado que publicaron.
+    Quita del índice a los que dejaron de latir (su clave ya venció).
+
+    Returns:
+        list[dict]: Estados de los workers vivos, ordenados por nombre.
+    """
+    nombres = [n.decode() for n in conexion.smembers(INDICE_WORKERS)]
+    if not nombres:
+        return []
+    estados = conexion.mget([PREFIJO_WORKER + n for n in nombres])
+    caidos = [n for n, e in zip(nombres, estados) if e is None]
+    if caidos:
+        conexion.srem(INDICE_WORKERS, *caidos)
+    return sorted((json.loads(e) for e in estados if e is not None), key=lambda w: w["name"])